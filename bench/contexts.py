@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# Measure the per-call cost of allocating a compression context.
+#
+# Compares three ways of compressing many small messages:
+#
+#   fresh      a new Compressor for every call, which is what the
+#              one-shot ZSTD_compress() used to do internally
+#   module     zstd.compress(), which uses a per-thread cached context
+#   reused     one Compressor object, reused for every call
+#
+# Usage: python bench/contexts.py [--level N] [--repeat N]
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import zstd
+
+SIZES = [64, 256, 1024, 4096, 16384, 65536]
+
+
+def make_payload(size):
+    # Moderately compressible: repeated text with some variation.
+    words = (b"alpha", b"bravo", b"charlie", b"delta", b"echo",
+             b"foxtrot", b"golf", b"hotel", b"india", b"juliet")
+    out = []
+    n = 0
+    i = 0
+    while n < size:
+        w = words[(i * 7 + i // 3) % len(words)]
+        out.append(w)
+        n += len(w) + 1
+        i += 1
+    return b" ".join(out)[:size]
+
+
+def per_call_ns(fn, number, repeat):
+    best = min(timeit.repeat(fn, number=number, repeat=repeat))
+    return best / number * 1e9
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--level", type=int, default=zstd.CLEVEL_DEFAULT)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    level = args.level
+    reused = zstd.Compressor(level)
+
+    print("libzstd %s, level %d" % (zstd.library_version(), level))
+    print("%8s %12s %12s %12s %8s" %
+          ("size", "fresh ns", "module ns", "reused ns", "speedup"))
+    for size in SIZES:
+        data = make_payload(size)
+        number = max(100, 2000000 // (size + 512))
+
+        fresh = per_call_ns(lambda: zstd.Compressor(level).compress(data),
+                            number, args.repeat)
+        module = per_call_ns(lambda: zstd.compress(data, level),
+                             number, args.repeat)
+        again = per_call_ns(lambda: reused.compress(data),
+                            number, args.repeat)
+        print("%8d %12.0f %12.0f %12.0f %7.2fx" %
+              (size, fresh, module, again, fresh / module))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#! /usr/bin/env python
+# Benchmark suite, for catching performance regressions between
+# releases.
+#
+# For every combination of corpus, payload size, compression level and
+# thread count, measures:
+#
+#   compress MB/s      uncompressed bytes per second, zstd.compress()
+#   decompress MB/s    uncompressed bytes per second, zstd.decompress()
+#   ratio              uncompressed size / compressed size
+#   ns/call            time per call, which for small payloads is
+#                      mostly per-call overhead
+#   peak memory        highest Python heap use during one compress and
+#                      decompress (tracemalloc), and, with --isolate,
+#                      the peak RSS of a process that ran only that case
+#
+# The corpora are synthetic and reproducible: text, json, random and
+# repetitive.  Payloads larger than 16 MiB repeat a 16 MiB block, which
+# only the largest windows (levels 20 and up) can see across.
+#
+# Usage: python bench/suite.py [--levels 1,3,9-12|all] [--sizes 64,1K,1M]
+#            [--corpora text,json] [--threads 0,4] [--min-time S]
+#            [--isolate] [--json FILE] [--compare BASELINE.json]
+#
+# --json writes the results as JSON.  --compare reads the results of an
+# earlier run, prints the change in speed for each case both runs
+# measured, and exits with status 1 if any got slower by more than
+# --tolerance percent.
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import zstd
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+CORPORA = ["text", "json", "random", "repetitive"]
+DEFAULT_SIZES = "64,1K,64K,1M,16M"
+ALL_SIZES = "64,1K,64K,1M,16M,256M,1G"
+BLOCK_SIZE = 16 << 20
+
+UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(s):
+    s = s.strip().upper().rstrip("B")
+    if s and s[-1] in UNITS:
+        return int(s[:-1]) * UNITS[s[-1]]
+    return int(s)
+
+
+def format_size(n):
+    for unit in ("G", "M", "K"):
+        if n >= UNITS[unit] and n % UNITS[unit] == 0:
+            return "%d%s" % (n // UNITS[unit], unit)
+    return str(n)
+
+
+def parse_levels(s):
+    if s == "all":
+        return [l for l in range(zstd.CLEVEL_MIN, zstd.CLEVEL_MAX + 1)
+                if l != 0]
+    levels = []
+    for part in s.split(","):
+        # Allow negative levels: "-5--1" is the range -5 to -1.
+        lo, sep, hi = part[1:].partition("-")
+        if sep:
+            levels.extend(range(int(part[0] + lo), int(hi) + 1))
+        else:
+            levels.append(int(part))
+    return levels
+
+
+WORDS = ("the of and to in is that for it as was with be by on not he "
+         "this are or his from at which but have an they you were her "
+         "compression level window dictionary frame block stream buffer "
+         "python library release version thread context memory").split()
+
+
+def make_block(corpus, size, seed=1234):
+    rng = random.Random(seed)
+    if corpus == "random":
+        if hasattr(int, "to_bytes"):
+            return rng.getrandbits(size * 8).to_bytes(size, "little")
+        return bytes(bytearray(rng.getrandbits(8) for _ in range(size)))
+    out = []
+    n = 0
+    if corpus == "text":
+        while n < size:
+            line = " ".join(WORDS[rng.randrange(len(WORDS))]
+                            for _ in range(rng.randrange(4, 16)))
+            line = line.capitalize() + ".\n"
+            out.append(line)
+            n += len(line)
+    elif corpus == "json":
+        i = 0
+        while n < size:
+            doc = ('{"id": %d, "name": "%s", "tags": ["%s", "%s"], '
+                   '"score": %d, "active": %s}\n'
+                   % (i, WORDS[rng.randrange(len(WORDS))],
+                      WORDS[rng.randrange(len(WORDS))],
+                      WORDS[rng.randrange(len(WORDS))],
+                      rng.randrange(100000),
+                      ("true", "false")[rng.randrange(2)]))
+            out.append(doc)
+            n += len(doc)
+            i += 1
+    elif corpus == "repetitive":
+        # A few long runs and a short repeated record.
+        record = "2024-01-01T00:00:00Z INFO request served status=200\n"
+        while n < size:
+            k = rng.randrange(1, 64)
+            out.append(record * k)
+            out.append("x" * rng.randrange(1, 256))
+            n += len(record) * k
+    else:
+        raise ValueError("unknown corpus: %r" % (corpus,))
+    return "".join(out).encode("ascii")[:size]
+
+
+_blocks = {}
+
+
+def make_payload(corpus, size):
+    if corpus not in _blocks:
+        _blocks[corpus] = make_block(corpus, min(size, BLOCK_SIZE))
+    block = _blocks[corpus]
+    if len(block) < min(size, BLOCK_SIZE):
+        block = _blocks[corpus] = make_block(corpus, min(size, BLOCK_SIZE))
+    if size <= len(block):
+        return block[:size]
+    reps, rest = divmod(size, len(block))
+    return block * reps + block[:rest]
+
+
+def time_call(fn, min_time, repeat):
+    # Returns the best time per call, in seconds.
+    start = clock()
+    fn()
+    once = clock() - start
+    number = max(1, int(min_time / max(once, 1e-9)))
+    best = once
+    for _ in range(repeat):
+        start = clock()
+        for _ in range(number):
+            fn()
+        best = min(best, (clock() - start) / number)
+    return best
+
+
+def peak_python_memory(fn):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def max_rss():
+    # Peak resident set size of this process, in bytes.
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_case(corpus, size, level, threads, min_time, repeat):
+    data = make_payload(corpus, size)
+    cdata = zstd.compress(data, level, threads)
+    if zstd.decompress(cdata) != data:
+        raise AssertionError("round trip failed: %s %d %d"
+                             % (corpus, size, level))
+    # Short payloads need a longer run to measure anything at all.
+    ctime = time_call(lambda: zstd.compress(data, level, threads),
+                      min_time, repeat)
+    dtime = time_call(lambda: zstd.decompress(cdata), min_time, repeat)
+    py_peak = peak_python_memory(
+        lambda: zstd.decompress(zstd.compress(data, level, threads)))
+    return {
+        "corpus": corpus,
+        "size": size,
+        "level": level,
+        "threads": threads,
+        "compressed_size": len(cdata),
+        "ratio": float(size) / len(cdata),
+        "compress_mb_s": size / ctime / 1e6,
+        "decompress_mb_s": size / dtime / 1e6,
+        "compress_ns_call": ctime * 1e9,
+        "decompress_ns_call": dtime * 1e9,
+        "python_peak_bytes": py_peak,
+        "max_rss_bytes": None,
+    }
+
+
+def run_isolated(corpus, size, level, threads, min_time, repeat):
+    # Run one case in a fresh interpreter, so that its peak RSS is its
+    # own, and not the largest of every case run so far.
+    cmd = [sys.executable, os.path.abspath(__file__), "--case",
+           json.dumps([corpus, size, level, threads, min_time, repeat])]
+    out = subprocess.check_output(cmd)
+    return json.loads(out.decode("utf-8"))
+
+
+def case_key(r):
+    return (r["corpus"], r["size"], r["level"], r["threads"])
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = dict((case_key(r), r) for r in json.load(f)["results"])
+    regressions = 0
+    print()
+    print("%-10s %6s %5s %3s %12s %12s" %
+          ("corpus", "size", "level", "thr", "compress", "decompress"))
+    for r in results:
+        old = baseline.get(case_key(r))
+        if old is None:
+            continue
+        deltas = []
+        for field in ("compress_mb_s", "decompress_mb_s"):
+            change = (r[field] / old[field] - 1) * 100
+            if change < -tolerance:
+                regressions += 1
+            deltas.append(change)
+        print("%-10s %6s %5d %3d %+11.1f%% %+11.1f%%" %
+              (r["corpus"], format_size(r["size"]), r["level"],
+               r["threads"], deltas[0], deltas[1]))
+    if regressions:
+        print("\n%d measurement(s) slower than the baseline by more "
+              "than %g%%" % (regressions, tolerance))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--levels", default="all",
+                    help="comma-separated levels or ranges, or 'all'")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES,
+                    help="comma-separated payload sizes (default %s; "
+                    "up to %s is supported)" % (DEFAULT_SIZES, ALL_SIZES))
+    ap.add_argument("--corpora", default=",".join(CORPORA))
+    ap.add_argument("--threads", default="0",
+                    help="comma-separated compression thread counts")
+    ap.add_argument("--min-time", type=float, default=0.2,
+                    help="minimum seconds per timing run")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--isolate", action="store_true",
+                    help="run each case in its own process, to measure "
+                    "its peak RSS")
+    ap.add_argument("--json", metavar="FILE",
+                    help="write the results to FILE as JSON")
+    ap.add_argument("--compare", metavar="BASELINE",
+                    help="compare against the results in BASELINE")
+    ap.add_argument("--tolerance", type=float, default=10.0,
+                    help="percentage slowdown --compare allows")
+    ap.add_argument("--case", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.case:
+        result = run_case(*json.loads(args.case))
+        result["max_rss_bytes"] = max_rss()
+        print(json.dumps(result))
+        return 0
+
+    levels = parse_levels(args.levels)
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    corpora = args.corpora.split(",")
+    thread_counts = [int(t) for t in args.threads.split(",")]
+    run = run_isolated if args.isolate else run_case
+
+    print("libzstd %s, python-zstd %s, Python %s" %
+          (zstd.library_version(), zstd.VERSION, platform.python_version()))
+    print("%-10s %6s %5s %3s %7s %10s %10s %12s %12s %10s" %
+          ("corpus", "size", "level", "thr", "ratio", "comp MB/s",
+           "dec MB/s", "comp ns", "dec ns", "peak KiB"))
+    results = []
+    for corpus in corpora:
+        for size in sizes:
+            for level in levels:
+                for threads in thread_counts:
+                    r = run(corpus, size, level, threads,
+                            args.min_time, args.repeat)
+                    results.append(r)
+                    peak = r["max_rss_bytes"] or r["python_peak_bytes"]
+                    print("%-10s %6s %5d %3d %7.2f %10.1f %10.1f "
+                          "%12.0f %12.0f %10s" %
+                          (corpus, format_size(size), level, threads,
+                           r["ratio"], r["compress_mb_s"],
+                           r["decompress_mb_s"], r["compress_ns_call"],
+                           r["decompress_ns_call"],
+                           "-" if peak is None else peak // 1024))
+                    sys.stdout.flush()
+
+    if args.json:
+        meta = {
+            "python_zstd_version": zstd.VERSION,
+            "libzstd_version": zstd.library_version(),
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "min_time": args.min_time,
+            "repeat": args.repeat,
+            "isolate": args.isolate,
+        }
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1,
+                      sort_keys=True)
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+# Measure the per-call overhead of compressing and decompressing tiny
+# payloads, where argument parsing, buffer handling and releasing the
+# GIL cost more than the compression itself.
+#
+# Each case is timed in ns/call.  To compare two builds, run this with
+# --json in one and --compare in the other:
+#
+#   python bench/tiny.py --json before.json
+#   (rebuild)
+#   python bench/tiny.py --compare before.json
+#
+# Usage: python bench/tiny.py [--size N] [--level N] [--repeat N]
+#            [--json FILE] [--compare FILE]
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import zstd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from contexts import make_payload
+
+
+def cases(data, level):
+    cdata = zstd.compress(data, level)
+    c = zstd.Compressor(level)
+    d = zstd.Decompressor()
+    arr = bytearray(data)
+    return [
+        ("compress(bytes)", lambda: zstd.compress(data)),
+        ("compress(bytes, level)", lambda: zstd.compress(data, level)),
+        ("compress(bytes, level=)", lambda: zstd.compress(data, level=level)),
+        ("compress(bytearray)", lambda: zstd.compress(arr)),
+        ("Compressor.compress", lambda: c.compress(data)),
+        ("decompress(bytes)", lambda: zstd.decompress(cdata)),
+        ("Decompressor.decompress", lambda: d.decompress(cdata)),
+    ]
+
+
+def per_call_ns(fn, number, repeat):
+    best = min(timeit.repeat(fn, number=number, repeat=repeat))
+    return best / number * 1e9
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=100)
+    ap.add_argument("--level", type=int, default=1)
+    ap.add_argument("--number", type=int, default=200000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", metavar="FILE")
+    ap.add_argument("--compare", metavar="FILE")
+    args = ap.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    data = make_payload(args.size)
+    print("libzstd %s, %d-byte payload, level %d"
+          % (zstd.library_version(), args.size, args.level))
+    print("%-26s %10s %10s %8s" % ("case", "ns/call", "before", "change"))
+    results = {}
+    for name, fn in cases(data, args.level):
+        ns = per_call_ns(fn, args.number, args.repeat)
+        results[name] = ns
+        if name in baseline:
+            print("%-26s %10.0f %10.0f %+7.1f%%"
+                  % (name, ns, baseline[name],
+                     (ns / baseline[name] - 1) * 100))
+        else:
+            print("%-26s %10.0f" % (name, ns))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import os
+import re
 import shlex
 import sys
 import subprocess
@@ -138,12 +139,41 @@ if SUP_EXTERNAL:
     zstd_clean = cmd_clean
 
 else: # not SUP_EXTERNAL
+    # Enforce the version policy, so that a stale submodule checkout
+    # fails here rather than with a compile error, or worse, builds a
+    # package whose version misdescribes its libzstd.  Nothing can be
+    # checked if the submodule is not checked out at all.
+    try:
+        with open("libzstd/lib/zstd.h", "rt") as fp:
+            header = fp.read()
+    except (IOError, OSError):
+        header = None
+    if header is not None:
+        bundled = ".".join(
+            m.group(1) for m in
+            (re.search(r"#define\s+ZSTD_VERSION_%s\s+(\d+)" % part, header)
+             for part in ("MAJOR", "MINOR", "RELEASE"))
+            if m is not None)
+        if not PKG_VERSION_STR.startswith(bundled + "."):
+            sys.stderr.write(
+                "setup.py: error: bundled libzstd is version %s, but "
+                "package version is %s; update the libzstd submodule\n"
+                % (bundled, PKG_VERSION_STR))
+            sys.exit(1)
+
     ext_libraries.append("zstd")
     ext_library_dirs.append("libzstd/lib")
     ext_include_dirs.append("libzstd/lib")
+    # zdict.h lives here in libzstd 1.4.x; 1.5.0 moved it up to lib/.
+    ext_include_dirs.append("libzstd/lib/dictBuilder")
     if SUP_LEGACY:
         ext_defines.append(("ZSTD_LEGACY_SUPPORT", "1"))
 
+    # The bundled libzstd is built with multithreading support, which
+    # needs the system thread library.
+    if os.name == "posix":
+        ext_ldflags.append("-pthread")
+
     # Override build_ext.build_extensions to run 'make' in the libzstd
     # subdirectory first.
     class zstd_build_ext(cmd_build_ext):
@@ -167,10 +197,11 @@ else: # not SUP_EXTERNAL
             makecmd.extend([
                 "-C", "libzstd/lib", "libzstd.a",
                 "DEBUGFLAGS=",
-                "MOREFLAGS=" + (get_config_var("CCSHARED") or ""),
+                "MOREFLAGS=" + (get_config_var("CCSHARED") or "")
+                + " -DZSTD_MULTITHREAD -pthread",
                 "ZSTD_LEGACY_SUPPORT=%d" % SUP_LEGACY,
                 "ZSTD_LIB_DEPRECATED=0",
-                "ZSTD_LIB_DICTBUILDER=0",
+                "ZSTD_LIB_DICTBUILDER=1",
             ])
 
             subprocess.check_call(makecmd)
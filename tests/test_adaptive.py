@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+# Tests of the adaptive compressor.
+
+import array
+
+import zstd
+from zstd import _adaptive
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1
+
+
+class FakeClock(object):
+    """Clock under which each compression takes cost(level) seconds."""
+
+    def __init__(self, compressor, cost):
+        self.compressor = compressor
+        self.cost = cost
+        self.now = 0.0
+        self.started = False
+
+    def __call__(self):
+        if self.started:
+            self.now += self.cost(self.compressor.level)
+        self.started = not self.started
+        return self.now
+
+
+class AdaptiveCompression(BaseTestZSTD):
+
+    def setUp(self):
+        self.saved_clock = _adaptive._clock
+
+    def tearDown(self):
+        _adaptive._clock = self.saved_clock
+
+    def run_calls(self, c, cost, n):
+        _adaptive._clock = FakeClock(c, cost)
+        levels = []
+        for i in range(n):
+            self.assertEqual(zstd.decompress(c.compress(tDATA1)), tDATA1)
+            levels.append(c.level)
+        return levels
+
+    def test_latency_target(self):
+        # Level n takes n milliseconds: a 5.5 ms budget allows level 5.
+        c = zstd.AdaptiveCompressor(latency=0.0055, level=1, window=4)
+        self.assertEqual(c.latency, None)
+        levels = self.run_calls(c, lambda level: level * 0.001, 400)
+        self.assertEqual(max(levels), 6)
+        self.assertEqual(levels[-1], 5)
+        self.assertAlmostEqual(c.latency, 0.005)
+
+    def test_speed_target(self):
+        # Level n runs at 11.5 / n MB/s: a 1 MB/s target allows level 11.
+        c = zstd.AdaptiveCompressor(speed=1.0, level=19, window=2)
+        size = len(tDATA1) / 1e6
+        levels = self.run_calls(c, lambda level: size * level / 11.5, 100)
+        self.assertEqual(levels[:15], [19, 18, 18, 17, 17, 16, 16, 15, 15,
+                                       14, 14, 13, 13, 12, 12])
+        # After backing off to 11, it waits for HOLD_WINDOWS windows
+        # before trying 12 again.
+        self.assertEqual(set(levels[15:]), set([11, 12]))
+        self.assertEqual(levels.index(12, 15),
+                         15 + 2 * (_adaptive.HOLD_WINDOWS + 1))
+
+    def test_bounds(self):
+        c = zstd.AdaptiveCompressor(latency=1.0, level=3, max_level=4,
+                                    window=1)
+        self.assertEqual(self.run_calls(c, lambda level: 0, 3), [4, 4, 4])
+        c = zstd.AdaptiveCompressor(latency=1.0, level=3, min_level=2,
+                                    window=1)
+        self.assertEqual(self.run_calls(c, lambda level: 2, 3), [2, 2, 2])
+
+    def test_level_zero_skipped(self):
+        # Level 0 means CLEVEL_DEFAULT, so it is not a step between 1
+        # and -1 in either direction.
+        c = zstd.AdaptiveCompressor(latency=1.0, level=1, min_level=-5,
+                                    window=1)
+        self.assertEqual(self.run_calls(c, lambda level: 2, 3),
+                         [-1, -2, -3])
+        c = zstd.AdaptiveCompressor(latency=1.0, level=-1, min_level=-5,
+                                    max_level=2, window=1)
+        self.assertEqual(self.run_calls(c, lambda level: 0, 3), [1, 2, 2])
+
+    def test_size_in_bytes(self):
+        c = zstd.AdaptiveCompressor(speed=1.0, window=1)
+        _adaptive._clock = FakeClock(c, lambda level: 1.0)
+        data = array.array("d", [1.0] * 1000)
+        self.assertEqual(zstd.decompress(c.compress(data)), data.tobytes()
+                         if hasattr(data, "tobytes") else data.tostring())
+        self.assertAlmostEqual(c.speed, 8000 / 1e6)
+
+    def test_size_of_list(self):
+        c = zstd.AdaptiveCompressor(speed=1.0, window=1)
+        _adaptive._clock = FakeClock(c, lambda level: 1.0)
+        parts = [tDATA1, bytearray(tDATA1)]
+        self.assertEqual(zstd.decompress(c.compress(parts)), tDATA1 * 2)
+        self.assertAlmostEqual(c.speed, 2 * len(tDATA1) / 1e6)
+
+    def test_bad_arguments(self):
+        A = zstd.AdaptiveCompressor
+        self.assertRaises(ValueError, A)
+        self.assertRaises(ValueError, A, speed=1, latency=1)
+        self.assertRaises(ValueError, A, speed=0)
+        self.assertRaises(ValueError, A, latency=-1)
+        self.assertRaises(ValueError, A, speed=1, min_level=5, max_level=4)
+        self.assertRaises(ValueError, A, speed=1,
+                          max_level=zstd.CLEVEL_MAX + 1)
+        self.assertRaises(ValueError, A, speed=1, level=10, max_level=9)
+        self.assertRaises(ValueError, A, speed=1, window=0)
+
+    def test_real_clock(self):
+        c = zstd.AdaptiveCompressor(speed=1e-6, level=1, window=1)
+        for i in range(3):
+            self.assertEqual(zstd.decompress(c.compress(tDATA1)), tDATA1)
+        self.assertEqual(c.level, 4)
+        self.assertTrue(c.speed > 0)
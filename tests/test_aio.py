@@ -0,0 +1,146 @@
+# -*- encoding: utf-8 -*-
+# Tests of the asyncio stream wrappers.
+
+import unittest
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2
+from tests.test_zstdfile import tDATA_LINES
+
+try:
+    import asyncio
+    import concurrent.futures
+    from zstd import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+
+class FakeWriter(object):
+    # Records what is written, and how often drain() is awaited.
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.chunks = []
+        self.drains = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def drain(self):
+        self.drains += 1
+        f = self.loop.create_future()
+        f.set_result(None)
+        return f
+
+    def close(self):
+        self.closed = True
+
+    def getvalue(self):
+        return b"".join(self.chunks)
+
+
+if aio is not None:
+    class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+
+        def __init__(self):
+            concurrent.futures.ThreadPoolExecutor.__init__(self, 1)
+            self.submitted = 0
+
+        def submit(self, *args, **kwargs):
+            self.submitted += 1
+            return concurrent.futures.ThreadPoolExecutor.submit(
+                self, *args, **kwargs)
+
+
+@unittest.skipIf(aio is None, "asyncio wrappers need Python 3.5 or later")
+class AsyncStreams(BaseTestZSTD):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.executor = CountingExecutor()
+
+    def tearDown(self):
+        self.loop.close()
+        self.executor.shutdown()
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def compress(self, pieces, **kwargs):
+        out = FakeWriter(self.loop)
+        w = aio.ZstdStreamWriter(out, executor=self.executor, **kwargs)
+        for piece in pieces:
+            self.wait(w.write(piece))
+        self.wait(w.close())
+        self.assertTrue(out.closed)
+        return out
+
+    def reader(self, cdata, **kwargs):
+        stream = asyncio.StreamReader(loop=self.loop)
+        stream.feed_data(cdata)
+        stream.feed_eof()
+        return aio.ZstdStreamReader(stream, executor=self.executor, **kwargs)
+
+    def test_writer(self):
+        out = self.compress([tDATA1, tDATA2, b"", tDATA1])
+        self.assertEqual(zstd.decompressobj().decompress(out.getvalue()),
+                         tDATA1 + tDATA2 + tDATA1)
+        # Every write waits for the writer to drain.
+        self.assertEqual(out.drains, 5)
+
+    def test_threshold(self):
+        self.compress([tDATA1, tDATA2], threshold=1 << 20)
+        self.assertEqual(self.executor.submitted, 0)
+        self.compress([tDATA_LINES, tDATA2], threshold=1024)
+        self.assertEqual(self.executor.submitted, 1)
+
+    def test_flush(self):
+        out = FakeWriter(self.loop)
+        w = aio.ZstdStreamWriter(out)
+        self.wait(w.write(tDATA1))
+        self.wait(w.flush())
+        self.assertEqual(zstd.decompressobj().decompress(out.getvalue()),
+                         tDATA1)
+        self.wait(w.flush(zstd.FLUSH_FRAME))
+        self.wait(w.write(tDATA2))
+        self.wait(w.close())
+        self.wait(w.close())
+        self.assertRaises(ValueError, self.wait, w.write(b"x"))
+        r = self.reader(out.getvalue())
+        self.assertEqual(self.wait(r.read()), tDATA1 + tDATA2)
+
+    def test_reader(self):
+        cdata = zstd.compress(tDATA_LINES) + zstd.compress(tDATA1)
+        r = self.reader(cdata, threshold=1024)
+        pieces = []
+        while True:
+            data = self.wait(r.read(10000))
+            if not data:
+                break
+            self.assertTrue(len(data) <= 10000)
+            pieces.append(data)
+        self.assertEqual(b"".join(pieces), tDATA_LINES + tDATA1)
+        self.assertTrue(r.at_eof())
+        self.assertTrue(self.executor.submitted > 0)
+
+    def test_reader_iteration(self):
+        r = self.reader(self.compress([tDATA_LINES]).getvalue())
+
+        def collect():
+            pieces = []
+            it = r.__aiter__()
+            while True:
+                try:
+                    pieces.append(self.wait(it.__anext__()))
+                except StopAsyncIteration:
+                    return pieces
+        self.assertEqual(b"".join(collect()), tDATA_LINES)
+
+    def test_reader_empty(self):
+        self.assertEqual(self.wait(self.reader(b"").read()), b"")
+
+    def test_reader_truncated(self):
+        r = self.reader(zstd.compress(tDATA_LINES)[:-10])
+        self.assertRaises(EOFError, self.wait, r.read())
@@ -0,0 +1,74 @@
+# -*- encoding: utf-8 -*-
+# Tests of batch compression and decompression.
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+
+tBATCH = [tDATA1, tDATA2, tDATA3, b"", bytearray(tDATA2),
+          memoryview(tDATA1)[10:500]] + [tDATA2 * i for i in range(50)]
+
+
+class BatchCompression(BaseTestZSTD):
+
+    def test_matches_compress(self):
+        for level in (1, zstd.CLEVEL_DEFAULT, 9):
+            self.assertEqual(zstd.compress_many(tBATCH, level),
+                             [zstd.compress(b, level) for b in tBATCH])
+
+    def test_roundtrip(self):
+        out = zstd.decompress_many(zstd.compress_many(tBATCH))
+        self.assertEqual(out, [bytes(b) for b in tBATCH])
+
+    def test_threads(self):
+        expected = [zstd.compress(b) for b in tBATCH]
+        for threads in (1, 3, 100):
+            cdata = zstd.compress_many(tBATCH, threads=threads)
+            self.assertEqual(cdata, expected)
+            self.assertEqual(zstd.decompress_many(cdata, threads=threads),
+                             [bytes(b) for b in tBATCH])
+
+    def test_empty(self):
+        self.assertEqual(zstd.compress_many([]), [])
+        self.assertEqual(zstd.decompress_many([], threads=4), [])
+
+    def test_tuple_and_generator(self):
+        self.assertEqual(zstd.compress_many((tDATA1, tDATA2)),
+                         [zstd.compress(tDATA1), zstd.compress(tDATA2)])
+        self.assertEqual(zstd.compress_many(b for b in (tDATA1,)),
+                         [zstd.compress(tDATA1)])
+
+    def test_errors(self):
+        self.assertRaises(TypeError, zstd.compress_many, 42)
+        self.assertRaises(TypeError, zstd.compress_many, [tDATA1, 42])
+        self.assertRaises(zstd.Error, zstd.compress_many, [tDATA1],
+                          zstd.CLEVEL_MAX + 1)
+        self.assertRaises(ValueError, zstd.compress_many, [tDATA1], 3, -1)
+
+        good = zstd.compress(tDATA1)
+        for threads in (0, 2):
+            try:
+                zstd.decompress_many([good, good[:-2], good], threads)
+            except zstd.Error as e:
+                self.assertTrue("item 1" in str(e))
+            else:
+                self.fail("zstd.Error not raised")
+        self.assertRaises(zstd.Error, zstd.decompress_many,
+                          [good, b"garbage"])
+
+    def test_single_frame_items_only(self):
+        # Unlike decompress(), each item must be one frame of known size.
+        f1, f2 = zstd.compress(tDATA1), zstd.compress(tDATA2)
+        self.assertEqual(zstd.decompress(f1 + f2), tDATA1 + tDATA2)
+        try:
+            zstd.decompress_many([f1, f1 + f2])
+        except zstd.Error as e:
+            self.assertTrue("item 1" in str(e))
+            self.assertTrue("more than one frame" in str(e))
+        else:
+            self.fail("zstd.Error not raised")
+
+        c = zstd.compressobj()
+        unknown = c.compress(tDATA1) + c.flush()
+        self.assertEqual(zstd.decompress(unknown), tDATA1)
+        self.assertRaises(zstd.Error, zstd.decompress_many, [unknown])
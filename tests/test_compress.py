@@ -113,6 +113,51 @@ def make_compression_default_tests():
 CompressionDefaults = type("CompressionDefaults", (BaseTestZSTD,),
                            make_compression_default_tests())
 
+###
+# Tests of compressing a list or tuple of buffers as one frame.
+#
+class ScatterGatherCompression(BaseTestZSTD):
+
+    def test_sequence(self):
+        parts = [b"header", memoryview(tDATA1)[100:], bytearray(tDATA2),
+                 b"", tDATA3, b"trailer"]
+        joined = b"".join(bytes(p) for p in parts)
+        for data in (parts, tuple(parts)):
+            cdata = zstd.compress(data, 1)
+            self.assertEqual(zstd.get_frame_info(cdata).content_size,
+                             len(joined))
+            self.assertEqual(zstd.decompress(cdata), joined)
+            self.assertEqual(zstd.decompress(zstd.Compressor(1)
+                                             .compress(data)), joined)
+
+    def test_options(self):
+        parts = [tDATA1, tDATA3]
+        p = zstd.CompressionParameters(checksum=1)
+        cdata = zstd.compress(parts, params=p)
+        self.assertTrue(zstd.get_frame_info(cdata).has_checksum)
+        self.assertEqual(zstd.decompress(cdata), tDATA1 + tDATA3)
+        cdata = zstd.Compressor(params=p).compress(parts)
+        self.assertTrue(zstd.get_frame_info(cdata).has_checksum)
+        if zstd.THREADS_MAX > 0:
+            self.assertEqual(zstd.decompress(zstd.compress(parts,
+                                                           threads=2)),
+                             tDATA1 + tDATA3)
+
+    def test_large(self):
+        parts = [tDATA3] * 20
+        self.assertEqual(zstd.decompress(zstd.compress(parts)),
+                         tDATA3 * 20)
+
+    def test_empty(self):
+        for data in ([], [b""], (b"", b"")):
+            self.assertEqual(zstd.decompress(zstd.compress(data)), b"")
+
+    def test_bad_elements(self):
+        self.assertRaises(TypeError, zstd.compress, [b"a", u"b"])
+        self.assertRaises(TypeError, zstd.compress, [b"a", 42])
+        self.assertRaises(TypeError, zstd.Compressor().compress, [None])
+        self.assertRaises(TypeError, zstd.compress, iter([b"a"]))
+
 ###
 # Tests of constants.
 #
@@ -147,6 +192,30 @@ class CompressionErrors(BaseTestZSTD):
         self.assertRaises(TypeError, zstd.compress, tDATA1,
                           "CLEVEL_DEFAULT")
 
+    def test_level_out_of_range_for_int(self):
+        self.assertRaises(OverflowError, zstd.compress, tDATA1, 2 ** 40)
+        self.assertRaises(OverflowError, zstd.compress, tDATA1, -2 ** 70)
+
+    def test_bad_arguments(self):
+        self.assertRaises(TypeError, zstd.compress)
+        self.assertRaises(TypeError, zstd.compress, tDATA1, 1.0)
+        self.assertRaises(TypeError, zstd.compress, tDATA1, 1, 0, None,
+                          None, None, None)
+        self.assertRaises(TypeError, zstd.compress, tDATA1, bogus=1)
+        self.assertRaises(TypeError, zstd.compress, u"text")
+        self.assertRaises(TypeError, zstd.decompress)
+        self.assertRaises(TypeError, zstd.decompress, u"text")
+        self.assertRaises(TypeError, zstd.decompress, b"", bogus=1)
+
+    def test_keyword_and_buffer_arguments(self):
+        small = tDATA1[:100]
+        for data in (small, bytearray(small), memoryview(small)):
+            cdata = zstd.compress(data, 1)
+            self.assertEqual(cdata, zstd.compress(data=data, level=1))
+            self.assertEqual(zstd.decompress(cdata), small)
+            self.assertEqual(zstd.decompress(data=bytearray(cdata)), small)
+        self.assertEqual(zstd.compress(small, True), zstd.compress(small, 1))
+
     def test_decompress_nothing(self):
         self.assertRaises(zstd.Error, zstd.decompress, b"")
 
@@ -0,0 +1,122 @@
+# -*- encoding: utf-8 -*-
+# Tests of reusable compression and decompression contexts.
+
+import threading
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+
+
+class CompressorObject(BaseTestZSTD):
+
+    def test_matches_compress(self):
+        for level in (zstd.CLEVEL_MIN, 1, zstd.CLEVEL_DEFAULT, 19):
+            c = zstd.Compressor(level)
+            for data in (tDATA1, tDATA2, tDATA3, b""):
+                self.assertEqual(c.compress(data),
+                                 zstd.compress(data, level))
+
+    def test_reuse(self):
+        c = zstd.Compressor()
+        for i in range(100):
+            data = tDATA2 * (i + 1)
+            self.assertEqual(zstd.decompress(c.compress(data)), data)
+
+    def test_level(self):
+        self.assertEqual(zstd.Compressor().level, zstd.CLEVEL_DEFAULT)
+        self.assertEqual(zstd.Compressor(0).level, zstd.CLEVEL_DEFAULT)
+        self.assertEqual(zstd.Compressor(level=7).level, 7)
+
+    def test_bad_level(self):
+        self.assertRaises(zstd.Error, zstd.Compressor, zstd.CLEVEL_MAX + 1)
+        self.assertRaises(zstd.Error, zstd.Compressor, zstd.CLEVEL_MIN - 1)
+        self.assertRaises(TypeError, zstd.Compressor, "3")
+
+    def test_not_bytes(self):
+        self.assertRaises(TypeError, zstd.Compressor().compress, 42)
+        self.assertRaises(TypeError, zstd.Compressor().compress)
+        self.assertRaises(TypeError, zstd.Compressor().compress, b"", b"")
+        self.assertEqual(zstd.Compressor().compress(data=tDATA1),
+                         zstd.compress(tDATA1))
+
+
+class ThreadCachedContexts(BaseTestZSTD):
+
+    def test_many_threads(self):
+        expected = [zstd.compress(d, l)
+                    for d in (tDATA1, tDATA2, tDATA3)
+                    for l in (1, 3, 9)]
+        shared = zstd.Compressor(9)
+        errors = []
+
+        def worker():
+            try:
+                for i in range(20):
+                    got = [zstd.compress(d, l)
+                           for d in (tDATA1, tDATA2, tDATA3)
+                           for l in (1, 3, 9)]
+                    if got != expected:
+                        errors.append("module-level compress mismatch")
+                    if (shared.compress(tDATA1)
+                            != zstd.compress(tDATA1, 9)):
+                        errors.append("shared Compressor mismatch")
+            except Exception as e:
+                errors.append(repr(e))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+
+class DecompressorObject(BaseTestZSTD):
+
+    def test_roundtrip(self):
+        d = zstd.Decompressor()
+        for data in (tDATA1, tDATA2, tDATA3, b""):
+            self.assertEqual(d.decompress(zstd.compress(data)), data)
+
+    def test_reuse_after_error(self):
+        d = zstd.Decompressor()
+        cdata = zstd.compress(tDATA1)
+        self.assertRaises(zstd.Error, d.decompress, cdata[:-3])
+        self.assertEqual(d.decompress(cdata), tDATA1)
+
+    def test_bad_arguments(self):
+        self.assertRaises(TypeError, zstd.Decompressor, "3")
+        self.assertRaises(TypeError, zstd.Decompressor, None, 3)
+        d = zstd.Decompressor()
+        self.assertRaises(TypeError, d.decompress)
+        self.assertRaises(TypeError, d.decompress, b"", b"")
+        self.assertEqual(d.decompress(data=zstd.compress(tDATA1)), tDATA1)
+
+
+class PooledDecompression(BaseTestZSTD):
+
+    def test_many_threads(self):
+        cdata = [zstd.compress(d) for d in (tDATA1, tDATA2, tDATA3)]
+        shared = zstd.Decompressor()
+        errors = []
+
+        def worker():
+            try:
+                for i in range(50):
+                    for c, d in zip(cdata, (tDATA1, tDATA2, tDATA3)):
+                        if zstd.decompress(c) != d:
+                            errors.append("module-level decompress mismatch")
+                        if shared.decompress(c) != d:
+                            errors.append("shared Decompressor mismatch")
+            except Exception as e:
+                errors.append(repr(e))
+
+        # More threads than the pool holds, so some contexts are freed
+        # rather than returned.
+        threads = [threading.Thread(target=worker) for _ in range(24)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
@@ -0,0 +1,235 @@
+# -*- encoding: utf-8 -*-
+# Tests of dictionary compression.
+
+import random
+
+import zstd
+from tests.base import BaseTestZSTD
+
+
+def make_samples(n, seed=1234):
+    # Small JSON-like documents that share most of their structure,
+    # which is what dictionaries are good for.
+    rng = random.Random(seed)
+    names = ("alice", "bob", "carol", "dave", "erin", "frank", "grace")
+    samples = []
+    for i in range(n):
+        doc = ('{"id": %d, "user": "%s", "email": "%s@example.com", '
+               '"active": %s, "score": %d, "tags": ["%s", "%s"], '
+               '"address": {"street": "%d Main Street", '
+               '"city": "Springfield", "zip": "%05d"}}'
+               % (i, rng.choice(names), rng.choice(names),
+                  rng.choice(("true", "false")), rng.randint(0, 1000),
+                  rng.choice(names), rng.choice(names),
+                  rng.randint(1, 999), rng.randint(0, 99999)))
+        samples.append(doc.encode("ascii"))
+    return samples
+
+
+SAMPLES = make_samples(2000)
+DICT = zstd.train_dictionary(SAMPLES, 8192)
+OTHER = make_samples(50, seed=99)
+
+
+class TrainDictionary(BaseTestZSTD):
+
+    def test_trained(self):
+        self.assertTrue(isinstance(DICT, zstd.ZstdDict))
+        self.assertNotEqual(DICT.dict_id, 0)
+        self.assertTrue(0 < len(DICT.data) <= 8192)
+
+    def test_too_few_samples(self):
+        self.assertRaises(zstd.Error, zstd.train_dictionary,
+                          SAMPLES[:3], 8192)
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, zstd.train_dictionary, SAMPLES, 0)
+        self.assertRaises(TypeError, zstd.train_dictionary, 42, 8192)
+        self.assertRaises(TypeError, zstd.train_dictionary, [u"x"], 8192)
+
+
+class ZstdDictObject(BaseTestZSTD):
+
+    def test_copy(self):
+        raw = bytearray(DICT.data)
+        d = zstd.ZstdDict(raw)
+        raw[:] = b"x" * len(raw)
+        self.assertEqual(d.data, DICT.data)
+        self.assertEqual(d.dict_id, DICT.dict_id)
+
+    def test_raw_content(self):
+        d = zstd.ZstdDict(b"".join(SAMPLES[:20]))
+        self.assertEqual(d.dict_id, 0)
+        for doc in OTHER:
+            self.assertEqual(
+                zstd.decompress(zstd.compress(doc, dict=d), dict=d), doc)
+
+    def test_bad_data(self):
+        self.assertRaises(ValueError, zstd.ZstdDict, b"")
+        self.assertRaises(TypeError, zstd.ZstdDict, 42)
+
+    def test_bad_dict_argument(self):
+        self.assertRaises(TypeError, zstd.compress, b"x", dict=DICT.data)
+        self.assertRaises(TypeError, zstd.decompress,
+                          zstd.compress(b"x"), dict=DICT.data)
+
+
+class DictCompression(BaseTestZSTD):
+
+    def test_roundtrip(self):
+        for level in (zstd.CLEVEL_MIN, 1, zstd.CLEVEL_DEFAULT, 19):
+            for doc in OTHER:
+                cdata = zstd.compress(doc, level, dict=DICT)
+                self.assertEqual(zstd.decompress(cdata, dict=DICT), doc)
+
+    def test_better_ratio(self):
+        plain = sum(len(zstd.compress(doc)) for doc in OTHER)
+        with_dict = sum(len(zstd.compress(doc, dict=DICT)) for doc in OTHER)
+        self.assertTrue(with_dict * 2 < plain)
+
+    def test_needs_dict(self):
+        cdata = zstd.compress(OTHER[0], dict=DICT)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata)
+
+    def test_does_not_stick(self):
+        # The per-thread context must forget the dictionary.
+        doc = OTHER[0]
+        zstd.compress(doc, dict=DICT)
+        self.assertEqual(zstd.compress(doc), zstd.compress(doc))
+        self.assertEqual(zstd.decompress(zstd.compress(doc)), doc)
+        self.assertEqual(zstd.decompress(zstd.compress(doc, threads=0)), doc)
+
+    def test_compressor_objects(self):
+        c = zstd.Compressor(level=5, dict=DICT)
+        d = zstd.Decompressor(dict=DICT)
+        self.assertTrue(c.dict is DICT)
+        self.assertTrue(d.dict is DICT)
+        self.assertTrue(zstd.Compressor().dict is None)
+        for doc in OTHER:
+            cdata = c.compress(doc)
+            self.assertEqual(cdata, zstd.compress(doc, 5, dict=DICT))
+            self.assertEqual(d.decompress(cdata), doc)
+
+    def test_streaming(self):
+        c = zstd.compressobj(dict=DICT)
+        cdata = b"".join([c.compress(doc) for doc in OTHER]) + c.flush()
+        d = zstd.decompressobj(dict=DICT)
+        self.assertEqual(d.decompress(cdata), b"".join(OTHER))
+        self.assertTrue(d.eof)
+
+
+DICT2 = zstd.train_dictionary(make_samples(2000, seed=5678), 8192)
+
+
+class DictionaryRegistry(BaseTestZSTD):
+
+    def setUp(self):
+        self.registered = []
+
+    def tearDown(self):
+        for dict_id in self.registered:
+            try:
+                zstd.unregister_dictionary(dict_id)
+            except KeyError:
+                pass
+        zstd.set_dictionary_cache_size(32 * 1024 * 1024)
+
+    def register(self, d):
+        zstd.register_dictionary(d)
+        self.registered.append(d.dict_id)
+
+    def test_automatic(self):
+        cdata = zstd.compress(OTHER[0], dict=DICT)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata)
+        self.register(DICT)
+        self.assertEqual(zstd.decompress(cdata), OTHER[0])
+        self.assertEqual(zstd.Decompressor().decompress(cdata), OTHER[0])
+        zstd.unregister_dictionary(DICT.dict_id)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata)
+        self.assertRaises(KeyError, zstd.unregister_dictionary,
+                          DICT.dict_id)
+
+    def test_plain_frames(self):
+        self.register(DICT)
+        self.assertEqual(zstd.decompress(zstd.compress(OTHER[0])),
+                         OTHER[0])
+
+    def test_by_id(self):
+        self.assertRaises(zstd.Error, zstd.compress, OTHER[0],
+                          dict=DICT.dict_id)
+        self.register(DICT)
+        self.register(DICT2)
+        for d in (DICT, DICT2):
+            cdata = zstd.compress(OTHER[0], dict=d.dict_id)
+            self.assertEqual(cdata, zstd.compress(OTHER[0], dict=d))
+            self.assertEqual(zstd.decompress(cdata, dict=d.dict_id),
+                             OTHER[0])
+            self.assertEqual(zstd.decompress(cdata), OTHER[0])
+
+    def test_raw_content(self):
+        self.assertRaises(ValueError, zstd.register_dictionary,
+                          zstd.ZstdDict(b"raw content"))
+        self.assertRaises(TypeError, zstd.register_dictionary, DICT.data)
+
+    def test_replace(self):
+        a = zstd.ZstdDict(DICT.data)
+        b = zstd.ZstdDict(DICT.data)
+        cdata = zstd.compress(OTHER[0], dict=a)
+        self.register(a)
+        zstd.decompress(cdata)
+        self.assertEqual(zstd.dictionary_cache_usage()[0], a.digested_size)
+        self.register(b)
+        self.assertEqual(zstd.dictionary_cache_usage()[0], 0)
+        size = a.digested_size
+        zstd.decompress(cdata)
+        self.assertEqual(a.digested_size, size)
+        self.assertEqual(zstd.dictionary_cache_usage()[0], b.digested_size)
+
+    def test_lru_eviction(self):
+        a = zstd.ZstdDict(DICT.data)
+        b = zstd.ZstdDict(DICT2.data)
+        ca = zstd.compress(OTHER[0], dict=a)
+        cb = zstd.compress(OTHER[0], dict=b)
+        # Drop the compression digests, keeping the test simple.
+        a = zstd.ZstdDict(a.data)
+        b = zstd.ZstdDict(b.data)
+        self.register(a)
+        self.register(b)
+
+        zstd.decompress(ca)
+        size = a.digested_size
+        self.assertTrue(size > 0)
+        zstd.set_dictionary_cache_size(size + size // 2)
+
+        zstd.decompress(cb)
+        self.assertEqual(a.digested_size, 0)
+        self.assertTrue(b.digested_size > 0)
+        used, limit = zstd.dictionary_cache_usage()
+        self.assertTrue(used <= limit)
+
+        # Still usable after eviction.
+        self.assertEqual(zstd.decompress(ca), OTHER[0])
+        self.assertEqual(b.digested_size, 0)
+
+        zstd.set_dictionary_cache_size(0)
+        self.assertEqual(a.digested_size, 0)
+        self.assertEqual(zstd.dictionary_cache_usage()[0], 0)
+
+    def test_pinned(self):
+        a = zstd.ZstdDict(DICT.data)
+        b = zstd.ZstdDict(DICT2.data)
+        self.register(a)
+        self.register(b)
+        zstd.set_dictionary_cache_size(0)
+
+        # Objects using a dictionary keep its digested form alive.
+        c = zstd.Compressor(dict=a)
+        d = zstd.decompressobj(dict=a)
+        cdata = c.compress(OTHER[0])
+        zstd.decompress(zstd.compress(OTHER[0], dict=b))
+        self.assertTrue(a.digested_size > 0)
+        self.assertEqual(b.digested_size, 0)
+        self.assertEqual(d.decompress(cdata), OTHER[0])
+
+        del c, d
+        self.assertEqual(a.digested_size, 0)
@@ -0,0 +1,156 @@
+# -*- encoding: utf-8 -*-
+# Tests of compress_file() and decompress_file().
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, gen_random_bytes
+from tests.test_zstdfile import tDATA_LINES
+
+# Big enough to span several output chunks.
+tDATA_BIG = tDATA_LINES * 12
+
+
+class FileFunctions(BaseTestZSTD):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, "data")
+        self.zst = os.path.join(self.tmpdir, "data.zst")
+        self.out = os.path.join(self.tmpdir, "data.out")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, path, data):
+        with io.open(path, "wb") as f:
+            f.write(data)
+
+    def read(self, path):
+        with io.open(path, "rb") as f:
+            return f.read()
+
+    def test_roundtrip(self):
+        for data in (tDATA1, tDATA_BIG, b""):
+            self.write(self.src, data)
+            csize = zstd.compress_file(self.src, self.zst)
+            self.assertEqual(csize, os.path.getsize(self.zst))
+            self.assertEqual(zstd.decompress(self.read(self.zst)), data)
+            self.assertEqual(zstd.decompress_file(self.zst, self.out),
+                             len(data))
+            self.assertEqual(self.read(self.out), data)
+
+    def test_options(self):
+        self.write(self.src, tDATA_BIG)
+        zstd.compress_file(self.src, self.zst, level=1)
+        self.assertEqual(self.read(self.zst), zstd.compress(tDATA_BIG, 1))
+        p = zstd.CompressionParameters(window_log=24, enable_ldm=1)
+        zstd.compress_file(self.src, self.zst, params=p)
+        zstd.decompress_file(self.zst, self.out)
+        self.assertEqual(self.read(self.out), tDATA_BIG)
+        if zstd.THREADS_MAX > 0:
+            zstd.compress_file(self.src, self.zst, threads=2)
+            zstd.decompress_file(self.zst, self.out)
+            self.assertEqual(self.read(self.out), tDATA_BIG)
+        self.assertRaises(zstd.Error, zstd.compress_file, self.src,
+                          self.zst, level=zstd.CLEVEL_MAX + 1)
+
+    def test_file_objects(self):
+        dst = io.BytesIO()
+        zstd.compress_file(io.BytesIO(tDATA2), dst)
+        out = io.BytesIO()
+        zstd.decompress_file(io.BytesIO(dst.getvalue()), out)
+        self.assertEqual(out.getvalue(), tDATA2)
+
+        self.write(self.src, tDATA1)
+        with io.open(self.src, "rb") as f:
+            zstd.compress_file(f, dst)
+            self.assertFalse(f.closed)
+
+    def test_multiple_frames(self):
+        # Frames without a recorded size, and skippable frames.
+        with zstd.SeekableWriter(self.zst, frame_size=50000) as w:
+            w.write(tDATA_LINES)
+        with zstd.ZstdFile(self.zst, "ab") as f:
+            f.write(tDATA1)
+        zstd.decompress_file(self.zst, self.out)
+        self.assertEqual(self.read(self.out), tDATA_LINES + tDATA1)
+
+    def test_output_of_whole_chunks(self):
+        # Output that exactly fills the last 4 MiB chunk.
+        data = b"x" * (8 << 20)
+        self.write(self.zst, zstd.compress(data) + zstd.compress(data))
+        self.assertEqual(zstd.decompress_file(self.zst, self.out),
+                         2 * len(data))
+        self.assertEqual(self.read(self.out), 2 * data)
+
+    def test_truncated(self):
+        self.write(self.zst, zstd.compress(tDATA_BIG)[:-10])
+        self.assertRaises(zstd.Error, zstd.decompress_file,
+                          self.zst, self.out)
+        self.write(self.zst, b"not zstd data")
+        self.assertRaises(zstd.Error, zstd.decompress_file,
+                          self.zst, self.out)
+
+    def test_write_may_compress(self):
+        # The write callable may itself compress, on the same thread,
+        # without disturbing the frame being written.  Incompressible
+        # data makes for several chunks of output.
+        data = gen_random_bytes(9 << 20)
+        self.write(self.src, data)
+        p = zstd.CompressionParameters(checksum=1)
+        class Writer(object):
+            def __init__(self):
+                self.chunks = []
+            def write(self, chunk):
+                self.chunks.append(bytes(chunk))
+                zstd.compress(tDATA1, 19, params=p)
+        w = Writer()
+        zstd.compress_file(self.src, w, level=1)
+        self.assertTrue(len(w.chunks) > 1)
+        self.assertEqual(b"".join(w.chunks), zstd.compress(data, 1))
+
+    def pipe(self, data):
+        # A pipe from which data can be read, fed by another thread so
+        # that data may be larger than the pipe's buffer.
+        r, w = os.pipe()
+        def feed():
+            with io.open(w, "wb") as f:
+                f.write(data)
+        t = threading.Thread(target=feed)
+        t.start()
+        self.addCleanup(t.join)
+        f = io.open(r, "rb")
+        self.addCleanup(f.close)
+        return f
+
+    def test_pipe(self):
+        zstd.compress_file(self.pipe(tDATA_BIG), self.zst)
+        self.assertEqual(zstd.decompress(self.read(self.zst)), tDATA_BIG)
+        cdata = zstd.compress(tDATA1) + zstd.compress(tDATA_BIG)
+        self.assertEqual(zstd.decompress_file(self.pipe(cdata), self.out),
+                         len(tDATA1) + len(tDATA_BIG))
+        self.assertEqual(self.read(self.out), tDATA1 + tDATA_BIG)
+        self.assertRaises(zstd.Error, zstd.decompress_file,
+                          self.pipe(b"not zstd data"), self.out)
+
+    def test_file_object_position(self):
+        # The input is read from the current position, as if by read().
+        self.write(self.src, b"header" + tDATA_BIG)
+        with io.open(self.src, "rb") as f:
+            self.assertEqual(f.read(6), b"header")
+            zstd.compress_file(f, self.zst)
+            self.assertEqual(f.read(), b"")
+        self.assertEqual(zstd.decompress(self.read(self.zst)), tDATA_BIG)
+
+        self.write(self.zst, b"header" + zstd.compress(tDATA_BIG))
+        with io.open(self.zst, "rb") as f:
+            f.seek(6)
+            self.assertEqual(zstd.decompress_file(f, self.out),
+                             len(tDATA_BIG))
+        self.assertEqual(self.read(self.out), tDATA_BIG)
@@ -0,0 +1,118 @@
+# -*- encoding: utf-8 -*-
+# Tests of frame inspection.
+
+import io
+import struct
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+from tests.test_dict import DICT, OTHER
+
+
+class FrameInfo(BaseTestZSTD):
+
+    def test_single_frame(self):
+        info = zstd.get_frame_info(zstd.compress(tDATA3))
+        self.assertTrue(isinstance(info, zstd.FrameInfo))
+        self.assertEqual(info.content_size, len(tDATA3))
+        self.assertTrue(info.window_size >= len(tDATA3))
+        self.assertEqual(info.dict_id, 0)
+        self.assertEqual(info.has_checksum, False)
+        self.assertEqual(info.frame_count, 1)
+
+    def test_fields(self):
+        p = zstd.CompressionParameters(checksum=1)
+        info = zstd.get_frame_info(zstd.compress(OTHER[0], dict=DICT,
+                                                 params=p))
+        self.assertEqual(info.dict_id, DICT.dict_id)
+        self.assertEqual(info.has_checksum, True)
+
+        c = zstd.compressobj(params=zstd.CompressionParameters(
+            window_log=20))
+        info = zstd.get_frame_info(c.compress(tDATA1) + c.flush())
+        self.assertEqual(info.content_size, None)
+        self.assertEqual(info.window_size, 1 << 20)
+
+    def test_multiple_frames(self):
+        buf = io.BytesIO()
+        with zstd.SeekableWriter(buf, frame_size=1000) as w:
+            w.write(tDATA3)
+        info = zstd.get_frame_info(buf.getvalue())
+        self.assertEqual(info.content_size, len(tDATA3))
+        self.assertEqual(info.frame_count, (len(tDATA3) + 999) // 1000)
+
+        data = zstd.compress(tDATA1) + zstd.compress(tDATA2)
+        info = zstd.get_frame_info(data)
+        self.assertEqual(info.content_size, len(tDATA1) + len(tDATA2))
+        self.assertEqual(info.frame_count, 2)
+
+    def test_invalid(self):
+        cdata = zstd.compress(tDATA1)
+        self.assertRaises(zstd.Error, zstd.get_frame_info, b"")
+        self.assertRaises(zstd.Error, zstd.get_frame_info, cdata[:-1])
+        self.assertRaises(zstd.Error, zstd.get_frame_info, b"not zstd")
+        self.assertRaises(zstd.Error, zstd.get_frame_info,
+                          struct.pack("<II", 0x184D2A50, 0))
+        self.assertRaises(TypeError, zstd.get_frame_info, 42)
+
+
+class FindFrameCompressedSize(BaseTestZSTD):
+
+    def test_size(self):
+        a = zstd.compress(tDATA1)
+        b = zstd.compress(tDATA2)
+        self.assertEqual(zstd.find_frame_compressed_size(a), len(a))
+        self.assertEqual(zstd.find_frame_compressed_size(a + b), len(a))
+        skip = struct.pack("<II", 0x184D2A50, 3) + b"abc"
+        self.assertEqual(zstd.find_frame_compressed_size(skip + a),
+                         len(skip))
+
+    def test_invalid(self):
+        a = zstd.compress(tDATA1)
+        self.assertRaises(zstd.Error, zstd.find_frame_compressed_size,
+                          a[:-1])
+        self.assertRaises(zstd.Error, zstd.find_frame_compressed_size, b"")
+
+
+class MultiFrameDecompress(BaseTestZSTD):
+
+    def test_concatenated(self):
+        data = zstd.compress(tDATA1) + zstd.compress(tDATA2, 1)
+        self.assertEqual(zstd.decompress(data), tDATA1 + tDATA2)
+        self.assertEqual(zstd.Decompressor().decompress(data),
+                         tDATA1 + tDATA2)
+        self.assertEqual(zstd.decompress(zstd.compress(b"") * 3), b"")
+
+    def test_skippable(self):
+        skip = struct.pack("<II", 0x184D2A5F, 4) + b"abcd"
+        data = skip + zstd.compress(tDATA1) + skip + zstd.compress(tDATA2)
+        self.assertEqual(zstd.decompress(data), tDATA1 + tDATA2)
+        buf = io.BytesIO()
+        with zstd.SeekableWriter(buf, frame_size=1000) as w:
+            w.write(tDATA3)
+        self.assertEqual(zstd.decompress(buf.getvalue()), tDATA3)
+
+    def test_threads(self):
+        pieces = [tDATA3[i:i + 5000] for i in range(0, len(tDATA3), 5000)]
+        data = b"".join(zstd.compress(p) for p in pieces)
+        for threads in (0, 1, 3, 100):
+            self.assertEqual(zstd.decompress(data, threads=threads), tDATA3)
+        self.assertRaises(ValueError, zstd.decompress, data, threads=-1)
+
+    def test_dict(self):
+        data = b"".join(zstd.compress(doc, dict=DICT) for doc in OTHER)
+        self.assertEqual(zstd.decompress(data, dict=DICT, threads=2),
+                         b"".join(OTHER))
+
+    def test_invalid(self):
+        a = zstd.compress(tDATA1)
+        b = zstd.compress(tDATA2)
+        self.assertRaises(zstd.Error, zstd.decompress, a + b[:-1])
+        self.assertRaises(zstd.Error, zstd.decompress, a + b"junk")
+        # A damaged frame in the middle is reported.
+        damaged = bytearray(zstd.compress(
+            tDATA2, params=zstd.CompressionParameters(checksum=1)))
+        damaged[-1] ^= 0xFF
+        self.assertRaises(zstd.Error, zstd.decompress,
+                          a + bytes(damaged) + a, threads=2)
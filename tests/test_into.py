@@ -0,0 +1,85 @@
+# -*- encoding: utf-8 -*-
+# Tests of compression and decompression into caller-supplied buffers.
+
+import array
+import mmap
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+
+
+class CompressInto(BaseTestZSTD):
+
+    def test_matches_compress(self):
+        for data in (tDATA1, tDATA2, tDATA3, b""):
+            buf = bytearray(zstd.compress_bound(len(data)))
+            n = zstd.compress_into(data, buf)
+            self.assertEqual(bytes(buf[:n]), zstd.compress(data))
+
+    def test_memoryview_slice(self):
+        buf = bytearray(100000)
+        view = memoryview(buf)[1000:]
+        n = zstd.compress_into(tDATA1, view, level=9)
+        self.assertEqual(bytes(buf[1000:1000 + n]), zstd.compress(tDATA1, 9))
+        self.assertEqual(bytes(buf[:1000]), b"\0" * 1000)
+
+    def test_too_small(self):
+        self.assertRaises(zstd.Error, zstd.compress_into,
+                          tDATA3, bytearray(100))
+
+    def test_readonly_buffer(self):
+        self.assertRaises(TypeError, zstd.compress_into,
+                          tDATA1, b"\0" * 10000)
+
+    def test_compress_bound(self):
+        self.assertTrue(zstd.compress_bound(0) > 0)
+        self.assertTrue(zstd.compress_bound(len(tDATA3)) >= len(tDATA3))
+        self.assertRaises(ValueError, zstd.compress_bound, -1)
+
+
+class DecompressInto(BaseTestZSTD):
+
+    def test_roundtrip(self):
+        for data in (tDATA1, tDATA2, tDATA3):
+            buf = bytearray(len(data))
+            n = zstd.decompress_into(zstd.compress(data), buf)
+            self.assertEqual(n, len(data))
+            self.assertEqual(bytes(buf), data)
+
+    def test_larger_buffer(self):
+        buf = bytearray(len(tDATA1) * 2)
+        n = zstd.decompress_into(zstd.compress(tDATA1), buf)
+        self.assertEqual(bytes(buf[:n]), tDATA1)
+
+    def test_mmap(self):
+        m = mmap.mmap(-1, len(tDATA3))
+        try:
+            self.assertEqual(zstd.decompress_into(zstd.compress(tDATA3), m),
+                             len(tDATA3))
+            self.assertEqual(m[:], tDATA3)
+        finally:
+            m.close()
+
+    def test_array(self):
+        arr = array.array("B", [0] * len(tDATA2))
+        zstd.decompress_into(zstd.compress(tDATA2), arr)
+        self.assertEqual(arr.tostring() if str is bytes else arr.tobytes(),
+                         tDATA2)
+
+    def test_unknown_size(self):
+        c = zstd.compressobj()
+        cdata = c.compress(tDATA1) + c.flush()
+        buf = bytearray(len(tDATA1) + 100)
+        n = zstd.decompress_into(cdata, buf)
+        self.assertEqual(bytes(buf[:n]), tDATA1)
+        self.assertRaises(zstd.Error, zstd.decompress_into,
+                          cdata, bytearray(100))
+
+    def test_too_small(self):
+        self.assertRaises(zstd.Error, zstd.decompress_into,
+                          zstd.compress(tDATA1), bytearray(10))
+
+    def test_invalid(self):
+        self.assertRaises(zstd.Error, zstd.decompress_into,
+                          b"garbage", bytearray(10))
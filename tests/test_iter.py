@@ -0,0 +1,105 @@
+# -*- encoding: utf-8 -*-
+# Tests of decompression iterators.
+
+import io
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+from tests.test_dict import DICT, OTHER
+
+DATA = tDATA3 * 8
+CDATA = zstd.compress(DATA[:300000]) + zstd.compress(DATA[300000:])
+
+
+def pieces(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class DecompressIter(BaseTestZSTD):
+
+    def check_chunks(self, chunks, data, chunk_size):
+        self.assertEqual(b"".join(bytes(c) for c in chunks), data)
+        for c in chunks[:-1]:
+            self.assertEqual(len(c), chunk_size)
+        self.assertTrue(0 < len(chunks[-1]) <= chunk_size)
+
+    def test_bytes(self):
+        for chunk_size in (1000, 65536, 1 << 20, len(DATA)):
+            chunks = list(zstd.decompress_iter(CDATA, chunk_size))
+            self.check_chunks(chunks, DATA, chunk_size)
+            for c in chunks:
+                self.assertTrue(isinstance(c, bytes))
+        self.check_chunks(list(zstd.decompress_iter(bytearray(CDATA))),
+                          DATA, 131072)
+
+    def test_file(self):
+        chunks = list(zstd.decompress_iter(io.BytesIO(CDATA), 7777))
+        self.check_chunks(chunks, DATA, 7777)
+
+    def test_iterable(self):
+        for size in (1, 100, 100000):
+            source = iter([b""] + pieces(CDATA, size) + [b""])
+            chunks = list(zstd.decompress_iter(source, 5000))
+            self.check_chunks(chunks, DATA, 5000)
+
+    def test_reuse_buffer(self):
+        it = zstd.decompress_iter(CDATA, 10000, reuse_buffer=True)
+        first = next(it)
+        self.assertTrue(isinstance(first, memoryview))
+        self.assertEqual(first.tobytes(), DATA[:10000])
+        out = [first.tobytes()]
+        for c in it:
+            self.assertTrue(c.obj is first.obj)
+            out.append(c.tobytes())
+        self.assertEqual(b"".join(out), DATA)
+        # The first view now shows the last full chunk.
+        self.assertNotEqual(first.tobytes(), DATA[:10000])
+
+    def test_frames(self):
+        c = zstd.compressobj()
+        unknown = c.compress(tDATA2) + c.flush()
+        skippable = b"\x50\x2a\x4d\x18\x03\x00\x00\x00abc"
+        cdata = (zstd.compress(tDATA1) + skippable + unknown
+                 + zstd.compress(b""))
+        self.assertEqual(b"".join(zstd.decompress_iter(cdata, 100)),
+                         tDATA1 + tDATA2)
+
+    def test_output_of_whole_chunks(self):
+        cdata = zstd.compress(tDATA1) + zstd.compress(tDATA1)
+        self.assertEqual(list(zstd.decompress_iter(cdata, len(tDATA1))),
+                         [tDATA1, tDATA1])
+
+    def test_empty(self):
+        self.assertEqual(list(zstd.decompress_iter(b"")), [])
+        self.assertEqual(list(zstd.decompress_iter(io.BytesIO())), [])
+        self.assertEqual(list(zstd.decompress_iter([])), [])
+
+    def test_dict_and_params(self):
+        cdata = zstd.compress(OTHER[0], dict=DICT)
+        self.assertEqual(b"".join(zstd.decompress_iter(cdata, dict=DICT)),
+                         OTHER[0])
+        self.assertRaises(zstd.Error, list, zstd.decompress_iter(cdata))
+
+        cdata = zstd.compress(DATA, params=zstd.CompressionParameters(
+            window_log=20))
+        small = zstd.DecompressionParameters(window_log_max=10)
+        self.assertRaises(zstd.Error, list,
+                          zstd.decompress_iter(cdata, params=small))
+        # The pooled context is reset afterwards.
+        self.assertEqual(b"".join(zstd.decompress_iter(cdata)), DATA)
+
+    def test_errors(self):
+        self.assertRaises(zstd.Error, list, zstd.decompress_iter(CDATA[:-1]))
+        self.assertRaises(zstd.Error, list,
+                          zstd.decompress_iter(CDATA + b"junk"))
+        it = zstd.decompress_iter(b"junk" * 10)
+        self.assertRaises(zstd.Error, next, it)
+        self.assertRaises(StopIteration, next, it)
+
+    def test_bad_arguments(self):
+        self.assertRaises(TypeError, zstd.decompress_iter, 42)
+        self.assertRaises(TypeError, list, zstd.decompress_iter([u"text"]))
+        self.assertRaises(ValueError, zstd.decompress_iter, CDATA, 0)
+        self.assertRaises(TypeError, zstd.decompress_iter, CDATA,
+                          params=DICT)
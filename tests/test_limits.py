@@ -0,0 +1,107 @@
+# -*- encoding: utf-8 -*-
+# Tests of limits on decompression.
+
+import struct
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+from tests.test_dict import DICT, OTHER
+
+
+def stream_compress(data, **kwargs):
+    c = zstd.compressobj(**kwargs)
+    return c.compress(data) + c.flush()
+
+
+class MaxOutputSize(BaseTestZSTD):
+
+    def test_known_size(self):
+        cdata = zstd.compress(tDATA1)
+        n = len(tDATA1)
+        self.assertEqual(zstd.decompress(cdata, max_output_size=n), tDATA1)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata,
+                          max_output_size=n - 1)
+        d = zstd.Decompressor(max_output_size=n - 1)
+        self.assertEqual(d.max_output_size, n - 1)
+        self.assertRaises(zstd.Error, d.decompress, cdata)
+        self.assertEqual(zstd.Decompressor(max_output_size=n)
+                         .decompress(cdata), tDATA1)
+
+    def test_several_frames(self):
+        cdata = zstd.compress(tDATA1) + zstd.compress(tDATA2)
+        n = len(tDATA1) + len(tDATA2)
+        self.assertEqual(zstd.decompress(cdata, max_output_size=n),
+                         tDATA1 + tDATA2)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata,
+                          max_output_size=n - 1)
+
+    def test_hostile_header(self):
+        # A single-segment frame header claiming 2**40 bytes of content,
+        # followed by junk.  The limit is checked before allocating.
+        header = struct.pack("<IB", 0xFD2FB528, 0xE0) + struct.pack(
+            "<Q", 1 << 40)
+        self.assertRaises(zstd.Error, zstd.decompress, header + b"junk",
+                          max_output_size=1 << 20)
+
+    def test_bad_arguments(self):
+        cdata = zstd.compress(tDATA1)
+        self.assertRaises(ValueError, zstd.decompress, cdata,
+                          max_output_size=-1)
+        self.assertRaises(ValueError, zstd.Decompressor, max_output_size=-1)
+        self.assertRaises(TypeError, zstd.decompress, cdata,
+                          max_output_size="1")
+
+
+class UnknownSizeFrames(BaseTestZSTD):
+
+    def test_grows(self):
+        data = tDATA3 * 100
+        cdata = stream_compress(data)
+        self.assertEqual(zstd.get_frame_info(cdata).content_size, None)
+        self.assertEqual(zstd.decompress(cdata), data)
+        self.assertEqual(zstd.decompress(cdata, max_output_size=len(data)),
+                         data)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata,
+                          max_output_size=len(data) - 1)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata,
+                          max_output_size=1)
+
+    def test_mixed_frames(self):
+        cdata = (zstd.compress(tDATA1) + stream_compress(tDATA2)
+                 + zstd.compress(tDATA3))
+        self.assertEqual(zstd.decompress(cdata, threads=2),
+                         tDATA1 + tDATA2 + tDATA3)
+
+    def test_dictionary(self):
+        cdata = stream_compress(OTHER[0], dict=DICT)
+        self.assertEqual(zstd.decompress(cdata, dict=DICT), OTHER[0])
+        self.assertEqual(zstd.Decompressor(dict=DICT).decompress(cdata),
+                         OTHER[0])
+        # The pooled context does not keep the dictionary.
+        self.assertEqual(zstd.decompress(stream_compress(tDATA1)), tDATA1)
+
+    def test_truncated(self):
+        cdata = stream_compress(tDATA3)
+        for n in (1, 10, len(cdata) // 2):
+            self.assertRaises(zstd.Error, zstd.decompress, cdata[:-n])
+        # The pooled context is left ready for another frame.
+        self.assertEqual(zstd.decompress(cdata), tDATA3)
+
+
+class WindowLogMax(BaseTestZSTD):
+
+    def test_one_shot(self):
+        data = tDATA2 * 20000
+        cdata = zstd.compress(data, params=zstd.CompressionParameters(
+            window_log=24))
+        small = zstd.DecompressionParameters(window_log_max=20)
+        large = zstd.DecompressionParameters(window_log_max=24)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata, params=small)
+        self.assertRaises(zstd.Error,
+                          zstd.Decompressor(params=small).decompress, cdata)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata + cdata,
+                          params=small)
+        self.assertEqual(zstd.decompress(cdata, params=large), data)
+        self.assertEqual(zstd.Decompressor(params=large).decompress(cdata),
+                         data)
@@ -0,0 +1,83 @@
+# -*- encoding: utf-8 -*-
+# Tests of peak memory use when compressing large inputs.
+
+import os
+import subprocess
+import sys
+
+import zstd
+from tests.base import BaseTestZSTD
+
+# Run in a subprocess, so that the measurements are not disturbed by
+# whatever the rest of the test suite has allocated.  The input is
+# highly compressible text; the old approach of allocating a
+# compressBound()-sized output buffer up front needed more address
+# space than the input itself for the output alone.
+MEASURE_SCRIPT = r"""
+import resource, sys
+import zstd
+
+size = int(sys.argv[1])
+limit_output = sys.argv[2] == "limit"
+data = (b"The quick brown fox jumps over the lazy dog. " * (size // 45 + 1))
+data = data[:size]
+
+def vm_size():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmSize:"):
+                return int(line.split()[1]) * 1024
+
+# Warm up, so that the per-thread context is already allocated.
+zstd.compress(data[:1 << 20], 1)
+
+if limit_output:
+    # Allow much less extra address space than the input size.
+    limit = vm_size() + size // 2
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+cdata = zstd.compress(data, 1)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sys.stdout.write("%d %d %d\n" % (before * 1024, after * 1024, len(cdata)))
+"""
+
+
+class LargeInputPeakMemory(BaseTestZSTD):
+
+    SIZE = 64 << 20
+
+    def run_measurement(self, mode):
+        if not sys.platform.startswith("linux"):
+            self.skipTest("peak memory measurement requires Linux")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(
+            os.path.dirname(os.path.abspath(zstd.__file__)))
+        proc = subprocess.Popen(
+            [sys.executable, "-c", MEASURE_SCRIPT, str(self.SIZE), mode],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err.decode("utf-8", "replace"))
+        return [int(x) for x in out.split()]
+
+    def test_peak_rss(self):
+        before, after, csize = self.run_measurement("measure")
+        self.assertTrue(csize < self.SIZE // 100)
+        # The peak resident set should grow by much less than the
+        # input size while compressing.
+        self.assertTrue(after - before < self.SIZE // 4,
+                        "peak RSS grew by %d bytes" % (after - before))
+
+    def test_address_space_limit(self):
+        before, after, csize = self.run_measurement("limit")
+        self.assertTrue(csize < self.SIZE // 100)
+
+    def test_roundtrip(self):
+        data = os.urandom(1 << 16) * 40
+        cdata = zstd.compress(data, 1)
+        self.assertEqual(zstd.decompress(cdata), data)
+        self.assertEqual(zstd.Compressor(1).compress(data), cdata)
+        # Incompressible input has to grow the output buffer all the
+        # way up to the worst case.
+        data = os.urandom(3 << 20)
+        self.assertEqual(zstd.decompress(zstd.compress(data, 1)), data)
@@ -0,0 +1,127 @@
+# -*- encoding: utf-8 -*-
+# Tests of advanced compression and decompression parameters.
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2
+
+
+def redundant_data():
+    # A block of noise repeated with a long gap, too far apart for the
+    # default window at level 1.
+    import random
+    rng = random.Random(42)
+    block = bytes(bytearray(rng.getrandbits(8) for _ in range(256 * 1024)))
+    filler = bytes(bytearray(rng.getrandbits(8) for _ in range(4 << 20)))
+    return block + filler + block
+
+
+class CompressionParametersObject(BaseTestZSTD):
+
+    def test_defaults(self):
+        p = zstd.CompressionParameters()
+        self.assertEqual(p.window_log, 0)
+        self.assertEqual(p.strategy, 0)
+        self.assertEqual(p.checksum, 0)
+
+    def test_values(self):
+        p = zstd.CompressionParameters(window_log=20,
+                                       strategy=zstd.STRATEGY_BTULTRA2,
+                                       enable_ldm=1)
+        self.assertEqual(p.window_log, 20)
+        self.assertEqual(p.strategy, zstd.STRATEGY_BTULTRA2)
+        self.assertEqual(p.enable_ldm, 1)
+
+    def test_out_of_range(self):
+        self.assertRaises(ValueError, zstd.CompressionParameters,
+                          window_log=5)
+        self.assertRaises(ValueError, zstd.CompressionParameters,
+                          window_log=99)
+        self.assertRaises(ValueError, zstd.CompressionParameters,
+                          strategy=42)
+        self.assertRaises(ValueError, zstd.DecompressionParameters,
+                          window_log_max=99)
+
+    def test_bad_arguments(self):
+        self.assertRaises(TypeError, zstd.CompressionParameters, 20)
+        self.assertRaises(TypeError, zstd.CompressionParameters,
+                          no_such_parameter=1)
+        self.assertRaises(TypeError, zstd.compress, b"x",
+                          params=zstd.DecompressionParameters())
+        self.assertRaises(TypeError, zstd.decompress, zstd.compress(b"x"),
+                          params=zstd.CompressionParameters())
+
+
+class ParameterCompression(BaseTestZSTD):
+
+    def test_roundtrip(self):
+        for p in (zstd.CompressionParameters(),
+                  zstd.CompressionParameters(window_log=27, enable_ldm=1),
+                  zstd.CompressionParameters(strategy=zstd.STRATEGY_FAST,
+                                             hash_log=12),
+                  zstd.CompressionParameters(target_length=64,
+                                             search_log=4)):
+            for data in (tDATA1, tDATA2, b""):
+                cdata = zstd.compress(data, 3, params=p)
+                self.assertEqual(zstd.decompress(cdata), data)
+
+    def test_empty_params_match_level(self):
+        p = zstd.CompressionParameters()
+        self.assertEqual(zstd.compress(tDATA1, 5, params=p),
+                         zstd.compress(tDATA1, 5))
+
+    def test_long_distance_matching(self):
+        data = redundant_data()
+        plain = zstd.compress(data, 1)
+        p = zstd.CompressionParameters(window_log=27, enable_ldm=1)
+        ldm = zstd.compress(data, 1, params=p)
+        self.assertTrue(len(ldm) < len(plain) - 200 * 1024)
+        self.assertEqual(zstd.decompress(ldm), data)
+
+    def test_checksum(self):
+        p = zstd.CompressionParameters(checksum=1)
+        cdata = zstd.compress(tDATA1, params=p)
+        self.assertEqual(len(cdata), len(zstd.compress(tDATA1)) + 4)
+        damaged = cdata[:-1] + bytes(bytearray([cdata[-1] ^ 1]))
+        self.assertRaises(zstd.Error, zstd.decompress, damaged)
+
+    def test_compressor_objects(self):
+        p = zstd.CompressionParameters(strategy=zstd.STRATEGY_LAZY2,
+                                       checksum=1)
+        c = zstd.Compressor(7, params=p)
+        self.assertTrue(c.params is p)
+        self.assertTrue(zstd.Compressor().params is None)
+        expected = zstd.compress(tDATA2, 7, params=p)
+        self.assertEqual(c.compress(tDATA2), expected)
+        self.assertEqual(c.compress(tDATA2), expected)
+
+        s = zstd.compressobj(7, params=p)
+        cdata = s.compress(tDATA2) + s.flush()
+        self.assertEqual(zstd.decompressobj().decompress(cdata), tDATA2)
+
+
+class DecompressionParametersObject(BaseTestZSTD):
+
+    def test_window_log_max(self):
+        p = zstd.CompressionParameters(window_log=24)
+        data = tDATA2 * 2000
+        cdata = zstd.compressobj(1, params=p)
+        cdata = cdata.compress(data) + cdata.flush()
+
+        small = zstd.DecompressionParameters(window_log_max=20)
+        self.assertEqual(small.window_log_max, 20)
+        self.assertRaises(zstd.Error,
+                          zstd.decompressobj(params=small).decompress, cdata)
+
+        large = zstd.DecompressionParameters(window_log_max=24)
+        self.assertEqual(zstd.decompressobj(params=large).decompress(cdata),
+                         data)
+
+    def test_accepted_everywhere(self):
+        p = zstd.DecompressionParameters(window_log_max=20)
+        cdata = zstd.compress(tDATA1)
+        self.assertEqual(zstd.decompress(cdata, params=p), tDATA1)
+        self.assertEqual(zstd.Decompressor(params=p).decompress(cdata),
+                         tDATA1)
+        # The pooled context is reset afterwards.
+        self.assertEqual(zstd.decompress(cdata), tDATA1)
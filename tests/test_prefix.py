@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+# Tests of delta compression against a prefix.
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA3, gen_random_bytes
+from tests.test_dict import DICT
+
+
+def new_version(old):
+    # A copy of old with a few bytes changed, inserted and removed.
+    n = len(old)
+    return (old[:n // 4] + b"changed" + old[n // 4 + 7:n // 2]
+            + b"inserted" + old[n // 2:3 * n // 4] + old[3 * n // 4 + 100:])
+
+
+class Prefix(BaseTestZSTD):
+
+    def test_roundtrip(self):
+        new = new_version(tDATA3)
+        cdata = zstd.compress(new, prefix=tDATA3)
+        self.assertEqual(zstd.decompress(cdata, prefix=tDATA3), new)
+
+    def test_delta_is_small(self):
+        new = new_version(tDATA3)
+        self.assertTrue(len(zstd.compress(new)) > len(tDATA3) // 2)
+        self.assertTrue(len(zstd.compress(new, prefix=tDATA3)) < 1000)
+
+    def test_prefix_beyond_level_window(self):
+        # Level 1 has a window far smaller than the prefix, so it must be
+        # enlarged for the delta to reach back to the start.
+        old = gen_random_bytes(3 * 1024 * 1024)
+        new = new_version(old)
+        cdata = zstd.compress(new, 1, prefix=old)
+        self.assertTrue(len(cdata) < 10000)
+        self.assertEqual(zstd.decompress(cdata, prefix=old), new)
+
+    def test_explicit_window_respected(self):
+        old = gen_random_bytes(3 * 1024 * 1024)
+        p = zstd.CompressionParameters(window_log=20)
+        cdata = zstd.compress(old, 1, params=p, prefix=old)
+        self.assertEqual(zstd.get_frame_info(cdata).window_size, 1 << 20)
+        self.assertEqual(zstd.decompress(cdata, prefix=old), old)
+
+    def test_buffer_types(self):
+        new = new_version(tDATA3)
+        cdata = zstd.compress(new, prefix=bytearray(tDATA3))
+        self.assertEqual(zstd.decompress(cdata, prefix=memoryview(tDATA3)),
+                         new)
+
+    def test_sequence(self):
+        new = new_version(tDATA3)
+        cdata = zstd.compress([new[:1000], new[1000:]], prefix=tDATA3)
+        self.assertEqual(cdata, zstd.compress(new, prefix=tDATA3))
+        self.assertEqual(zstd.decompress(cdata, prefix=tDATA3), new)
+
+    def test_several_frames(self):
+        new = new_version(tDATA3)
+        cdata = zstd.compress(new, prefix=tDATA3)
+        cdata2 = zstd.compress(tDATA1, prefix=tDATA3)
+        self.assertEqual(zstd.decompress(cdata + cdata2, prefix=tDATA3),
+                         new + tDATA1)
+        self.assertEqual(zstd.decompress(cdata + cdata2, prefix=tDATA3,
+                                         threads=1),
+                         new + tDATA1)
+
+    def test_missing_prefix(self):
+        cdata = zstd.compress(new_version(tDATA3), prefix=tDATA3)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata)
+        self.assertRaises(zstd.Error, zstd.decompress, cdata, prefix=b"")
+
+    def test_wrong_prefix_detected_by_checksum(self):
+        p = zstd.CompressionParameters(checksum=1)
+        cdata = zstd.compress(new_version(tDATA3), params=p, prefix=tDATA3)
+        other = gen_random_bytes(len(tDATA3))
+        self.assertRaises(zstd.Error, zstd.decompress, cdata, prefix=other)
+
+    def test_prefix_not_kept(self):
+        # Neither a completed nor an abandoned call leaves the prefix
+        # attached to the thread's compression context.
+        zstd.compress(tDATA1, prefix=tDATA3)
+        self.assertRaises(TypeError, zstd.compress, u"text", 1,
+                          params=zstd.CompressionParameters(), prefix=tDATA3)
+        p = zstd.CompressionParameters(checksum=1)
+        self.assertEqual(zstd.decompress(zstd.compress(tDATA3, params=p)),
+                         tDATA3)
+        self.assertEqual(zstd.decompress(zstd.compress(tDATA3)), tDATA3)
+
+    def test_none_means_no_prefix(self):
+        self.assertEqual(zstd.compress(tDATA1, prefix=None),
+                         zstd.compress(tDATA1))
+        self.assertEqual(zstd.decompress(zstd.compress(tDATA1), prefix=None),
+                         tDATA1)
+
+    def test_bad_arguments(self):
+        self.assertRaises(TypeError, zstd.compress, tDATA1, prefix=u"text")
+        self.assertRaises(TypeError, zstd.decompress, zstd.compress(tDATA1),
+                          prefix=u"text")
+        self.assertRaises(ValueError, zstd.compress, tDATA1,
+                          dict=DICT, prefix=tDATA3)
+        self.assertRaises(ValueError, zstd.decompress, zstd.compress(tDATA1),
+                          dict=DICT, prefix=tDATA3)
@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+# Tests of the seekable format.
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2
+from tests.test_zstdfile import tDATA_LINES
+
+
+def write_seekable(data, **kwargs):
+    buf = io.BytesIO()
+    with zstd.SeekableWriter(buf, **kwargs) as w:
+        w.write(data)
+    return buf.getvalue()
+
+
+class SeekableFormat(BaseTestZSTD):
+
+    def test_read_range(self):
+        raw = write_seekable(tDATA_LINES, frame_size=10000)
+        r = zstd.SeekableReader(io.BytesIO(raw))
+        self.assertEqual(r.size, len(tDATA_LINES))
+        self.assertEqual(r.num_frames, (len(tDATA_LINES) + 9999) // 10000)
+        for offset, length in ((0, 10), (9990, 20), (10000, 10000),
+                               (12345, 54321), (len(tDATA_LINES) - 5, 100),
+                               (0, len(tDATA_LINES))):
+            self.assertEqual(r.read_range(offset, length),
+                             tDATA_LINES[offset:offset + length])
+        self.assertEqual(r.read_range(len(tDATA_LINES), 10), b"")
+        self.assertEqual(r.read_range(5, 0), b"")
+        self.assertRaises(ValueError, r.read_range, -1, 10)
+
+    def test_standard_decoders(self):
+        raw = write_seekable(tDATA_LINES, frame_size=65536)
+        with zstd.ZstdFile(io.BytesIO(raw)) as f:
+            self.assertEqual(f.read(), tDATA_LINES)
+
+    def test_writes(self):
+        buf = io.BytesIO()
+        with zstd.SeekableWriter(buf, frame_size=1000) as w:
+            for i in range(0, len(tDATA1), 7):
+                w.write(tDATA1[i:i + 7])
+            w.flush()
+            w.write(memoryview(tDATA2))
+            self.assertEqual(w.tell(), len(tDATA1) + len(tDATA2))
+        self.assertTrue(w.closed)
+        r = zstd.SeekableReader(io.BytesIO(buf.getvalue()))
+        self.assertEqual(r.read_range(0, r.size), tDATA1 + tDATA2)
+        self.assertRaises(ValueError, w.write, b"x")
+
+    def test_empty(self):
+        r = zstd.SeekableReader(io.BytesIO(write_seekable(b"")))
+        self.assertEqual(r.size, 0)
+        self.assertEqual(r.num_frames, 0)
+        self.assertEqual(r.read_range(0, 10), b"")
+
+    def test_checksum_entries(self):
+        # Seek tables written by other tools may have checksums.
+        frames = [zstd.compress(tDATA1), zstd.compress(tDATA2)]
+        table = b"".join(struct.pack("<III", len(c), len(d), 0)
+                         for c, d in zip(frames, (tDATA1, tDATA2)))
+        table += struct.pack("<IBI", 2, 0x80, 0x8F92EAB1)
+        raw = (b"".join(frames) +
+               struct.pack("<II", 0x184D2A5E, len(table)) + table)
+        r = zstd.SeekableReader(io.BytesIO(raw))
+        self.assertEqual(r.read_range(len(tDATA1) - 3, 6),
+                         (tDATA1 + tDATA2)[len(tDATA1) - 3:len(tDATA1) + 3])
+
+    def test_not_seekable(self):
+        self.assertRaises(zstd.Error, zstd.SeekableReader,
+                          io.BytesIO(zstd.compress(tDATA1)))
+        raw = write_seekable(tDATA1, frame_size=1000)
+        self.assertRaises(zstd.Error, zstd.SeekableReader,
+                          io.BytesIO(raw[1:]))
+
+    def test_bad_frame_size(self):
+        self.assertRaises(ValueError, zstd.SeekableWriter, io.BytesIO(),
+                          frame_size=0)
+
+    def test_named_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "test.zst")
+            with zstd.SeekableWriter(path, frame_size=4096, level=1) as w:
+                w.write(tDATA_LINES)
+            with zstd.SeekableReader(path) as r:
+                self.assertEqual(r.read_range(100000, 5000),
+                                 tDATA_LINES[100000:105000])
+            self.assertTrue(r.closed)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,86 @@
+# -*- encoding: utf-8 -*-
+# Tests of runtime statistics.
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+
+OPS = ("compress", "decompress", "compress_stream", "decompress_stream")
+
+
+class Statistics(BaseTestZSTD):
+
+    def setUp(self):
+        zstd.reset_stats()
+        self.was_enabled = zstd.enable_stats()
+
+    def tearDown(self):
+        zstd.enable_stats(self.was_enabled)
+        zstd.reset_stats()
+
+    def test_disabled(self):
+        zstd.enable_stats(False)
+        zstd.decompress(zstd.compress(tDATA1))
+        for op in OPS:
+            self.assertEqual(zstd.stats()[op]["calls"], 0)
+        self.assertEqual(zstd.enable_stats(True), False)
+        self.assertEqual(zstd.enable_stats(), True)
+
+    def test_one_shot(self):
+        cdata = zstd.compress(tDATA1)
+        zstd.compress(tDATA2, threads=0, params=zstd.CompressionParameters())
+        zstd.Compressor(5).compress(tDATA3)
+        self.assertEqual(zstd.decompress(cdata), tDATA1)
+        s = zstd.stats()
+        self.assertEqual(s["compress"]["calls"], 3)
+        self.assertEqual(s["compress"]["bytes_in"],
+                         len(tDATA1) + len(tDATA2) + len(tDATA3))
+        self.assertTrue(0 < s["compress"]["bytes_out"] <
+                        s["compress"]["bytes_in"])
+        self.assertTrue(s["compress"]["ns"] > 0)
+        self.assertEqual(s["decompress"]["calls"], 1)
+        self.assertEqual(s["decompress"]["bytes_in"], len(cdata))
+        self.assertEqual(s["decompress"]["bytes_out"], len(tDATA1))
+        self.assertEqual(s["decompress"]["errors"], 0)
+
+    def test_batches_and_frames(self):
+        cdata = zstd.compress_many([tDATA1, tDATA2], threads=1)
+        zstd.decompress(b"".join(cdata))
+        s = zstd.stats()
+        self.assertEqual(s["compress"]["calls"], 2)
+        self.assertEqual(s["decompress"]["calls"], 2)
+        self.assertEqual(s["decompress"]["bytes_out"],
+                         len(tDATA1) + len(tDATA2))
+
+    def test_streams(self):
+        c = zstd.compressobj()
+        cdata = c.compress(tDATA3) + c.flush()
+        d = zstd.decompressobj()
+        self.assertEqual(d.decompress(cdata), tDATA3)
+        s = zstd.stats()
+        self.assertEqual(s["compress_stream"]["calls"], 2)
+        self.assertEqual(s["compress_stream"]["bytes_in"], len(tDATA3))
+        self.assertEqual(s["compress_stream"]["bytes_out"], len(cdata))
+        self.assertEqual(s["decompress_stream"]["bytes_in"], len(cdata))
+        self.assertEqual(s["decompress_stream"]["bytes_out"], len(tDATA3))
+
+    def test_errors(self):
+        cdata = zstd.compress(tDATA1, params=zstd.CompressionParameters(
+            checksum=1))
+        damaged = cdata[:-1] + bytes(bytearray([cdata[-1] ^ 1]))
+        for i in range(3):
+            self.assertRaises(zstd.Error, zstd.decompress, damaged)
+        s = zstd.stats()["decompress"]
+        self.assertEqual(s["calls"], 3)
+        self.assertEqual(s["errors"], 3)
+        self.assertEqual(list(s["error_counts"].values()), [3])
+        self.assertEqual(s["bytes_in"], 0)
+
+    def test_reset(self):
+        zstd.compress(tDATA1)
+        zstd.reset_stats()
+        for op in OPS:
+            s = zstd.stats()[op]
+            self.assertEqual((s["calls"], s["bytes_in"], s["bytes_out"],
+                              s["ns"], s["errors"], s["error_counts"]),
+                             (0, 0, 0, 0, 0, {}))
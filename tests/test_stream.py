@@ -0,0 +1,129 @@
+# -*- encoding: utf-8 -*-
+# Tests of streaming compression and decompression objects.
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+
+FRAME_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def stream_compress(chunks, level=zstd.CLEVEL_DEFAULT):
+    c = zstd.compressobj(level)
+    out = [c.compress(chunk) for chunk in chunks]
+    out.append(c.flush())
+    return b"".join(out)
+
+
+class CompressObject(BaseTestZSTD):
+
+    def test_frame_magic(self):
+        for data in (tDATA1, tDATA2, tDATA3, b""):
+            cdata = stream_compress([data])
+            self.assertEqual(cdata[:4], FRAME_MAGIC)
+
+    def test_buffers_input(self):
+        # Small inputs are held in internal buffers until flushed.
+        c = zstd.compressobj()
+        self.assertEqual(c.compress(tDATA2), b"")
+        self.assertTrue(len(c.flush()) > 0)
+
+    def test_flush_block(self):
+        c = zstd.compressobj()
+        first = c.compress(tDATA1)
+        first += c.flush(zstd.FLUSH_BLOCK)
+        self.assertTrue(first.startswith(FRAME_MAGIC))
+        # Nothing more is pending after a block flush.
+        self.assertEqual(c.flush(zstd.FLUSH_BLOCK), b"")
+        rest = c.compress(tDATA2) + c.flush(zstd.FLUSH_FRAME)
+        self.assertFalse(rest.startswith(FRAME_MAGIC))
+
+    def test_new_frame_after_flush(self):
+        c = zstd.compressobj()
+        one = c.compress(tDATA1) + c.flush()
+        two = c.compress(tDATA1) + c.flush()
+        self.assertEqual(one, two)
+
+    def test_level(self):
+        self.assertEqual(zstd.compressobj().level, zstd.CLEVEL_DEFAULT)
+        self.assertEqual(zstd.compressobj(level=-1).level, -1)
+        self.assertRaises(zstd.Error, zstd.compressobj, zstd.CLEVEL_MAX + 1)
+
+    def test_bad_flush_mode(self):
+        c = zstd.compressobj()
+        self.assertRaises(ValueError, c.flush, 42)
+
+
+class DecompressObject(BaseTestZSTD):
+
+    def test_roundtrip_stream(self):
+        for data in (tDATA1, tDATA2, tDATA3, b""):
+            cdata = stream_compress([data[i:i+1000]
+                                     for i in range(0, len(data), 1000)])
+            d = zstd.decompressobj()
+            self.assertEqual(d.decompress(cdata), data)
+            self.assertTrue(d.eof)
+            self.assertFalse(d.needs_input)
+            self.assertEqual(d.unused_data, b"")
+
+    def test_roundtrip_oneshot(self):
+        d = zstd.decompressobj()
+        self.assertEqual(d.decompress(zstd.compress(tDATA1)), tDATA1)
+
+    def test_unknown_size_accepted_by_decompress(self):
+        # The one-shot decompress() falls back to decompressing as a
+        # stream when the frame does not record its size.
+        cdata = stream_compress([tDATA1])
+        self.assertEqual(zstd.decompress(cdata), tDATA1)
+        self.assertEqual(zstd.Decompressor().decompress(cdata), tDATA1)
+
+    def test_byte_at_a_time(self):
+        cdata = stream_compress([tDATA1])
+        d = zstd.decompressobj()
+        out = []
+        for i in range(len(cdata)):
+            self.assertFalse(d.eof)
+            out.append(d.decompress(cdata[i:i+1]))
+        self.assertTrue(d.eof)
+        self.assertEqual(b"".join(out), tDATA1)
+
+    def test_max_length(self):
+        data = tDATA3 + tDATA1 * 50
+        cdata = stream_compress([data])
+        d = zstd.decompressobj()
+        out = [d.decompress(cdata, max_length=1000)]
+        self.assertEqual(len(out[0]), 1000)
+        self.assertFalse(d.needs_input)
+        while not d.eof:
+            chunk = d.decompress(b"", max_length=1000)
+            self.assertTrue(len(chunk) <= 1000)
+            out.append(chunk)
+        self.assertEqual(b"".join(out), data)
+
+    def test_max_length_zero(self):
+        cdata = zstd.compress(tDATA2)
+        d = zstd.decompressobj()
+        self.assertEqual(d.decompress(cdata, 0), b"")
+        self.assertEqual(d.decompress(b""), tDATA2)
+        self.assertTrue(d.eof)
+
+    def test_unused_data(self):
+        cdata = stream_compress([tDATA2])
+        d = zstd.decompressobj()
+        self.assertEqual(d.decompress(cdata + b"trailing"), tDATA2)
+        self.assertTrue(d.eof)
+        self.assertEqual(d.unused_data, b"trailing")
+        self.assertRaises(EOFError, d.decompress, b"more")
+
+    def test_flush_block_is_decodable(self):
+        c = zstd.compressobj()
+        d = zstd.decompressobj()
+        part = c.compress(tDATA1) + c.flush(zstd.FLUSH_BLOCK)
+        self.assertEqual(d.decompress(part), tDATA1)
+        self.assertFalse(d.eof)
+        self.assertEqual(d.decompress(c.flush()), b"")
+        self.assertTrue(d.eof)
+
+    def test_invalid_data(self):
+        d = zstd.decompressobj()
+        self.assertRaises(zstd.Error, d.decompress, b"not zstd data at all")
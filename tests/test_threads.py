@@ -0,0 +1,71 @@
+# -*- encoding: utf-8 -*-
+# Tests of multithreaded compression.
+
+import io
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA3
+
+# Large enough that libzstd actually splits the work into several jobs.
+tDATA_BIG = (tDATA1 * 20 + tDATA3) * 40
+
+
+class MultithreadedCompression(BaseTestZSTD):
+
+    def setUp(self):
+        if zstd.THREADS_MAX == 0:
+            self.skipTest("libzstd built without multithreading")
+
+    def test_compress(self):
+        for threads in (1, 2, 4):
+            cdata = zstd.compress(tDATA_BIG, 3, threads)
+            self.assertEqual(zstd.decompress(cdata), tDATA_BIG)
+
+    def test_compress_keyword(self):
+        cdata = zstd.compress(tDATA1, threads=2)
+        self.assertEqual(zstd.decompress(cdata), tDATA1)
+
+    def test_single_threaded_after_threaded(self):
+        # The per-thread context must not stay in multithreaded mode.
+        expected = zstd.compress(tDATA1, 5)
+        zstd.compress(tDATA_BIG, 5, threads=2)
+        self.assertEqual(zstd.compress(tDATA1, 5), expected)
+
+    def test_compressor(self):
+        c = zstd.Compressor(level=1, threads=2)
+        self.assertEqual(c.threads, 2)
+        for i in range(3):
+            self.assertEqual(zstd.decompress(c.compress(tDATA_BIG)),
+                             tDATA_BIG)
+
+    def test_compressobj(self):
+        c = zstd.compressobj(threads=3)
+        cdata = b"".join([c.compress(tDATA_BIG[i:i + 100000])
+                          for i in range(0, len(tDATA_BIG), 100000)])
+        cdata += c.flush()
+        self.assertEqual(zstd.decompressobj().decompress(cdata), tDATA_BIG)
+
+    def test_zstdfile(self):
+        bio = io.BytesIO()
+        with zstd.ZstdFile(bio, "wb", threads=2) as f:
+            f.write(tDATA_BIG)
+        bio.seek(0)
+        with zstd.ZstdFile(bio) as f:
+            self.assertEqual(f.read(), tDATA_BIG)
+
+
+class ThreadArguments(BaseTestZSTD):
+
+    def test_negative(self):
+        self.assertRaises(ValueError, zstd.compress, tDATA1, 3, -1)
+        self.assertRaises(ValueError, zstd.compressobj, 3, -1)
+
+    def test_unsupported(self):
+        if zstd.THREADS_MAX != 0:
+            self.skipTest("libzstd built with multithreading")
+        self.assertRaises(zstd.Error, zstd.compress, tDATA1, 3, 1)
+
+    def test_not_for_reading(self):
+        self.assertRaises(ValueError, zstd.ZstdFile, io.BytesIO(), "rb",
+                          threads=2)
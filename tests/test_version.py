@@ -5,7 +5,7 @@ import zstd
 
 from tests.base import BaseTestZSTD
 
-MIN_LIBRARY_VERSION_NUMBER = 1*100*100 + 3*100 + 4
+MIN_LIBRARY_VERSION_NUMBER = 1*100*100 + 4*100 + 0
 
 class VersionNumbers(BaseTestZSTD):
 
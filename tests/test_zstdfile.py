@@ -0,0 +1,146 @@
+# -*- encoding: utf-8 -*-
+# Tests of ZstdFile and zstd.open().
+
+import io
+import os
+import shutil
+import tempfile
+
+import zstd
+from tests.base import BaseTestZSTD
+from tests.test_compress import tDATA1, tDATA2, tDATA3
+
+# Enough lines to span several internal buffers.
+tLINES = [("line %d: " % i).encode("ascii") + tDATA2 + b"\n"
+          for i in range(20000)]
+tDATA_LINES = b"".join(tLINES)
+
+
+class ZstdFileTests(BaseTestZSTD):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "test.zst")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_file(self, data, **kwargs):
+        with zstd.ZstdFile(self.path, "wb", **kwargs) as f:
+            f.write(data)
+
+    def test_roundtrip(self):
+        for data in (tDATA1, tDATA3, tDATA_LINES, b""):
+            self.write_file(data)
+            with zstd.ZstdFile(self.path) as f:
+                self.assertEqual(f.read(), data)
+
+    def test_written_file_is_standard(self):
+        self.write_file(tDATA1)
+        with io.open(self.path, "rb") as f:
+            self.assertEqual(zstd.decompressobj().decompress(f.read()),
+                             tDATA1)
+
+    def test_reads_decompress_output(self):
+        with io.open(self.path, "wb") as f:
+            f.write(zstd.compress(tDATA1))
+        with zstd.open(self.path) as f:
+            self.assertEqual(f.read(), tDATA1)
+
+    def test_multiple_frames(self):
+        self.write_file(tDATA1)
+        with zstd.ZstdFile(self.path, "ab") as f:
+            f.write(tDATA2)
+        with io.open(self.path, "ab") as f:
+            f.write(zstd.compress(tDATA3))
+        with zstd.ZstdFile(self.path) as f:
+            self.assertEqual(f.read(), tDATA1 + tDATA2 + tDATA3)
+
+    def test_readinto(self):
+        self.write_file(tDATA3)
+        buf = bytearray(len(tDATA3) + 10)
+        with zstd.ZstdFile(self.path) as f:
+            n = f.readinto(buf)
+            got = bytes(buf[:n])
+            while n:
+                n = f.readinto(buf)
+                got += bytes(buf[:n])
+        self.assertEqual(got, tDATA3)
+
+    def test_line_iteration(self):
+        self.write_file(tDATA_LINES)
+        with zstd.ZstdFile(self.path) as f:
+            self.assertEqual(list(f), tLINES)
+        with zstd.ZstdFile(self.path) as f:
+            self.assertEqual(f.readline(), tLINES[0])
+            self.assertEqual(f.readline(5), tLINES[1][:5])
+
+    def test_text_mode(self):
+        text = tDATA1.decode("utf-8") + u"\n" + tDATA2.decode("utf-8")
+        with zstd.open(self.path, "wt", encoding="utf-8") as f:
+            f.write(text)
+        with zstd.open(self.path, "rt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), text)
+        with zstd.open(self.path, "rt", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_seek(self):
+        self.write_file(tDATA_LINES)
+        with zstd.ZstdFile(self.path) as f:
+            self.assertTrue(f.seekable())
+            self.assertEqual(f.seek(100000), 100000)
+            self.assertEqual(f.read(50), tDATA_LINES[100000:100050])
+            self.assertEqual(f.tell(), 100050)
+            # Forward, relative to the current position.
+            f.seek(1000, io.SEEK_CUR)
+            self.assertEqual(f.read(10), tDATA_LINES[101050:101060])
+            # Backward.
+            f.seek(10)
+            self.assertEqual(f.read(10), tDATA_LINES[10:20])
+            # Relative to the end.
+            f.seek(-10, io.SEEK_END)
+            self.assertEqual(f.read(), tDATA_LINES[-10:])
+            self.assertEqual(f.tell(), len(tDATA_LINES))
+
+    def test_file_object(self):
+        bio = io.BytesIO()
+        with zstd.ZstdFile(bio, "wb") as f:
+            f.write(tDATA1)
+        self.assertFalse(bio.closed)
+        bio.seek(0)
+        with zstd.ZstdFile(bio) as f:
+            self.assertEqual(f.read(), tDATA1)
+
+    def test_truncated(self):
+        self.write_file(tDATA3)
+        with io.open(self.path, "rb") as f:
+            cdata = f.read()
+        with zstd.ZstdFile(io.BytesIO(cdata[:-10])) as f:
+            self.assertRaises(EOFError, f.read)
+
+    def test_modes(self):
+        self.write_file(tDATA1)
+        self.assertRaises(ValueError, zstd.ZstdFile, self.path, "rw")
+        self.assertRaises(ValueError, zstd.ZstdFile, self.path, "r",
+                          level=1)
+        self.assertRaises(ValueError, zstd.open, self.path, "rb",
+                          encoding="utf-8")
+        with zstd.ZstdFile(self.path) as f:
+            self.assertTrue(f.readable())
+            self.assertFalse(f.writable())
+            self.assertRaises(io.UnsupportedOperation, f.write, b"x")
+        with zstd.ZstdFile(self.path, "w") as f:
+            self.assertFalse(f.readable())
+            self.assertRaises(io.UnsupportedOperation, f.read)
+            self.assertRaises(io.UnsupportedOperation, f.seek, 0)
+        self.assertTrue(f.closed)
+        self.assertRaises(ValueError, f.write, b"x")
+
+    def test_flush(self):
+        bio = io.BytesIO()
+        f = zstd.ZstdFile(bio, "wb")
+        f.write(tDATA1)
+        f.flush()
+        self.assertEqual(zstd.decompressobj().decompress(bio.getvalue()),
+                         tDATA1)
+        f.close()
@@ -59,14 +59,70 @@ the zstandard library.
 .. data:: CLEVEL_DEFAULT
 
     Default compression level.
+
+.. data:: THREADS_MAX
+
+    Maximum number of worker threads that may be requested with the
+    threads= argument to compress() and the compression objects.
+    Zero if the zstd library in use was built without multithreading.
+
+.. data:: FLUSH_BLOCK
+
+    Flush mode for the flush() method of compression objects: compress
+    and return all data provided so far, but keep the frame open.
+
+.. data:: FLUSH_FRAME
+
+    Flush mode for the flush() method of compression objects: end the
+    current frame.
+
+.. data:: STRATEGY_FAST
+.. data:: STRATEGY_DFAST
+.. data:: STRATEGY_GREEDY
+.. data:: STRATEGY_LAZY
+.. data:: STRATEGY_LAZY2
+.. data:: STRATEGY_BTLAZY2
+.. data:: STRATEGY_BTOPT
+.. data:: STRATEGY_BTULTRA
+.. data:: STRATEGY_BTULTRA2
+
+    Match-finding strategies, for the strategy argument to
+    CompressionParameters, from fastest to strongest.
 """
 
 from __future__ import absolute_import
 from . import _zstd
+from ._zstdfile import ZstdFile, open, compress_file, decompress_file
+from ._seekable import SeekableWriter, SeekableReader
+from ._adaptive import AdaptiveCompressor
 
 # preferred API
 compress = _zstd.compress
 decompress = _zstd.decompress
+compress_into = _zstd.compress_into
+decompress_into = _zstd.decompress_into
+compress_bound = _zstd.compress_bound
+get_frame_info = _zstd.get_frame_info
+find_frame_compressed_size = _zstd.find_frame_compressed_size
+FrameInfo = _zstd.FrameInfo
+compress_many = _zstd.compress_many
+decompress_many = _zstd.decompress_many
+decompress_iter = _zstd.decompress_iter
+Compressor = _zstd.Compressor
+Decompressor = _zstd.Decompressor
+compressobj = _zstd.compressobj
+decompressobj = _zstd.decompressobj
+CompressionParameters = _zstd.CompressionParameters
+DecompressionParameters = _zstd.DecompressionParameters
+ZstdDict = _zstd.ZstdDict
+train_dictionary = _zstd.train_dictionary
+register_dictionary = _zstd.register_dictionary
+unregister_dictionary = _zstd.unregister_dictionary
+set_dictionary_cache_size = _zstd.set_dictionary_cache_size
+dictionary_cache_usage = _zstd.dictionary_cache_usage
+enable_stats = _zstd.enable_stats
+stats = _zstd.stats
+reset_stats = _zstd.reset_stats
 
 library_version = _zstd.library_version
 library_version_number = _zstd.library_version_number
@@ -81,10 +137,41 @@ CLEVEL_MIN = _zstd.CLEVEL_MIN
 CLEVEL_MAX = _zstd.CLEVEL_MAX
 CLEVEL_DEFAULT = _zstd.CLEVEL_DEFAULT
 
-__all__ = [ "compress", "decompress",
+THREADS_MAX = _zstd.THREADS_MAX
+
+FLUSH_BLOCK = _zstd.FLUSH_BLOCK
+FLUSH_FRAME = _zstd.FLUSH_FRAME
+
+STRATEGY_FAST = _zstd.STRATEGY_FAST
+STRATEGY_DFAST = _zstd.STRATEGY_DFAST
+STRATEGY_GREEDY = _zstd.STRATEGY_GREEDY
+STRATEGY_LAZY = _zstd.STRATEGY_LAZY
+STRATEGY_LAZY2 = _zstd.STRATEGY_LAZY2
+STRATEGY_BTLAZY2 = _zstd.STRATEGY_BTLAZY2
+STRATEGY_BTOPT = _zstd.STRATEGY_BTOPT
+STRATEGY_BTULTRA = _zstd.STRATEGY_BTULTRA
+STRATEGY_BTULTRA2 = _zstd.STRATEGY_BTULTRA2
+
+__all__ = [ "compress", "decompress", "compress_into", "decompress_into",
+            "compress_bound", "compress_many", "decompress_many",
+            "decompress_iter",
+            "get_frame_info", "find_frame_compressed_size", "FrameInfo",
+            "Compressor", "Decompressor", "AdaptiveCompressor",
+            "CompressionParameters", "DecompressionParameters",
+            "compressobj", "decompressobj", "ZstdFile", "open",
+            "compress_file", "decompress_file",
+            "SeekableWriter", "SeekableReader",
+            "ZstdDict", "train_dictionary", "register_dictionary",
+            "unregister_dictionary", "set_dictionary_cache_size",
+            "dictionary_cache_usage",
+            "enable_stats", "stats", "reset_stats",
             "library_version", "library_version_number",
             "VERSION", "LIBRARY_VERSION", "LIBRARY_VERSION_NUMBER",
             "CLEVEL_MIN", "CLEVEL_MAX", "CLEVEL_DEFAULT",
+            "THREADS_MAX", "FLUSH_BLOCK", "FLUSH_FRAME",
+            "STRATEGY_FAST", "STRATEGY_DFAST", "STRATEGY_GREEDY",
+            "STRATEGY_LAZY", "STRATEGY_LAZY2", "STRATEGY_BTLAZY2",
+            "STRATEGY_BTOPT", "STRATEGY_BTULTRA", "STRATEGY_BTULTRA2",
             "Error" ]
 
 # alternative names for compatibility
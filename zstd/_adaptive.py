@@ -0,0 +1,186 @@
+# ZSTD Library Python bindings
+# Copyright (c) 2018, Sergey Dryabzhinsky and Zack Weinberg
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Compression at a level that adapts to a throughput or latency target.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import threading
+import time
+
+from . import _zstd
+
+_clock = getattr(time, "perf_counter", time.time)
+
+# Number of evaluation windows to wait, after backing off from a
+# level, before trying the higher level again.
+HOLD_WINDOWS = 8
+
+
+class AdaptiveCompressor(object):
+    """Compressor that chooses its own compression level.
+
+    Exactly one of speed and latency must be given.  speed is a target
+    compression throughput, in megabytes (10**6 bytes) per second;
+    latency is a budget for the time taken by each call to compress(),
+    in seconds.
+
+    Every window calls, the throughput or mean latency of those calls
+    is compared with the target.  If the target was missed, the level
+    is lowered by one; if it was met, the level is raised by one, to
+    use the spare time for a better compression ratio.  After backing
+    off, the compressor stays at the lower level for a while before
+    trying the higher one again, so that it does not keep oscillating
+    between a level that is fast enough and one that is not.
+
+    The level starts at level and stays between min_level and
+    max_level, which must be within CLEVEL_MIN..CLEVEL_MAX.  Level 0,
+    which means CLEVEL_DEFAULT, is skipped when stepping.  threads
+    is passed to zstd.compress().  The current level is available as
+    the level attribute, and the measurements of the last complete
+    window as speed and latency, for monitoring.
+
+    The time measured is wall-clock time, so it includes any time a
+    call spends waiting for a CPU: when the machine is busy, the
+    compressor backs off.  Objects of this class may be shared between
+    threads.
+    """
+
+    def __init__(self, speed=None, latency=None,
+                 level=_zstd.CLEVEL_DEFAULT, min_level=1,
+                 max_level=_zstd.CLEVEL_MAX, threads=0, window=16):
+        if (speed is None) == (latency is None):
+            raise ValueError("exactly one of speed and latency must be given")
+        if speed is not None and not speed > 0:
+            raise ValueError("speed must be positive")
+        if latency is not None and not latency > 0:
+            raise ValueError("latency must be positive")
+        if not (_zstd.CLEVEL_MIN <= min_level <= max_level
+                <= _zstd.CLEVEL_MAX):
+            raise ValueError("min_level and max_level must be in order "
+                             "and between %d and %d"
+                             % (_zstd.CLEVEL_MIN, _zstd.CLEVEL_MAX))
+        if level == 0:
+            level = _zstd.CLEVEL_DEFAULT
+        if not min_level <= level <= max_level:
+            raise ValueError("level must be between min_level and max_level")
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self._target_speed = speed
+        self._target_latency = latency
+        self._level = level
+        self._min_level = min_level
+        self._max_level = max_level
+        self._threads = threads
+        self._samples = collections.deque()
+        self._window = window
+        self._hold = 0
+        self._speed = None
+        self._latency = None
+        self._lock = threading.Lock()
+
+    @property
+    def level(self):
+        """The compression level currently in use."""
+        return self._level
+
+    @property
+    def speed(self):
+        """Throughput of the last complete window, in megabytes per
+        second, or None if no window has completed yet."""
+        return self._speed
+
+    @property
+    def latency(self):
+        """Mean time per call in the last complete window, in seconds,
+        or None if no window has completed yet."""
+        return self._latency
+
+    def compress(self, data):
+        """Compress data, a bytes-like object or a list or tuple of
+        them, at the current level.
+
+        Returns a complete frame, like zstd.compress().
+        """
+        if isinstance(data, (list, tuple)):
+            size = sum(memoryview(part).nbytes for part in data)
+        else:
+            size = memoryview(data).nbytes
+        level = self._level
+        start = _clock()
+        cdata = _zstd.compress(data, level, self._threads)
+        elapsed = _clock() - start
+        with self._lock:
+            self._record(level, size, elapsed)
+        return cdata
+
+    def _record(self, level, size, elapsed):
+        # Calls that started before the last change of level would
+        # skew the measurements for the new one.
+        if level != self._level:
+            return
+        self._samples.append((size, elapsed))
+        if len(self._samples) < self._window:
+            return
+
+        size = sum(s[0] for s in self._samples)
+        elapsed = sum(s[1] for s in self._samples)
+        self._latency = elapsed / len(self._samples)
+        self._speed = size / elapsed / 1e6 if elapsed > 0 else float("inf")
+        self._samples.clear()
+
+        if self._target_speed is not None:
+            met = self._speed >= self._target_speed
+        else:
+            met = self._latency <= self._target_latency
+        if not met:
+            level = _step(self._level, -1)
+            if level >= self._min_level:
+                self._level = level
+                self._hold = HOLD_WINDOWS
+        elif self._hold:
+            self._hold -= 1
+        else:
+            level = _step(self._level, 1)
+            if level <= self._max_level:
+                self._level = level
+
+
+def _step(level, delta):
+    # The level next to level in the direction of delta.  Level 0
+    # means CLEVEL_DEFAULT, not something between -1 and 1.
+    level += delta
+    if level == 0:
+        level += delta
+    return level
@@ -0,0 +1,326 @@
+# ZSTD Library Python bindings
+# Copyright (c) 2018, Sergey Dryabzhinsky and Zack Weinberg
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Reading and writing the zstd seekable format: a series of independent
+frames followed by a seek table, which records the compressed and
+uncompressed size of each frame, in a skippable frame.  Tools that do
+not know about the seek table ignore it, and decompress the frames as
+one stream; readers that do can decompress any range of the data
+without starting from the beginning.
+
+The format is described in contrib/seekable_format/zstd_seekable.md in
+the zstd sources.
+"""
+
+from __future__ import absolute_import
+
+import bisect
+import io
+import struct
+
+from . import _zstd
+from ._zstdfile import _open_file
+
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+
+# Frame header of the skippable frame, and the footer at the end of
+# the seek table.
+_HEADER = struct.Struct("<II")
+_FOOTER = struct.Struct("<IBI")
+_ENTRY = struct.Struct("<II")
+_ENTRY_CHECKSUM = struct.Struct("<III")
+
+_CHECKSUM_FLAG = 0x80
+_RESERVED_BITS = 0x7C
+
+# Sizes in the seek table are 32 bits, and the compressed form of a
+# frame can be a little larger than the uncompressed form.
+MAX_FRAME_SIZE = 1 << 31
+DEFAULT_FRAME_SIZE = 1 << 20
+
+
+class SeekableWriter(object):
+    """Writer for the zstd seekable format.
+
+    Data written is cut into frames of frame_size uncompressed bytes,
+    each compressed independently with zstd.compress(), using the
+    level, threads and params arguments.  close() writes the last,
+    possibly shorter, frame and the seek table.
+
+    filename can be either an actual file name (given as a str, bytes,
+    or PathLike object), in which case the named file is created or
+    overwritten, or it can be an existing file object to write to.
+    """
+
+    def __init__(self, filename, frame_size=DEFAULT_FRAME_SIZE,
+                 level=_zstd.CLEVEL_DEFAULT, threads=0, params=None):
+        if not 0 < frame_size <= MAX_FRAME_SIZE:
+            raise ValueError("frame_size must be between 1 and %d"
+                             % MAX_FRAME_SIZE)
+        self._frame_size = frame_size
+        self._level = level
+        self._threads = threads
+        self._params = params
+        self._pending = []
+        self._pending_size = 0
+        self._entries = []
+        self._pos = 0
+        self._fp = None
+        self._fp, self._closefp = _open_file(filename, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        """True if this writer is closed."""
+        return self._fp is None
+
+    def write(self, data):
+        """Write a bytes-like object.
+
+        Returns the number of uncompressed bytes written, which is
+        always the length of data in bytes.  Complete frames are
+        compressed and written to the file as soon as they are full.
+        """
+        if self._fp is None:
+            raise ValueError("I/O operation on closed file")
+        if not isinstance(data, (bytes, bytearray)):
+            data = memoryview(data).tobytes()
+        length = len(data)
+        start = 0
+        while start < length:
+            n = min(length - start, self._frame_size - self._pending_size)
+            self._pending.append(bytes(data[start:start + n]))
+            self._pending_size += n
+            start += n
+            if self._pending_size == self._frame_size:
+                self._write_frame()
+        self._pos += length
+        return length
+
+    def flush(self):
+        """End the current frame early, so that all data written so
+        far is in the file, and flush the underlying file.
+
+        Frames shorter than frame_size reduce the compression ratio.
+        """
+        if self._fp is None:
+            raise ValueError("I/O operation on closed file")
+        if self._pending_size:
+            self._write_frame()
+        self._fp.flush()
+
+    def tell(self):
+        """Return the number of uncompressed bytes written so far."""
+        return self._pos
+
+    def close(self):
+        """Write the last frame and the seek table, and close the file.
+
+        May be called more than once without error.
+        """
+        if self._fp is None:
+            return
+        try:
+            if self._pending_size:
+                self._write_frame()
+            self._fp.write(self._seek_table())
+        finally:
+            try:
+                if self._closefp:
+                    self._fp.close()
+            finally:
+                self._fp = None
+                self._closefp = False
+
+    def _write_frame(self):
+        data = b"".join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        cdata = _zstd.compress(data, self._level, self._threads,
+                               params=self._params)
+        self._fp.write(cdata)
+        self._entries.append((len(cdata), len(data)))
+
+    def _seek_table(self):
+        size = len(self._entries) * _ENTRY.size + _FOOTER.size
+        parts = [_HEADER.pack(SKIPPABLE_MAGIC, size)]
+        parts.extend(_ENTRY.pack(c, d) for c, d in self._entries)
+        parts.append(_FOOTER.pack(len(self._entries), 0, SEEKABLE_MAGIC))
+        return b"".join(parts)
+
+
+class SeekableReader(object):
+    """Random-access reader for the zstd seekable format.
+
+    The seek table is read when the reader is created.  read_range()
+    then decompresses only the frames that hold the requested data,
+    with zstd.decompress().  The most recently decompressed frame is
+    kept, so that a series of small reads in the same area does not
+    decompress it again.
+
+    filename can be either an actual file name (given as a str, bytes,
+    or PathLike object), in which case the named file is opened, or it
+    can be an existing file object to read from, which must support
+    seeking.
+    """
+
+    def __init__(self, filename):
+        self._fp = None
+        self._fp, self._closefp = _open_file(filename, "rb")
+        self._cached_frame = -1
+        self._cached_data = None
+        try:
+            self._read_seek_table()
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        """True if this reader is closed."""
+        return self._fp is None
+
+    @property
+    def size(self):
+        """Total size of the uncompressed data."""
+        return self._doffsets[-1]
+
+    @property
+    def num_frames(self):
+        """Number of frames in the file."""
+        return len(self._doffsets) - 1
+
+    def close(self):
+        """Close the reader, and the file if it was opened by name.
+
+        May be called more than once without error.
+        """
+        if self._fp is None:
+            return
+        try:
+            if self._closefp:
+                self._fp.close()
+        finally:
+            self._fp = None
+            self._closefp = False
+            self._cached_data = None
+
+    def read_range(self, offset, length):
+        """Return length bytes of uncompressed data, starting at
+        offset.
+
+        Returns fewer bytes if the range extends past the end of the
+        data, and b"" if offset is at or after the end.
+        """
+        if self._fp is None:
+            raise ValueError("I/O operation on closed file")
+        if offset < 0 or length < 0:
+            raise ValueError("offset and length must not be negative")
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b""
+
+        first = bisect.bisect_right(self._doffsets, offset) - 1
+        chunks = []
+        i = first
+        while self._doffsets[i] < end:
+            data = self._frame(i)
+            start = self._doffsets[i]
+            chunks.append(data[max(offset - start, 0):end - start])
+            i += 1
+        return b"".join(chunks)
+
+    def _frame(self, i):
+        if i != self._cached_frame:
+            self._fp.seek(self._coffsets[i])
+            csize = self._coffsets[i + 1] - self._coffsets[i]
+            cdata = self._fp.read(csize)
+            if len(cdata) != csize:
+                raise EOFError("Compressed file ended before the "
+                               "end of a frame")
+            data = _zstd.decompress(cdata)
+            if len(data) != self._doffsets[i + 1] - self._doffsets[i]:
+                raise _zstd.Error("Frame %d does not match the seek table"
+                                  % i)
+            self._cached_frame = i
+            self._cached_data = data
+        return self._cached_data
+
+    def _read_seek_table(self):
+        fp = self._fp
+        fp.seek(0, io.SEEK_END)
+        end = fp.tell()
+        if end < _HEADER.size + _FOOTER.size:
+            raise _zstd.Error("No seek table found")
+        fp.seek(end - _FOOTER.size)
+        nframes, descriptor, magic = _FOOTER.unpack(fp.read(_FOOTER.size))
+        if magic != SEEKABLE_MAGIC:
+            raise _zstd.Error("No seek table found")
+        if descriptor & _RESERVED_BITS:
+            raise _zstd.Error("Unsupported seek table descriptor")
+        entry = _ENTRY_CHECKSUM if descriptor & _CHECKSUM_FLAG else _ENTRY
+
+        size = nframes * entry.size + _FOOTER.size
+        table_start = end - size - _HEADER.size
+        if table_start < 0:
+            raise _zstd.Error("Seek table is truncated")
+        fp.seek(table_start)
+        raw = fp.read(size - _FOOTER.size + _HEADER.size)
+        magic, frame_size = _HEADER.unpack_from(raw)
+        if magic != SKIPPABLE_MAGIC or frame_size != size:
+            raise _zstd.Error("Seek table is corrupt")
+
+        # Cumulative offsets of the start of each frame, with the end
+        # of the data appended, so that frame i covers the range
+        # offsets[i] to offsets[i + 1].
+        coffsets = [0]
+        doffsets = [0]
+        for i in range(nframes):
+            fields = entry.unpack_from(raw, _HEADER.size + i * entry.size)
+            coffsets.append(coffsets[-1] + fields[0])
+            doffsets.append(doffsets[-1] + fields[1])
+        if coffsets[-1] != table_start:
+            raise _zstd.Error("Seek table does not match the file size")
+        self._coffsets = coffsets
+        self._doffsets = doffsets
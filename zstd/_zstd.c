@@ -33,10 +33,24 @@
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <structmember.h>
+#include <pythread.h>
+/* For ZSTD_getFrameHeader, which has been exported by every libzstd
+   since 1.4.0, though not yet declared stable.  */
+#define ZSTD_STATIC_LINKING_ONLY
 #include "zstd.h"
+#include "zdict.h"
 
-#if ZSTD_VERSION_NUMBER < 10304
-# error "python-zstd must be built using libzstd >= 1.3.4"
+#include <string.h>
+#ifdef _WIN32
+# include <windows.h>
+#else
+# include <time.h>
+# include <unistd.h>
+#endif
+
+#if ZSTD_VERSION_NUMBER < 10400
+# error "python-zstd must be built using libzstd >= 1.4.0"
 #endif
 
 #if (PY_MAJOR_VERSION == 2 && PY_MINOR_VERSION < 6) \
@@ -44,220 +58,5219 @@
 # error "python-zstd must be built using Python 2.(>=6) or 3.(>=2)"
 #endif
 
-/*
- * Portability headaches.
- */
+/*
+ * Portability headaches.
+ */
+
+/* Not all supported compilers understand the C99 'inline' keyword.  */
+
+#if !defined __STDC_VERSION__ || __STDC_VERSION < 199901L
+# if defined __SUNPRO_C || defined __hpux || defined _AIX
+#  define inline
+# elif defined _MSC_VER || defined __GNUC__
+#  define inline __inline
+# endif
+#endif
+
+#ifndef ZSTD_CLEVEL_MIN
+# define ZSTD_CLEVEL_MIN -5
+#endif
+
+#ifndef ZSTD_CLEVEL_MAX
+# define ZSTD_CLEVEL_MAX 22
+#endif
+
+#ifndef ZSTD_CLEVEL_DEFAULT
+# define ZSTD_CLEVEL_DEFAULT 3
+#endif
+
+/* Python 2/3 differences.  */
+#if PY_MAJOR_VERSION >= 3
+
+/* Module data was added in Python 3.  */
+static struct PyModuleDef ZstdModuleDef;
+struct module_state {
+    PyObject *error;
+};
+#define GETSTATE(m) ((struct module_state*)PyModule_GetState(m))
+#define ZstdError   (GETSTATE(PyState_FindModule(&ZstdModuleDef))->error)
+
+/* This is used in a few places where we specifically want the
+   "normal" string type: bytes for Py2, unicode for Py3.  */
+#define PlainString_FromString(s) PyUnicode_FromString(s)
+#define PlainString_InternFromString(s) PyUnicode_InternFromString(s)
+
+#else
+
+static PyObject *ZstdError;
+#define PlainString_FromString(s) PyString_FromString(s)
+#define PlainString_InternFromString(s) PyString_InternFromString(s)
+
+#endif
+
+
+/* This does what 3.x's "y*" argument tuple code would do, in a 2.x/3.x-
+   agnostic way.  Returns 0 on success, -1 on failure (in which case an
+   exception has been set).  As with "y*", caller is responsible for
+   calling PyBuffer_Release.  */
+static int
+obj_AsByteBuffer(PyObject *obj, Py_buffer *view)
+{
+    /* bytes objects are by far the most common input, and always
+       contiguous, so skip the general protocol for them.  */
+    if (PyBytes_CheckExact(obj))
+        return PyBuffer_FillInfo(view, obj, PyBytes_AS_STRING(obj),
+                                 PyBytes_GET_SIZE(obj), 1, PyBUF_SIMPLE);
+    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) != 0) {
+        PyErr_SetString(PyExc_TypeError, "a bytes-like object is required");
+        return -1;
+    }
+    if (!PyBuffer_IsContiguous(view, 'C')) {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_TypeError, "a contiguous buffer is required");
+        return -1;
+    }
+    return 0;
+}
+
+/* compress() and Compressor.compress() also accept a list or tuple of
+   bytes-like objects, which are compressed as if concatenated.  */
+#define IS_BUFFER_SEQUENCE(obj)                                 \
+    (!PyObject_CheckBuffer(obj) && (PyList_Check(obj) || PyTuple_Check(obj)))
+
+/* Acquire buffers, as with obj_AsByteBuffer(), for every element of
+   SEQ (a PySequence_Fast).  Returns a new array of buffers, to be
+   released with release_byte_buffers(), or NULL on failure (with an
+   exception set).  */
+static Py_buffer *
+seq_AsByteBuffers(PyObject *seq)
+{
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+    Py_ssize_t i;
+    Py_buffer *bufs;
+
+    bufs = PyMem_New(Py_buffer, n > 0 ? n : 1);
+    if (bufs == NULL) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    for (i = 0; i < n; i++) {
+        if (obj_AsByteBuffer(PySequence_Fast_GET_ITEM(seq, i), &bufs[i])) {
+            while (--i >= 0)
+                PyBuffer_Release(&bufs[i]);
+            PyMem_Free(bufs);
+            return NULL;
+        }
+    }
+    return bufs;
+}
+
+static void
+release_byte_buffers(Py_buffer *bufs, Py_ssize_t n)
+{
+    Py_ssize_t i;
+    for (i = 0; i < n; i++)
+        PyBuffer_Release(&bufs[i]);
+    PyMem_Free(bufs);
+}
+
+/* Similarly, but for a writable buffer, as with "w*".  */
+static int
+obj_AsWritableByteBuffer(PyObject *obj, Py_buffer *view)
+{
+    if (PyObject_GetBuffer(obj, view, PyBUF_WRITABLE) != 0) {
+        PyErr_SetString(PyExc_TypeError,
+                        "a writable bytes-like object is required");
+        return -1;
+    }
+    if (!PyBuffer_IsContiguous(view, 'C')) {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_TypeError, "a contiguous buffer is required");
+        return -1;
+    }
+    return 0;
+}
+
+
+/* The functions most often called with tiny inputs have METH_FASTCALL
+   entry points, which skip building an argument tuple when they are
+   called with positional arguments only.  Those entry points handle
+   the common calls themselves and hand anything else to the ordinary
+   METH_VARARGS|METH_KEYWORDS implementation with fastcall_fallback(),
+   so that the argument handling and error messages are the same.  */
+#if PY_VERSION_HEX >= 0x03070000
+#define HAVE_FASTCALL 1
+
+/* Call FN with the arguments of a METH_FASTCALL|METH_KEYWORDS call
+   converted to a tuple and a dict.  */
+static PyObject *
+fastcall_fallback(PyCFunctionWithKeywords fn, PyObject *self,
+                  PyObject *const *args, Py_ssize_t nargs,
+                  PyObject *kwnames)
+{
+    PyObject *tuple;
+    PyObject *kwds = NULL;
+    PyObject *result = NULL;
+    Py_ssize_t i;
+
+    tuple = PyTuple_New(nargs);
+    if (tuple == NULL)
+        return NULL;
+    for (i = 0; i < nargs; i++) {
+        Py_INCREF(args[i]);
+        PyTuple_SET_ITEM(tuple, i, args[i]);
+    }
+    if (kwnames != NULL && PyTuple_GET_SIZE(kwnames) > 0) {
+        kwds = PyDict_New();
+        if (kwds == NULL)
+            goto done;
+        for (i = 0; i < PyTuple_GET_SIZE(kwnames); i++) {
+            if (PyDict_SetItem(kwds, PyTuple_GET_ITEM(kwnames, i),
+                               args[nargs + i]))
+                goto done;
+        }
+    }
+    result = fn(self, tuple, kwds);
+ done:
+    Py_DECREF(tuple);
+    Py_XDECREF(kwds);
+    return result;
+}
+
+/* Convert a positional level argument for a fast path.  Returns 0 on
+   success, or -1 (without an exception) if OBJ is anything but an int
+   that fits, which the caller should leave to the fallback.  */
+static int
+fastcall_level(PyObject *obj, int *level)
+{
+    long v;
+    if (!PyLong_Check(obj))
+        return -1;
+    v = PyLong_AsLong(obj);
+    if (v == -1 && PyErr_Occurred()) {
+        PyErr_Clear();
+        return -1;
+    }
+    if (v < INT_MIN || v > INT_MAX)
+        return -1;
+    *level = (int)v;
+    return 0;
+}
+#endif
+
+
+/* Growable output buffers.  OUT describes the unused space at the end
+   of the bytes object *DST; OUT->pos is the number of bytes written so
+   far.  All of these functions must be called with the GIL held.
+   They return 0 on success, -1 on failure (with an exception set, and
+   *DST cleared).  */
+
+static int
+outbuf_init(PyObject **dst, ZSTD_outBuffer *out, size_t size)
+{
+    if (size > (size_t)PY_SSIZE_T_MAX) {
+        PyErr_NoMemory();
+        *dst = NULL;
+        return -1;
+    }
+    *dst = PyBytes_FromStringAndSize(NULL, size);
+    if (*dst == NULL)
+        return -1;
+    out->dst = PyBytes_AS_STRING(*dst);
+    out->size = size;
+    out->pos = 0;
+    return 0;
+}
+
+/* Make room for more output, roughly doubling the buffer, but not
+   making it bigger than LIMIT bytes.  The caller must check that the
+   buffer is not already LIMIT bytes long.  */
+static int
+outbuf_grow(PyObject **dst, ZSTD_outBuffer *out, size_t limit)
+{
+    size_t new_size = out->size + (out->size < 1024 ? 1024 : out->size);
+    if (new_size < out->size)
+        new_size = (size_t)-1;
+    if (new_size > limit)
+        new_size = limit;
+    if (new_size > (size_t)PY_SSIZE_T_MAX) {
+        Py_CLEAR(*dst);
+        PyErr_NoMemory();
+        return -1;
+    }
+    if (_PyBytes_Resize(dst, new_size))
+        return -1;
+    out->dst = PyBytes_AS_STRING(*dst);
+    out->size = new_size;
+    return 0;
+}
+
+/* Trim the buffer to the amount of data actually written.  */
+static int
+outbuf_finish(PyObject **dst, ZSTD_outBuffer *out)
+{
+    if (out->pos != out->size)
+        return _PyBytes_Resize(dst, out->pos);
+    return 0;
+}
+
+
+/*
+ * Runtime statistics.
+ */
+
+/* Operations for which statistics are kept.  */
+enum {
+    STATS_COMPRESS,
+    STATS_DECOMPRESS,
+    STATS_COMPRESS_STREAM,
+    STATS_DECOMPRESS_STREAM,
+    STATS_NUM_OPS
+};
+
+static const char *const stats_op_names[STATS_NUM_OPS] = {
+    "compress", "decompress", "compress_stream", "decompress_stream"
+};
+
+/* Errors are counted by libzstd's name for them.  There are far fewer
+   distinct errors than this.  */
+#define STATS_MAX_ERRORS 64
+
+typedef struct {
+    unsigned long long calls;
+    unsigned long long bytes_in;
+    unsigned long long bytes_out;
+    unsigned long long ns;
+    unsigned long long errors;
+    struct {
+        const char *name;
+        unsigned long long count;
+    } error_counts[STATS_MAX_ERRORS];
+} op_stats;
+
+/* Both are only touched with the GIL held, so need no other locking.  */
+static int stats_enabled = 0;
+static op_stats stats_table[STATS_NUM_OPS];
+
+/* A monotonic clock, in nanoseconds.  Safe to call without the GIL.  */
+static unsigned long long
+stats_clock(void)
+{
+#ifdef _WIN32
+    static LARGE_INTEGER freq;
+    LARGE_INTEGER now;
+    if (freq.QuadPart == 0)
+        QueryPerformanceFrequency(&freq);
+    QueryPerformanceCounter(&now);
+    return (unsigned long long)(now.QuadPart / freq.QuadPart) * 1000000000
+        + (unsigned long long)(now.QuadPart % freq.QuadPart) * 1000000000
+          / freq.QuadPart;
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (unsigned long long)ts.tv_sec * 1000000000 + ts.tv_nsec;
+#endif
+}
+
+/* Timing a call into libzstd:
+
+       t = stats_start();
+       Py_BEGIN_ALLOW_THREADS;
+       rv = ZSTD_something(...);
+       t = stats_elapsed(t);
+       Py_END_ALLOW_THREADS;
+       stats_record(op, t, bytes_in, bytes_out, rv);
+
+   so that the time spent waiting for the GIL is not counted.  When
+   statistics are disabled, this costs a couple of tests of a flag.  */
+static inline unsigned long long
+stats_start(void)
+{
+    return stats_enabled ? stats_clock() : 0;
+}
+
+static inline unsigned long long
+stats_elapsed(unsigned long long start)
+{
+    return start ? stats_clock() - start : 0;
+}
+
+/* Count one call of OP that took NS nanoseconds, and either consumed
+   BYTES_IN bytes and produced BYTES_OUT bytes, or failed, according
+   to libzstd's return code RV.  Must be called with the GIL held.  */
+static void
+stats_record(int op, unsigned long long ns, size_t bytes_in,
+             size_t bytes_out, size_t rv)
+{
+    op_stats *s;
+    const char *name;
+    int i;
+
+    if (!stats_enabled)
+        return;
+    s = &stats_table[op];
+    s->calls++;
+    s->ns += ns;
+    if (!ZSTD_isError(rv)) {
+        s->bytes_in += bytes_in;
+        s->bytes_out += bytes_out;
+        return;
+    }
+    s->errors++;
+    name = ZSTD_getErrorName(rv);
+    for (i = 0; i < STATS_MAX_ERRORS; i++) {
+        if (s->error_counts[i].name == NULL)
+            s->error_counts[i].name = name;
+        if (s->error_counts[i].name == name
+            || strcmp(s->error_counts[i].name, name) == 0) {
+            s->error_counts[i].count++;
+            break;
+        }
+    }
+}
+
+PyDoc_STRVAR(enable_stats_doc,
+    "enable_stats(enabled=True)\n"
+    "--\n\n"
+    "Turn the collection of statistics on or off, and return whether\n"
+    "it was on before.  Collection is off to begin with.  Turning it off\n"
+    "keeps the statistics gathered so far.");
+
+static PyObject *enable_stats(PyObject* self, PyObject *args,
+                              PyObject *kwds)
+{
+    PyObject *enabled = Py_True;
+    int was_enabled = stats_enabled;
+    int flag;
+
+    static char *kwlist[] = {"enabled", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|O:enable_stats", kwlist,
+                                     &enabled))
+        return NULL;
+    flag = PyObject_IsTrue(enabled);
+    if (flag < 0)
+        return NULL;
+    stats_enabled = flag;
+    return PyBool_FromLong(was_enabled);
+}
+
+PyDoc_STRVAR(stats_doc,
+    "stats()\n"
+    "--\n\n"
+    "Return the statistics gathered since collection was enabled with\n"
+    "enable_stats(), or since the last call to reset_stats(), as a dict\n"
+    "mapping each operation (\"compress\", \"decompress\",\n"
+    "\"compress_stream\" and \"decompress_stream\") to a dict with keys:\n"
+    "\n"
+    "calls: number of calls into libzstd; each item of a batch and each\n"
+    "    frame of multi-frame input counts separately\n"
+    "bytes_in, bytes_out: bytes consumed and produced by successful calls\n"
+    "ns: nanoseconds spent in libzstd, summed over all threads\n"
+    "errors: number of calls that failed with a libzstd error\n"
+    "error_counts: dict mapping libzstd's name for each error to the\n"
+    "    number of calls that failed with it");
+
+static PyObject *stats(PyObject* self)
+{
+    PyObject *result, *op, *errors;
+    op_stats *s;
+    int i, j;
+
+    result = PyDict_New();
+    if (result == NULL)
+        return NULL;
+    for (i = 0; i < STATS_NUM_OPS; i++) {
+        s = &stats_table[i];
+        errors = PyDict_New();
+        if (errors == NULL)
+            goto fail;
+        for (j = 0; j < STATS_MAX_ERRORS && s->error_counts[j].name; j++) {
+            PyObject *count =
+                PyLong_FromUnsignedLongLong(s->error_counts[j].count);
+            if (count == NULL
+                || PyDict_SetItemString(errors, s->error_counts[j].name,
+                                        count)) {
+                Py_XDECREF(count);
+                Py_DECREF(errors);
+                goto fail;
+            }
+            Py_DECREF(count);
+        }
+        op = Py_BuildValue("{sKsKsKsKsKsN}",
+                           "calls", s->calls,
+                           "bytes_in", s->bytes_in,
+                           "bytes_out", s->bytes_out,
+                           "ns", s->ns,
+                           "errors", s->errors,
+                           "error_counts", errors);
+        if (op == NULL)
+            goto fail;
+        if (PyDict_SetItemString(result, stats_op_names[i], op)) {
+            Py_DECREF(op);
+            goto fail;
+        }
+        Py_DECREF(op);
+    }
+    return result;
+
+ fail:
+    Py_DECREF(result);
+    return NULL;
+}
+
+PyDoc_STRVAR(reset_stats_doc,
+    "reset_stats()\n"
+    "--\n\n"
+    "Set all statistics back to zero.");
+
+static PyObject *reset_stats(PyObject* self)
+{
+    memset(stats_table, 0, sizeof stats_table);
+    Py_RETURN_NONE;
+}
+
+
+/* For use in docstrings.  */
+#define S_(x) #x
+#define S(x) S_(x)
+#define SZL S(ZSTD_CLEVEL_MIN)
+#define SZD S(ZSTD_CLEVEL_DEFAULT)
+#define SZH S(ZSTD_CLEVEL_MAX)
+
+
+/* Validate a compression level, replacing 0 with the default.
+   Returns 0 on success, -1 on failure (with an exception set).  */
+static int
+check_level(int *level)
+{
+    if (0 == *level) *level = ZSTD_CLEVEL_DEFAULT;
+    /* Fast levels (zstd >= 1.3.4) - [-1..-5] */
+    /* Usual levels                - [ 1..22] */
+    /* If level less than -5 or 1 - raise Error, level 0 handled before. */
+    if (*level < ZSTD_CLEVEL_MIN) {
+        PyErr_Format(ZstdError, "Bad compression level - less than %d: %d",
+                     ZSTD_CLEVEL_MIN, *level);
+        return -1;
+    }
+    /* If level more than 22 - raise Error. */
+    if (*level > ZSTD_CLEVEL_MAX) {
+        PyErr_Format(ZstdError, "Bad compression level - more than %d: %d",
+                     ZSTD_CLEVEL_MAX, *level);
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * Parameter objects.
+ */
+
+/* Advanced compression parameters, in the order of the keyword
+   arguments to CompressionParameters().  */
+static const struct {
+    const char *name;
+    ZSTD_cParameter param;
+} cparam_table[] = {
+    {"window_log", ZSTD_c_windowLog},
+    {"hash_log", ZSTD_c_hashLog},
+    {"chain_log", ZSTD_c_chainLog},
+    {"search_log", ZSTD_c_searchLog},
+    {"min_match", ZSTD_c_minMatch},
+    {"target_length", ZSTD_c_targetLength},
+    {"strategy", ZSTD_c_strategy},
+    {"enable_ldm", ZSTD_c_enableLongDistanceMatching},
+    {"ldm_hash_log", ZSTD_c_ldmHashLog},
+    {"ldm_min_match", ZSTD_c_ldmMinMatch},
+    {"ldm_bucket_size_log", ZSTD_c_ldmBucketSizeLog},
+    {"ldm_hash_rate_log", ZSTD_c_ldmHashRateLog},
+    {"checksum", ZSTD_c_checksumFlag},
+    {"job_size", ZSTD_c_jobSize},
+    {"overlap_log", ZSTD_c_overlapLog},
+};
+#define NUM_CPARAMS ((int)(sizeof cparam_table / sizeof cparam_table[0]))
+
+typedef struct {
+    PyObject_HEAD
+    int values[NUM_CPARAMS];    /* 0 means the libzstd default */
+} ZstdCompressionParameters;
+
+static PyTypeObject ZstdCompressionParametersType;
+
+PyDoc_STRVAR(ZstdCompressionParameters_doc,
+    "CompressionParameters(*, window_log=0, hash_log=0, chain_log=0,\n"
+    "                      search_log=0, min_match=0, target_length=0,\n"
+    "                      strategy=0, enable_ldm=False, ldm_hash_log=0,\n"
+    "                      ldm_min_match=0, ldm_bucket_size_log=0,\n"
+    "                      ldm_hash_rate_log=0, checksum=False,\n"
+    "                      job_size=0, overlap_log=0)\n"
+    "--\n\n"
+    "Advanced compression parameters, which may be passed as the params\n"
+    "argument to compress(), Compressor and compressobj().  Any\n"
+    "parameter left at zero keeps the value chosen by the compression\n"
+    "level; the others override it.  See the libzstd documentation of\n"
+    "ZSTD_cParameter for the meaning of each.  strategy is one of the\n"
+    "STRATEGY_* constants.\n"
+    "\n"
+    "Each value is checked against the range the zstd library in use\n"
+    "supports, and ValueError is raised if it is out of range.");
+
+static PyObject *
+ZstdCompressionParameters_new(PyTypeObject *type, PyObject *args,
+                              PyObject *kwds)
+{
+    ZstdCompressionParameters *self;
+    int v[NUM_CPARAMS];
+    int i;
+
+    static char *kwlist[] = {
+        "window_log", "hash_log", "chain_log", "search_log", "min_match",
+        "target_length", "strategy", "enable_ldm", "ldm_hash_log",
+        "ldm_min_match", "ldm_bucket_size_log", "ldm_hash_rate_log",
+        "checksum", "job_size", "overlap_log", NULL
+    };
+
+    if (PyTuple_GET_SIZE(args) > 0) {
+        PyErr_SetString(PyExc_TypeError, "CompressionParameters() takes "
+                        "only keyword arguments");
+        return NULL;
+    }
+    memset(v, 0, sizeof v);
+    if (!PyArg_ParseTupleAndKeywords(args, kwds,
+                                     "|iiiiiiiiiiiiiii:CompressionParameters",
+                                     kwlist, &v[0], &v[1], &v[2], &v[3],
+                                     &v[4], &v[5], &v[6], &v[7], &v[8],
+                                     &v[9], &v[10], &v[11], &v[12], &v[13],
+                                     &v[14]))
+        return NULL;
+
+    for (i = 0; i < NUM_CPARAMS; i++) {
+        ZSTD_bounds bounds;
+        if (v[i] == 0)
+            continue;
+        bounds = ZSTD_cParam_getBounds(cparam_table[i].param);
+        if (ZSTD_isError(bounds.error)) {
+            PyErr_Format(ZstdError, "%s is not supported: %s",
+                         cparam_table[i].name,
+                         ZSTD_getErrorName(bounds.error));
+            return NULL;
+        }
+        if (v[i] < bounds.lowerBound || v[i] > bounds.upperBound) {
+            PyErr_Format(PyExc_ValueError,
+                         "%s must be between %d and %d, or 0, not %d",
+                         cparam_table[i].name, bounds.lowerBound,
+                         bounds.upperBound, v[i]);
+            return NULL;
+        }
+    }
+
+    self = (ZstdCompressionParameters *)type->tp_alloc(type, 0);
+    if (self == NULL)
+        return NULL;
+    memcpy(self->values, v, sizeof v);
+    return (PyObject *)self;
+}
+
+static void
+ZstdCompressionParameters_dealloc(PyObject *self)
+{
+    Py_TYPE(self)->tp_free(self);
+}
+
+/* Check a params= argument, which may be None, and store it in *CP,
+   or NULL for None.  Returns 0 on success, -1 on failure (with an
+   exception set).  */
+static int
+check_cparams(PyObject *obj, ZstdCompressionParameters **cp)
+{
+    *cp = NULL;
+    if (obj == NULL || obj == Py_None)
+        return 0;
+    if (!PyObject_TypeCheck(obj, &ZstdCompressionParametersType)) {
+        PyErr_Format(PyExc_TypeError, "params must be a "
+                     "CompressionParameters, not %.200s",
+                     Py_TYPE(obj)->tp_name);
+        return -1;
+    }
+    *cp = (ZstdCompressionParameters *)obj;
+    return 0;
+}
+
+#define CPARAM_MEMBER(name, i, doc)                                     \
+    {name, T_INT, offsetof(ZstdCompressionParameters, values)           \
+     + (i) * sizeof(int), READONLY, doc}
+
+static PyMemberDef ZstdCompressionParameters_members[] = {
+    CPARAM_MEMBER("window_log", 0, "Log2 of the maximum back-reference "
+                  "distance."),
+    CPARAM_MEMBER("hash_log", 1, "Log2 of the size of the initial "
+                  "probe table."),
+    CPARAM_MEMBER("chain_log", 2, "Log2 of the size of the multi-probe "
+                  "search table."),
+    CPARAM_MEMBER("search_log", 3, "Log2 of the number of searches."),
+    CPARAM_MEMBER("min_match", 4, "Minimum size of matches searched for."),
+    CPARAM_MEMBER("target_length", 5, "Strategy-dependent search "
+                  "length."),
+    CPARAM_MEMBER("strategy", 6, "Match-finding strategy, one of the "
+                  "STRATEGY_* constants."),
+    CPARAM_MEMBER("enable_ldm", 7, "Whether long-distance matching is "
+                  "enabled."),
+    CPARAM_MEMBER("ldm_hash_log", 8, "Log2 of the size of the "
+                  "long-distance matching table."),
+    CPARAM_MEMBER("ldm_min_match", 9, "Minimum size of long-distance "
+                  "matches."),
+    CPARAM_MEMBER("ldm_bucket_size_log", 10, "Log2 of the size of "
+                  "long-distance matching buckets."),
+    CPARAM_MEMBER("ldm_hash_rate_log", 11, "Log2 of the frequency of "
+                  "long-distance matching table insertions."),
+    CPARAM_MEMBER("checksum", 12, "Whether a checksum of the "
+                  "uncompressed data is written."),
+    CPARAM_MEMBER("job_size", 13, "Size of each job when compressing "
+                  "with worker threads."),
+    CPARAM_MEMBER("overlap_log", 14, "Amount of overlap between jobs "
+                  "when compressing with worker threads."),
+    {NULL, 0, 0, 0, NULL}
+};
+
+static PyTypeObject ZstdCompressionParametersType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.CompressionParameters",          /* tp_name */
+    sizeof(ZstdCompressionParameters),      /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    ZstdCompressionParameters_dealloc,      /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    ZstdCompressionParameters_doc,          /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    0,                                      /* tp_methods */
+    ZstdCompressionParameters_members,      /* tp_members */
+    0,                                      /* tp_getset */
+    0,                                      /* tp_base */
+    0,                                      /* tp_dict */
+    0,                                      /* tp_descr_get */
+    0,                                      /* tp_descr_set */
+    0,                                      /* tp_dictoffset */
+    0,                                      /* tp_init */
+    0,                                      /* tp_alloc */
+    ZstdCompressionParameters_new,          /* tp_new */
+};
+
+typedef struct {
+    PyObject_HEAD
+    int window_log_max;         /* 0 means the libzstd default */
+} ZstdDecompressionParameters;
+
+static PyTypeObject ZstdDecompressionParametersType;
+
+PyDoc_STRVAR(ZstdDecompressionParameters_doc,
+    "DecompressionParameters(*, window_log_max=0)\n"
+    "--\n\n"
+    "Advanced decompression parameters, which may be passed as the\n"
+    "params argument to decompress(), Decompressor and decompressobj().\n"
+    "\n"
+    "window_log_max limits the window size, and hence the memory\n"
+    "needed, when decompressing: data compressed with a window larger\n"
+    "than 2**window_log_max bytes is rejected.  0 means the libzstd\n"
+    "default (2**27 bytes).  It must be raised to decompress data\n"
+    "compressed with a larger window_log.");
+
+static PyObject *
+ZstdDecompressionParameters_new(PyTypeObject *type, PyObject *args,
+                                PyObject *kwds)
+{
+    ZstdDecompressionParameters *self;
+    int window_log_max = 0;
+    ZSTD_bounds bounds;
+
+    static char *kwlist[] = {"window_log_max", NULL};
+    if (PyTuple_GET_SIZE(args) > 0) {
+        PyErr_SetString(PyExc_TypeError, "DecompressionParameters() takes "
+                        "only keyword arguments");
+        return NULL;
+    }
+    if (!PyArg_ParseTupleAndKeywords(args, kwds,
+                                     "|i:DecompressionParameters", kwlist,
+                                     &window_log_max))
+        return NULL;
+
+    if (window_log_max != 0) {
+        bounds = ZSTD_dParam_getBounds(ZSTD_d_windowLogMax);
+        if (window_log_max < bounds.lowerBound
+            || window_log_max > bounds.upperBound) {
+            PyErr_Format(PyExc_ValueError,
+                         "window_log_max must be between %d and %d, "
+                         "or 0, not %d", bounds.lowerBound,
+                         bounds.upperBound, window_log_max);
+            return NULL;
+        }
+    }
+
+    self = (ZstdDecompressionParameters *)type->tp_alloc(type, 0);
+    if (self == NULL)
+        return NULL;
+    self->window_log_max = window_log_max;
+    return (PyObject *)self;
+}
+
+/* Check a params= argument to a decompression function, as for
+   check_cparams().  */
+static int
+check_dparams(PyObject *obj, ZstdDecompressionParameters **dp)
+{
+    *dp = NULL;
+    if (obj == NULL || obj == Py_None)
+        return 0;
+    if (!PyObject_TypeCheck(obj, &ZstdDecompressionParametersType)) {
+        PyErr_Format(PyExc_TypeError, "params must be a "
+                     "DecompressionParameters, not %.200s",
+                     Py_TYPE(obj)->tp_name);
+        return -1;
+    }
+    *dp = (ZstdDecompressionParameters *)obj;
+    return 0;
+}
+
+/* Make DCTX accept windows of up to 2**WLOG bytes when streaming.
+   Returns 0 on success, -1 on failure (with an exception set).  */
+static int
+dctx_set_window_log_max(ZSTD_DCtx *dctx, int wlog)
+{
+    size_t rv;
+
+    rv = ZSTD_DCtx_setParameter(dctx, ZSTD_d_windowLogMax, wlog);
+    if (ZSTD_isError(rv)) {
+        PyErr_Format(ZstdError, "Decompression error: %s",
+                     ZSTD_getErrorName(rv));
+        return -1;
+    }
+    return 0;
+}
+
+/* Set the parameters in DP (which may be NULL, for the defaults) on
+   DCTX, after resetting any set previously.  Returns 0 on success, -1
+   on failure (with an exception set).  */
+static int
+dctx_set_params(ZSTD_DCtx *dctx, ZstdDecompressionParameters *dp)
+{
+    ZSTD_DCtx_reset(dctx, ZSTD_reset_session_and_parameters);
+    if (dp != NULL && dp->window_log_max != 0)
+        return dctx_set_window_log_max(dctx, dp->window_log_max);
+    return 0;
+}
+
+static PyMemberDef ZstdDecompressionParameters_members[] = {
+    {"window_log_max", T_INT,
+     offsetof(ZstdDecompressionParameters, window_log_max), READONLY,
+     "Log2 of the largest window size accepted."},
+    {NULL, 0, 0, 0, NULL}
+};
+
+static PyTypeObject ZstdDecompressionParametersType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.DecompressionParameters",        /* tp_name */
+    sizeof(ZstdDecompressionParameters),    /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    ZstdCompressionParameters_dealloc,      /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    ZstdDecompressionParameters_doc,        /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    0,                                      /* tp_methods */
+    ZstdDecompressionParameters_members,    /* tp_members */
+    0,                                      /* tp_getset */
+    0,                                      /* tp_base */
+    0,                                      /* tp_dict */
+    0,                                      /* tp_descr_get */
+    0,                                      /* tp_descr_set */
+    0,                                      /* tp_dictoffset */
+    0,                                      /* tp_init */
+    0,                                      /* tp_alloc */
+    ZstdDecompressionParameters_new,        /* tp_new */
+};
+
+
+/* Reset all of CCTX's parameters, then set the compression level,
+   number of worker threads, and any advanced parameters in CP (which
+   may be NULL).  Returns 0 on success, -1 on failure (with an exception
+   set).  */
+static int
+cctx_set_params(ZSTD_CCtx *cctx, int level, int threads,
+                ZstdCompressionParameters *cp)
+{
+    int i;
+    size_t rv;
+
+    ZSTD_CCtx_reset(cctx, ZSTD_reset_session_and_parameters);
+    rv = ZSTD_CCtx_setParameter(cctx, ZSTD_c_compressionLevel, level);
+    if (ZSTD_isError(rv)) {
+        PyErr_Format(ZstdError, "Compression error: %s",
+                     ZSTD_getErrorName(rv));
+        return -1;
+    }
+    if (threads < 0) {
+        PyErr_Format(PyExc_ValueError, "invalid number of threads: %d",
+                     threads);
+        return -1;
+    }
+    if (threads > 0) {
+        rv = ZSTD_CCtx_setParameter(cctx, ZSTD_c_nbWorkers, threads);
+        if (ZSTD_isError(rv)) {
+            if (ZSTD_cParam_getBounds(ZSTD_c_nbWorkers).upperBound == 0)
+                PyErr_SetString(ZstdError, "libzstd was built without "
+                                "multithreading support");
+            else
+                PyErr_Format(ZstdError, "Cannot use %d threads: %s",
+                             threads, ZSTD_getErrorName(rv));
+            return -1;
+        }
+    }
+    for (i = 0; cp != NULL && i < NUM_CPARAMS; i++) {
+        if (cp->values[i] == 0)
+            continue;
+        rv = ZSTD_CCtx_setParameter(cctx, cparam_table[i].param,
+                                    cp->values[i]);
+        if (ZSTD_isError(rv)) {
+            PyErr_Format(ZstdError, "Cannot set %s: %s",
+                         cparam_table[i].name, ZSTD_getErrorName(rv));
+            return -1;
+        }
+    }
+    return 0;
+}
+
+/* Releasing the GIL and taking it back costs little next to
+   compressing or decompressing a large input, but for tiny inputs it
+   is a sizeable part of the total, and when other threads want the
+   GIL, getting it back can take far longer than the job itself.  Jobs
+   smaller than this (by uncompressed size) are done with the GIL
+   held.  */
+#define SMALL_INPUT_SIZE 2048
+
+/* Like Py_BEGIN_ALLOW_THREADS and Py_END_ALLOW_THREADS, but keeping
+   the GIL for a job of SIZE bytes if that is small.  */
+#define BEGIN_ALLOW_THREADS_UNLESS_SMALL(size)          \
+    {                                                   \
+        PyThreadState *_save = NULL;                    \
+        if ((size) >= SMALL_INPUT_SIZE)                 \
+            _save = PyEval_SaveThread();
+#define END_ALLOW_THREADS_UNLESS_SMALL                  \
+        if (_save != NULL)                              \
+            PyEval_RestoreThread(_save);                \
+    }
+
+/* Inputs at least this large are compressed into an output buffer
+   that starts small and grows as needed, rather than one big enough
+   for the worst case.  The worst case is slightly larger than the
+   input, so for large inputs, allocating it up front would roughly
+   double the peak memory use, even when the data compresses well.  */
+#define LARGE_INPUT_SIZE (1 << 20)
+
+/* Compress the contents of the N buffers BUFS, in order, into a single
+   frame in a new bytes object, using CCTX with whatever parameters
+   have already been set on it.  The output starts out at 1/8 the size
+   of the input (or the worst-case size, for small inputs) and grows
+   geometrically.  The caller must ensure that no other thread is using
+   CCTX.  */
+static PyObject *
+compress_buffers(ZSTD_CCtx *cctx, Py_buffer *bufs, Py_ssize_t n)
+{
+    PyObject *dst;
+    ZSTD_inBuffer in;
+    ZSTD_outBuffer out;
+    ZSTD_EndDirective mode;
+    size_t total = 0;
+    size_t bound;
+    size_t initial;
+    size_t rv;
+    Py_ssize_t i;
+    unsigned long long t, ns = 0;
+
+    for (i = 0; i < n; i++)
+        total += (size_t)bufs[i].len;
+    bound = ZSTD_compressBound(total);
+
+    /* Record the input size in the frame header, as the one-shot
+       functions do.  */
+    ZSTD_CCtx_reset(cctx, ZSTD_reset_session_only);
+    rv = ZSTD_CCtx_setPledgedSrcSize(cctx, total);
+    if (ZSTD_isError(rv)) {
+        PyErr_Format(ZstdError, "Compression error: %s",
+                     ZSTD_getErrorName(rv));
+        return NULL;
+    }
+
+    initial = total / 8;
+    if (initial < ZSTD_CStreamOutSize())
+        initial = ZSTD_CStreamOutSize();
+    if (initial > bound)
+        initial = bound;
+    if (outbuf_init(&dst, &out, initial))
+        return NULL;
+
+    i = 0;
+    in.src = n > 0 ? bufs[0].buf : "";
+    in.size = n > 0 ? (size_t)bufs[0].len : 0;
+    in.pos = 0;
+
+    for (;;) {
+        /* Move on to the next buffer once this one is used up.  The
+           frame is ended along with the last one.  */
+        while (in.pos == in.size && i + 1 < n) {
+            i++;
+            in.src = bufs[i].buf;
+            in.size = (size_t)bufs[i].len;
+            in.pos = 0;
+        }
+        mode = i + 1 < n ? ZSTD_e_continue : ZSTD_e_end;
+
+        t = stats_start();
+        BEGIN_ALLOW_THREADS_UNLESS_SMALL(total);
+        rv = ZSTD_compressStream2(cctx, &out, &in, mode);
+        t = stats_elapsed(t);
+        END_ALLOW_THREADS_UNLESS_SMALL;
+        ns += t;
+
+        if (ZSTD_isError(rv)) {
+            stats_record(STATS_COMPRESS, ns, 0, 0, rv);
+            PyErr_Format(ZstdError, "Compression error: %s",
+                         ZSTD_getErrorName(rv));
+            ZSTD_CCtx_reset(cctx, ZSTD_reset_session_only);
+            Py_DECREF(dst);
+            return NULL;
+        }
+        if (mode == ZSTD_e_end && rv == 0) {
+            stats_record(STATS_COMPRESS, ns, total, out.pos, rv);
+            break;
+        }
+        if (out.pos == out.size
+            && outbuf_grow(&dst, &out,
+                           out.size < bound ? bound : (size_t)-1))
+            return NULL;
+    }
+
+    if (outbuf_finish(&dst, &out))
+        return NULL;
+    return dst;
+}
+
+/* Compress the contents of SRCBUF, which should be large, as for
+   compress_buffers().  */
+static PyObject *
+compress_growing(ZSTD_CCtx *cctx, Py_buffer *srcbuf)
+{
+    return compress_buffers(cctx, srcbuf, 1);
+}
+
+/* Compress the elements of SRC, a list or tuple of bytes-like objects,
+   into a single frame, as for compress_buffers().  */
+static PyObject *
+compress_sequence(ZSTD_CCtx *cctx, PyObject *src)
+{
+    PyObject *seq;
+    PyObject *dst = NULL;
+    Py_buffer *bufs;
+    Py_ssize_t n;
+
+    seq = PySequence_Fast(src, "data must be a sequence");
+    if (seq == NULL)
+        return NULL;
+    /* Another thread may change a list while the GIL is released, so
+       only the buffers acquired up front are used.  */
+    n = PySequence_Fast_GET_SIZE(seq);
+    bufs = seq_AsByteBuffers(seq);
+    if (bufs != NULL) {
+        dst = compress_buffers(cctx, bufs, n);
+        release_byte_buffers(bufs, n);
+    }
+    Py_DECREF(seq);
+    return dst;
+}
+
+/* Compress the contents of SRCBUF into a new bytes object, using CCTX
+   with whatever parameters have already been set on it.  Unless the
+   input is small, the whole job is done with the GIL released, even
+   when libzstd uses worker threads.  The caller must ensure that no
+   other thread is using CCTX.  */
+static PyObject *
+compress_with_params(ZSTD_CCtx *cctx, Py_buffer *srcbuf)
+{
+    PyObject *dst;
+    char *dst_ptr;
+    size_t dst_size;
+    size_t c_size;
+    unsigned long long t;
+
+    if (srcbuf->len >= LARGE_INPUT_SIZE)
+        return compress_growing(cctx, srcbuf);
+
+    dst_size = ZSTD_compressBound(srcbuf->len);
+    dst = PyBytes_FromStringAndSize(NULL, dst_size);
+    if (dst == NULL)
+        return NULL;
+
+    dst_ptr = PyBytes_AS_STRING(dst);
+
+    t = stats_start();
+    BEGIN_ALLOW_THREADS_UNLESS_SMALL(srcbuf->len);
+    c_size = ZSTD_compress2(cctx, dst_ptr, dst_size,
+                            srcbuf->buf, srcbuf->len);
+    t = stats_elapsed(t);
+    END_ALLOW_THREADS_UNLESS_SMALL;
+    stats_record(STATS_COMPRESS, t, srcbuf->len, c_size, c_size);
+
+    if (ZSTD_isError(c_size)) {
+        PyErr_Format(ZstdError, "Compression error: %s",
+                     ZSTD_getErrorName(c_size));
+        Py_CLEAR(dst);
+    } else {
+        _PyBytes_Resize(&dst, c_size);
+    }
+    return dst;
+}
+
+/* Compress the contents of SRCBUF into a new bytes object, using CCTX.
+   The caller must ensure that no other thread is using CCTX.  */
+static PyObject *
+compress_with_cctx(ZSTD_CCtx *cctx, Py_buffer *srcbuf, int level)
+{
+    PyObject *dst;
+    char *dst_ptr;
+    size_t dst_size;
+    size_t c_size;
+    unsigned long long t;
+
+    if (srcbuf->len >= LARGE_INPUT_SIZE) {
+        if (cctx_set_params(cctx, level, 0, NULL))
+            return NULL;
+        return compress_growing(cctx, srcbuf);
+    }
+
+    dst_size = ZSTD_compressBound(srcbuf->len);
+    dst = PyBytes_FromStringAndSize(NULL, dst_size);
+    if (dst == NULL)
+        return NULL;
+
+    dst_ptr = PyBytes_AS_STRING(dst);
+
+    t = stats_start();
+    BEGIN_ALLOW_THREADS_UNLESS_SMALL(srcbuf->len);
+    c_size = ZSTD_compressCCtx(cctx, dst_ptr, dst_size,
+                               srcbuf->buf, srcbuf->len, level);
+    t = stats_elapsed(t);
+    END_ALLOW_THREADS_UNLESS_SMALL;
+    stats_record(STATS_COMPRESS, t, srcbuf->len, c_size, c_size);
+
+    if (ZSTD_isError(c_size)) {
+        PyErr_Format(ZstdError, "Compression error: %s",
+                     ZSTD_getErrorName(c_size));
+        Py_CLEAR(dst);
+    } else {
+        _PyBytes_Resize(&dst, c_size);
+    }
+    return dst;
+}
+
+
+/*
+ * Dictionaries.
+ */
+
+/* The number of distinct compression levels, for the per-level
+   cache of digested compression dictionaries.  */
+#define NUM_CLEVELS (ZSTD_CLEVEL_MAX - ZSTD_CLEVEL_MIN + 1)
+
+typedef struct zstddict_s ZstdDict;
+struct zstddict_s {
+    PyObject_HEAD
+    PyObject *data;             /* bytes object holding the dictionary */
+    unsigned int dict_id;
+    ZSTD_DDict *ddict;          /* digested for decompression, or NULL */
+    ZSTD_CDict *cdicts[NUM_CLEVELS];  /* digested for each level, or NULL */
+    size_t digested_size;       /* memory used by ddict and cdicts */
+
+    /* Digested forms may only be freed while this is zero.  */
+    Py_ssize_t pins;
+
+    /* Registry membership, and position in the LRU list.  */
+    char registered;
+    ZstdDict *lru_prev;         /* more recently used */
+    ZstdDict *lru_next;         /* less recently used */
+};
+
+static PyTypeObject ZstdDictType;
+
+/* Registered dictionaries.  DICT_REGISTRY maps dictionary IDs to
+   ZstdDict objects.  The registered dictionaries are also kept in a
+   list, most recently used first.  When the digested forms of the
+   registered dictionaries use more than DICT_CACHE_LIMIT bytes, those
+   of the least recently used dictionaries that are not pinned are
+   freed; they are digested again if they are needed again.  All of
+   this is only touched while holding the GIL.  */
+#define DICT_CACHE_DEFAULT (32 * 1024 * 1024)
+static PyObject *dict_registry;
+static ZstdDict *dict_lru_head;
+static ZstdDict *dict_lru_tail;
+static size_t dict_cache_used = 0;
+static size_t dict_cache_limit = DICT_CACHE_DEFAULT;
+
+static void
+dict_lru_unlink(ZstdDict *d)
+{
+    if (d->lru_prev != NULL)
+        d->lru_prev->lru_next = d->lru_next;
+    else
+        dict_lru_head = d->lru_next;
+    if (d->lru_next != NULL)
+        d->lru_next->lru_prev = d->lru_prev;
+    else
+        dict_lru_tail = d->lru_prev;
+    d->lru_prev = d->lru_next = NULL;
+}
+
+static void
+dict_lru_push(ZstdDict *d)
+{
+    d->lru_prev = NULL;
+    d->lru_next = dict_lru_head;
+    if (dict_lru_head != NULL)
+        dict_lru_head->lru_prev = d;
+    else
+        dict_lru_tail = d;
+    dict_lru_head = d;
+}
+
+/* Mark D as the most recently used dictionary.  */
+static void
+zstddict_touch(ZstdDict *d)
+{
+    if (d->registered && dict_lru_head != d) {
+        dict_lru_unlink(d);
+        dict_lru_push(d);
+    }
+}
+
+/* Free all of D's digested forms.  D must not be pinned.  */
+static void
+zstddict_free_digests(ZstdDict *d)
+{
+    int i;
+    for (i = 0; i < NUM_CLEVELS; i++) {
+        if (d->cdicts[i] != NULL) {
+            ZSTD_freeCDict(d->cdicts[i]);
+            d->cdicts[i] = NULL;
+        }
+    }
+    if (d->ddict != NULL) {
+        ZSTD_freeDDict(d->ddict);
+        d->ddict = NULL;
+    }
+    if (d->registered)
+        dict_cache_used -= d->digested_size;
+    d->digested_size = 0;
+}
+
+/* Free digested forms of registered dictionaries, least recently used
+   first, until they fit in the cache.  */
+static void
+dict_cache_trim(void)
+{
+    ZstdDict *d = dict_lru_tail;
+    while (d != NULL && dict_cache_used > dict_cache_limit) {
+        if (d->pins == 0 && d->digested_size > 0)
+            zstddict_free_digests(d);
+        d = d->lru_prev;
+    }
+}
+
+/* Record that SIZE bytes more of D's digested forms exist.  */
+static void
+zstddict_add_digest(ZstdDict *d, size_t size)
+{
+    d->digested_size += size;
+    if (d->registered) {
+        dict_cache_used += size;
+        dict_cache_trim();
+    }
+}
+
+/* A dictionary must be pinned while its digested forms are in use,
+   which includes while they are in use with the GIL released, and
+   for as long as a libzstd context holds a reference to them.
+   Pinning also holds a reference to the ZstdDict itself.  */
+static void
+zstddict_pin(ZstdDict *d)
+{
+    Py_INCREF(d);
+    d->pins++;
+    zstddict_touch(d);
+}
+
+static void
+zstddict_unpin(ZstdDict *d)
+{
+    d->pins--;
+    if (d->pins == 0 && d->registered && dict_cache_used > dict_cache_limit)
+        dict_cache_trim();
+    Py_DECREF(d);
+}
+
+PyDoc_STRVAR(ZstdDict_doc,
+    "ZstdDict(data)\n"
+    "--\n\n"
+    "Compression dictionary.  data may be a dictionary produced by\n"
+    "train_dictionary() or by the zstd command line tool, or any other\n"
+    "bytes-like object, which is then used as raw content that the\n"
+    "compressed data may refer to.\n"
+    "\n"
+    "libzstd must digest a dictionary before it can be used.  This is\n"
+    "done the first time the dictionary is used for decompression, and\n"
+    "the first time it is used for compression at each level, and the\n"
+    "digested form is kept for as long as the ZstdDict exists.  Reuse\n"
+    "ZstdDict objects rather than creating a new one for each call.");
+
+static PyObject *
+ZstdDict_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    PyObject *src;
+    Py_buffer srcbuf;
+    ZstdDict *self;
+
+    static char *kwlist[] = {"data", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O:ZstdDict", kwlist, &src))
+        return NULL;
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+    if (srcbuf.len == 0) {
+        PyBuffer_Release(&srcbuf);
+        PyErr_SetString(PyExc_ValueError, "dictionary must not be empty");
+        return NULL;
+    }
+
+    self = (ZstdDict *)type->tp_alloc(type, 0);
+    if (self == NULL) {
+        PyBuffer_Release(&srcbuf);
+        return NULL;
+    }
+
+    /* Keep a private copy, unless the data is already immutable.  */
+    if (PyBytes_CheckExact(src)) {
+        Py_INCREF(src);
+        self->data = src;
+    } else {
+        self->data = PyBytes_FromStringAndSize(srcbuf.buf, srcbuf.len);
+    }
+    PyBuffer_Release(&srcbuf);
+    if (self->data == NULL) {
+        Py_DECREF(self);
+        return NULL;
+    }
+
+    self->dict_id = ZSTD_getDictID_fromDict(PyBytes_AS_STRING(self->data),
+                                            PyBytes_GET_SIZE(self->data));
+    return (PyObject *)self;
+}
+
+static void
+ZstdDict_dealloc(ZstdDict *self)
+{
+    zstddict_free_digests(self);
+    Py_XDECREF(self->data);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+/* Return SELF digested for compression at LEVEL, which must already
+   have been checked, digesting it if necessary.  Must be called with
+   the GIL held, and SELF pinned; the digested form belongs to SELF.
+   Returns NULL, with an exception set, on failure.  */
+static ZSTD_CDict *
+zstddict_cdict(ZstdDict *self, int level)
+{
+    ZSTD_CDict **slot = &self->cdicts[level - ZSTD_CLEVEL_MIN];
+    ZSTD_CDict *cdict;
+
+    if (*slot != NULL)
+        return *slot;
+
+    Py_BEGIN_ALLOW_THREADS;
+    cdict = ZSTD_createCDict(PyBytes_AS_STRING(self->data),
+                             PyBytes_GET_SIZE(self->data), level);
+    Py_END_ALLOW_THREADS;
+
+    if (cdict == NULL) {
+        PyErr_SetString(ZstdError, "Cannot digest compression dictionary");
+        return NULL;
+    }
+    /* Another thread may have got there first while the GIL was
+       released.  */
+    if (*slot != NULL) {
+        ZSTD_freeCDict(cdict);
+        return *slot;
+    }
+    *slot = cdict;
+    zstddict_add_digest(self, ZSTD_sizeof_CDict(cdict));
+    return cdict;
+}
+
+/* Likewise, for decompression.  */
+static ZSTD_DDict *
+zstddict_ddict(ZstdDict *self)
+{
+    ZSTD_DDict *ddict;
+
+    if (self->ddict != NULL)
+        return self->ddict;
+
+    Py_BEGIN_ALLOW_THREADS;
+    ddict = ZSTD_createDDict(PyBytes_AS_STRING(self->data),
+                             PyBytes_GET_SIZE(self->data));
+    Py_END_ALLOW_THREADS;
+
+    if (ddict == NULL) {
+        PyErr_SetString(ZstdError, "Cannot digest decompression dictionary");
+        return NULL;
+    }
+    if (self->ddict != NULL) {
+        ZSTD_freeDDict(ddict);
+        return self->ddict;
+    }
+    self->ddict = ddict;
+    zstddict_add_digest(self, ZSTD_sizeof_DDict(ddict));
+    return ddict;
+}
+
+/* Return the registered dictionary with ID DICT_ID, as a borrowed
+   reference, or NULL (without an exception) if there is none.  */
+static ZstdDict *
+dict_registry_get(unsigned int dict_id)
+{
+    PyObject *key;
+    PyObject *d;
+
+    if (dict_id == 0 || PyDict_Size(dict_registry) == 0)
+        return NULL;
+    key = PyLong_FromUnsignedLong(dict_id);
+    if (key == NULL) {
+        PyErr_Clear();
+        return NULL;
+    }
+    d = PyDict_GetItem(dict_registry, key);
+    Py_DECREF(key);
+    return (ZstdDict *)d;
+}
+
+/* Check a dict= argument, which may be None, a ZstdDict, or the ID of
+   a registered dictionary, and store the dictionary in *ZD, or NULL
+   for None.  If *ZD is not NULL, it has been pinned, and the caller
+   must unpin it when done.  Returns 0 on success, -1 on failure (with
+   an exception set).  */
+static int
+check_dict(PyObject *obj, ZstdDict **zd)
+{
+    *zd = NULL;
+    if (obj == NULL || obj == Py_None)
+        return 0;
+    if (PyObject_TypeCheck(obj, &ZstdDictType)) {
+        *zd = (ZstdDict *)obj;
+    } else if (PyIndex_Check(obj)) {
+        Py_ssize_t dict_id = PyNumber_AsSsize_t(obj, NULL);
+        if (dict_id == -1 && PyErr_Occurred())
+            return -1;
+        if (dict_id > 0 && (size_t)dict_id <= (unsigned int)-1)
+            *zd = dict_registry_get((unsigned int)dict_id);
+        if (*zd == NULL) {
+            PyErr_Format(ZstdError, "no dictionary registered with ID %zd",
+                         dict_id);
+            return -1;
+        }
+    } else {
+        PyErr_Format(PyExc_TypeError, "dict must be a ZstdDict or a "
+                     "dictionary ID, not %.200s", Py_TYPE(obj)->tp_name);
+        return -1;
+    }
+    zstddict_pin(*zd);
+    return 0;
+}
+
+/* Pick a registered dictionary for decompressing the frame at the
+   start of SRCBUF, if it needs one, and store it, pinned, in *ZD.
+   Returns 0 on success, -1 on failure (with an exception set).  */
+static int
+find_frame_dict(Py_buffer *srcbuf, ZstdDict **zd)
+{
+    unsigned int dict_id = ZSTD_getDictID_fromFrame(srcbuf->buf,
+                                                    srcbuf->len);
+    *zd = NULL;
+    if (dict_id == 0)
+        return 0;
+    *zd = dict_registry_get(dict_id);
+    if (*zd == NULL) {
+        PyErr_Format(ZstdError, "Decompression error: dictionary %u "
+                     "is needed, but not registered", dict_id);
+        return -1;
+    }
+    zstddict_pin(*zd);
+    return 0;
+}
+
+/* Make CCTX use ZD, digested at LEVEL, for every frame it compresses
+   until its parameters are next reset.  Call this after
+   cctx_set_params().  The caller must keep ZD pinned for that long.
+   Returns 0 on success, -1 on failure (with an exception set).  */
+static int
+cctx_ref_dict(ZSTD_CCtx *cctx, ZstdDict *zd, int level)
+{
+    ZSTD_CDict *cdict;
+    size_t rv;
+
+    cdict = zstddict_cdict(zd, level);
+    if (cdict == NULL)
+        return -1;
+    rv = ZSTD_CCtx_refCDict(cctx, cdict);
+    if (ZSTD_isError(rv)) {
+        PyErr_Format(ZstdError, "Compression error: %s",
+                     ZSTD_getErrorName(rv));
+        return -1;
+    }
+    return 0;
+}
+
+/* Log2 of a window just large enough to reach back across a prefix
+   of LEN bytes: the same size the zstd command line tool picks for
+   --patch-from.  */
+static int
+prefix_window_log(size_t len)
+{
+    int wlog = ZSTD_WINDOWLOG_MIN;
+
+    while (wlog < ZSTD_WINDOWLOG_MAX && ((size_t)1 << wlog) <= len)
+        wlog++;
+    return wlog;
+}
+
+/* Make CCTX compress its next frame as a delta against PREFIX.  If the
+   window chosen by LEVEL cannot reach back across the whole prefix, it
+   is enlarged, and long distance matching is enabled to find matches
+   that far back, unless the caller's parameters set either explicitly.
+   Call this after cctx_set_params().  PREFIX is referenced, not copied,
+   so must stay valid until the frame has been compressed.
+   Returns 0 on success, -1 on failure (with an exception set).  */
+static int
+cctx_ref_prefix(ZSTD_CCtx *cctx, Py_buffer *prefix, int level)
+{
+    int wlog = prefix_window_log(prefix->len);
+    int value;
+    size_t rv = 0;
+
+    if ((unsigned)wlog > ZSTD_getCParams(level, 0, 0).windowLog) {
+        if (!ZSTD_isError(ZSTD_CCtx_getParameter(cctx, ZSTD_c_windowLog,
+                                                 &value)) && value == 0)
+            rv = ZSTD_CCtx_setParameter(cctx, ZSTD_c_windowLog, wlog);
+        if (!ZSTD_isError(rv)
+            && !ZSTD_isError(ZSTD_CCtx_getParameter(
+                   cctx, ZSTD_c_enableLongDistanceMatching, &value))
+            && value == 0)
+            rv = ZSTD_CCtx_setParameter(
+                cctx, ZSTD_c_enableLongDistanceMatching, 1);
+    }
+    if (!ZSTD_isError(rv))
+        rv = ZSTD_CCtx_refPrefix(cctx, prefix->buf, prefix->len);
+    if (ZSTD_isError(rv)) {
+        PyErr_Format(ZstdError, "Cannot use prefix: %s",
+                     ZSTD_getErrorName(rv));
+        return -1;
+    }
+    return 0;
+}
+
+static PyMemberDef ZstdDict_members[] = {
+    {"data", T_OBJECT_EX, offsetof(ZstdDict, data), READONLY,
+     "The contents of the dictionary, as bytes."},
+    {"dict_id", T_UINT, offsetof(ZstdDict, dict_id), READONLY,
+     "The dictionary ID, or 0 for a raw content dictionary."},
+    {"digested_size", T_PYSSIZET, offsetof(ZstdDict, digested_size),
+     READONLY, "Memory used by the digested forms of the dictionary."},
+    {NULL, 0, 0, 0, NULL}
+};
+
+static PyTypeObject ZstdDictType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.ZstdDict",                       /* tp_name */
+    sizeof(ZstdDict),                       /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor)ZstdDict_dealloc,           /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    ZstdDict_doc,                           /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    0,                                      /* tp_methods */
+    ZstdDict_members,                       /* tp_members */
+    0,                                      /* tp_getset */
+    0,                                      /* tp_base */
+    0,                                      /* tp_dict */
+    0,                                      /* tp_descr_get */
+    0,                                      /* tp_descr_set */
+    0,                                      /* tp_dictoffset */
+    0,                                      /* tp_init */
+    0,                                      /* tp_alloc */
+    ZstdDict_new,                           /* tp_new */
+};
+
+PyDoc_STRVAR(train_dictionary_doc,
+    "train_dictionary(samples, size)\n"
+    "--\n\n"
+    "Train a compression dictionary of at most size bytes from a\n"
+    "sequence of bytes-like objects, and return it as a ZstdDict.\n"
+    "The samples should be typical of the data that will be compressed\n"
+    "with the dictionary; a few thousand small samples are usually\n"
+    "enough, and a dictionary of about 100 kB is a good place to start.\n"
+    "\n"
+    "Raises a zstd.Error exception if training fails, for instance\n"
+    "because there are too few samples.");
+
+static PyObject *train_dictionary(PyObject* self, PyObject *args,
+                                  PyObject *kwds)
+{
+    PyObject *src;
+    PyObject *seq;
+    PyObject *dict = NULL;
+    PyObject *result = NULL;
+    Py_buffer buf;
+    Py_ssize_t size, i, n;
+    size_t *sizes = NULL;
+    char *samples = NULL;
+    size_t total = 0, alloc = 0;
+    size_t rv;
+
+    static char *kwlist[] = {"samples", "size", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "On:train_dictionary",
+                                     kwlist, &src, &size))
+        return NULL;
+
+    if (size <= 0) {
+        PyErr_SetString(PyExc_ValueError, "size must be positive");
+        return NULL;
+    }
+
+    seq = PySequence_Fast(src, "samples must be a sequence");
+    if (seq == NULL)
+        return NULL;
+    n = PySequence_Fast_GET_SIZE(seq);
+    if ((size_t)n > (unsigned int)-1) {
+        PyErr_SetString(PyExc_ValueError, "too many samples");
+        goto done;
+    }
+
+    /* libzstd wants all the samples in one contiguous block.  */
+    sizes = PyMem_New(size_t, n > 0 ? n : 1);
+    if (sizes == NULL) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    for (i = 0; i < n; i++) {
+        if (obj_AsByteBuffer(PySequence_Fast_GET_ITEM(seq, i), &buf))
+            goto done;
+        if (total + buf.len > alloc) {
+            char *grown;
+            alloc = total + buf.len;
+            if (alloc < 2 * total)
+                alloc = 2 * total;
+            grown = PyMem_Realloc(samples, alloc);
+            if (grown == NULL) {
+                PyBuffer_Release(&buf);
+                PyErr_NoMemory();
+                goto done;
+            }
+            samples = grown;
+        }
+        memcpy(samples + total, buf.buf, buf.len);
+        sizes[i] = buf.len;
+        total += buf.len;
+        PyBuffer_Release(&buf);
+    }
+
+    dict = PyBytes_FromStringAndSize(NULL, size);
+    if (dict == NULL)
+        goto done;
+
+    Py_BEGIN_ALLOW_THREADS;
+    rv = ZDICT_trainFromBuffer(PyBytes_AS_STRING(dict), size,
+                               samples, sizes, (unsigned int)n);
+    Py_END_ALLOW_THREADS;
+
+    if (ZDICT_isError(rv)) {
+        PyErr_Format(ZstdError, "Cannot train dictionary: %s",
+                     ZDICT_getErrorName(rv));
+        goto done;
+    }
+    if (_PyBytes_Resize(&dict, rv))
+        goto done;
+
+    result = PyObject_CallFunctionObjArgs((PyObject *)&ZstdDictType,
+                                          dict, NULL);
+
+ done:
+    Py_XDECREF(dict);
+    PyMem_Free(samples);
+    PyMem_Free(sizes);
+    Py_DECREF(seq);
+    return result;
+}
+
+
+/* Remove D from the registry's LRU list.  The caller is responsible
+   for removing it from DICT_REGISTRY.  */
+static void
+dict_registry_forget(ZstdDict *d)
+{
+    dict_lru_unlink(d);
+    dict_cache_used -= d->digested_size;
+    d->registered = 0;
+}
+
+PyDoc_STRVAR(register_dictionary_doc,
+    "register_dictionary(dict)\n"
+    "--\n\n"
+    "Register a ZstdDict under its dictionary ID.  decompress() and\n"
+    "Decompressor objects then use it automatically for compressed data\n"
+    "whose frame header names that ID, and the ID may be passed as the\n"
+    "dict argument instead of the ZstdDict.  A dictionary registered\n"
+    "earlier with the same ID is replaced.\n"
+    "\n"
+    "The digested forms of registered dictionaries are kept within the\n"
+    "limit set by set_dictionary_cache_size(), by freeing those of the\n"
+    "least recently used dictionaries; they are digested again if they\n"
+    "are needed again.");
+
+static PyObject *register_dictionary(PyObject* self, PyObject *arg)
+{
+    ZstdDict *d, *old;
+    PyObject *key;
+    int rv;
+
+    if (!PyObject_TypeCheck(arg, &ZstdDictType)) {
+        PyErr_Format(PyExc_TypeError, "dict must be a ZstdDict, not %.200s",
+                     Py_TYPE(arg)->tp_name);
+        return NULL;
+    }
+    d = (ZstdDict *)arg;
+    if (d->dict_id == 0) {
+        PyErr_SetString(PyExc_ValueError, "a raw content dictionary has "
+                        "no dictionary ID, and cannot be registered");
+        return NULL;
+    }
+
+    old = dict_registry_get(d->dict_id);
+    if (old == d) {
+        zstddict_touch(d);
+        Py_RETURN_NONE;
+    }
+
+    key = PyLong_FromUnsignedLong(d->dict_id);
+    if (key == NULL)
+        return NULL;
+    /* Replacing the old entry may drop the last reference to it.  */
+    Py_XINCREF(old);
+    rv = PyDict_SetItem(dict_registry, key, arg);
+    Py_DECREF(key);
+    if (rv) {
+        Py_XDECREF(old);
+        return NULL;
+    }
+    if (old != NULL) {
+        dict_registry_forget(old);
+        Py_DECREF(old);
+    }
+
+    d->registered = 1;
+    dict_lru_push(d);
+    dict_cache_used += d->digested_size;
+    dict_cache_trim();
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(unregister_dictionary_doc,
+    "unregister_dictionary(dict_id)\n"
+    "--\n\n"
+    "Remove the dictionary with ID dict_id from the registry.\n"
+    "Raises KeyError if there is no such dictionary.");
+
+static PyObject *unregister_dictionary(PyObject* self, PyObject *args)
+{
+    unsigned long dict_id;
+    ZstdDict *d = NULL;
+    PyObject *key;
+    int rv;
+
+    if (!PyArg_ParseTuple(args, "k:unregister_dictionary", &dict_id))
+        return NULL;
+
+    if (dict_id <= (unsigned int)-1)
+        d = dict_registry_get((unsigned int)dict_id);
+    if (d == NULL) {
+        PyErr_Format(PyExc_KeyError, "no dictionary registered with ID %lu",
+                     dict_id);
+        return NULL;
+    }
+
+    key = PyLong_FromUnsignedLong(dict_id);
+    if (key == NULL)
+        return NULL;
+    Py_INCREF(d);
+    rv = PyDict_DelItem(dict_registry, key);
+    Py_DECREF(key);
+    if (rv == 0)
+        dict_registry_forget(d);
+    Py_DECREF(d);
+    if (rv)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(set_dictionary_cache_size_doc,
+    "set_dictionary_cache_size(size)\n"
+    "--\n\n"
+    "Set the amount of memory, in bytes, that the digested forms of\n"
+    "registered dictionaries may use.  The default is 32 MiB.  The\n"
+    "limit may be exceeded while dictionaries are in use.");
+
+static PyObject *set_dictionary_cache_size(PyObject* self, PyObject *args)
+{
+    Py_ssize_t size;
+
+    if (!PyArg_ParseTuple(args, "n:set_dictionary_cache_size", &size))
+        return NULL;
+    if (size < 0) {
+        PyErr_SetString(PyExc_ValueError, "size must not be negative");
+        return NULL;
+    }
+    dict_cache_limit = (size_t)size;
+    dict_cache_trim();
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(dictionary_cache_usage_doc,
+    "dictionary_cache_usage()\n"
+    "--\n\n"
+    "Return a tuple (used, limit): the amount of memory, in bytes,\n"
+    "used by the digested forms of registered dictionaries, and the\n"
+    "limit set by set_dictionary_cache_size().");
+
+static PyObject *dictionary_cache_usage(PyObject* self)
+{
+    return Py_BuildValue("(nn)", (Py_ssize_t)dict_cache_used,
+                         (Py_ssize_t)dict_cache_limit);
+}
+
+
+/*
+ * Compressor objects.
+ */
+
+typedef struct {
+    PyObject_HEAD
+    ZSTD_CCtx *cctx;
+    int level;
+    int threads;
+    PyObject *dict;             /* ZstdDict in use, or NULL */
+    PyObject *params;           /* CompressionParameters, or NULL */
+    PyThread_type_lock lock;
+} ZstdCompressor;
+
+static PyTypeObject ZstdCompressorType;
+
+/* Compressor and Decompressor objects may be shared between threads,
+   but a libzstd context may only be used by one thread at a time.  */
+#define ENTER_ZSTD(obj) do {                                    \
+        if (!PyThread_acquire_lock((obj)->lock, 0)) {           \
+            Py_BEGIN_ALLOW_THREADS;                             \
+            PyThread_acquire_lock((obj)->lock, 1);              \
+            Py_END_ALLOW_THREADS;                               \
+        }                                                       \
+    } while (0)
+#define LEAVE_ZSTD(obj) PyThread_release_lock((obj)->lock)
+
+/* Key under which each thread's cached compression context is stored
+   in its thread-state dictionary.  */
+static PyObject *thread_cctx_key;
+
+/* Return a compression context for the exclusive use of the calling
+   thread, creating it if necessary.  The context is freed when the
+   thread exits.  Returns NULL, with an exception set, on failure.  */
+static ZSTD_CCtx *
+get_thread_cctx(void)
+{
+    PyObject *tdict;
+    ZstdCompressor *cached;
+
+    tdict = PyThreadState_GetDict();
+    if (tdict == NULL) {
+        PyErr_SetString(PyExc_RuntimeError, "no thread state dictionary");
+        return NULL;
+    }
+
+    cached = (ZstdCompressor *)PyDict_GetItem(tdict, thread_cctx_key);
+    if (cached != NULL)
+        return cached->cctx;
+
+    cached = PyObject_New(ZstdCompressor, &ZstdCompressorType);
+    if (cached == NULL)
+        return NULL;
+    cached->level = ZSTD_CLEVEL_DEFAULT;
+    cached->threads = 0;
+    cached->dict = NULL;
+    cached->params = NULL;
+    cached->lock = NULL;
+    cached->cctx = ZSTD_createCCtx();
+    if (cached->cctx == NULL) {
+        Py_DECREF(cached);
+        PyErr_NoMemory();
+        return NULL;
+    }
+    if (PyDict_SetItem(tdict, thread_cctx_key, (PyObject *)cached)) {
+        Py_DECREF(cached);
+        return NULL;
+    }
+    /* The thread-state dictionary now holds the only reference.  */
+    Py_DECREF(cached);
+    return cached->cctx;
+}
+
+/* Take the calling thread's cached compression context, as above, for
+   a job that runs Python code while using it, such as calling a write
+   callable.  That code might call compress() itself, so the context is
+   removed from the cache until thread_cctx_put_back() returns it, and
+   any such call gets a context of its own meanwhile.  Returns a new
+   reference to the object holding the context, or NULL with an
+   exception set.  */
+static ZstdCompressor *
+thread_cctx_take(void)
+{
+    PyObject *tdict;
+    ZstdCompressor *cached;
+
+    if (get_thread_cctx() == NULL)
+        return NULL;
+    tdict = PyThreadState_GetDict();
+    cached = (ZstdCompressor *)PyDict_GetItem(tdict, thread_cctx_key);
+    Py_INCREF(cached);
+    if (PyDict_DelItem(tdict, thread_cctx_key)) {
+        Py_DECREF(cached);
+        return NULL;
+    }
+    return cached;
+}
+
+/* Return a context taken by thread_cctx_take() to the cache, consuming
+   the reference.  Any exception already set is preserved.  */
+static void
+thread_cctx_put_back(ZstdCompressor *cached)
+{
+    PyObject *tdict;
+    PyObject *type, *value, *tb;
+
+    ZSTD_CCtx_reset(cached->cctx, ZSTD_reset_session_and_parameters);
+    PyErr_Fetch(&type, &value, &tb);
+    tdict = PyThreadState_GetDict();
+    if (tdict != NULL
+        && PyDict_SetItem(tdict, thread_cctx_key, (PyObject *)cached))
+        PyErr_Clear();
+    PyErr_Restore(type, value, tb);
+    Py_DECREF(cached);
+}
+
+PyDoc_STRVAR(compress_doc,
+    "compress(data, level="SZD", threads=0, dict=None, params=None,\n"
+    "         prefix=None)\n"
+    "--\n\n"
+    "Compress data and return the compressed form.\n"
+    "data may also be a list or tuple of bytes-like objects, which are\n"
+    "compressed into a single frame as if concatenated, without copying\n"
+    "them into one buffer first.\n"
+    "The compression level may be from "SZL" (fastest) to "SZH" (slowest).\n"
+    "The default is "SZD".  level=0 is the same as level="SZD".\n"
+    "\n"
+    "If threads is nonzero, libzstd compresses using that many worker\n"
+    "threads, in addition to the calling thread.  This only speeds up\n"
+    "large inputs, and only works if libzstd was built with\n"
+    "multithreading support (see THREADS_MAX).\n"
+    "\n"
+    "If dict is a ZstdDict, compress using that dictionary.  The same\n"
+    "dictionary must be passed to decompress().\n"
+    "\n"
+    "params may be a CompressionParameters object, to fine-tune the\n"
+    "settings chosen by the compression level.\n"
+    "\n"
+    "If prefix is a bytes-like object, data is compressed as a delta\n"
+    "against it, typically a previous version of the same data.  The\n"
+    "window is enlarged to cover the whole prefix if need be.  The same\n"
+    "prefix must be passed to decompress().  prefix cannot be combined\n"
+    "with dict.\n"
+    "\n"
+    "Raises a zstd.Error exception if any error occurs.");
+
+/* The body of compress(), once the arguments have been parsed.
+   DICT, PARAMS and PREFIX may be NULL.  */
+static PyObject *
+do_compress(PyObject *src, int level, int threads, PyObject *dict,
+            PyObject *params, PyObject *prefix)
+{
+    Py_buffer srcbuf;
+    Py_buffer prefixbuf;
+    PyObject *dst = NULL;
+    ZstdDict *zd;
+    ZstdCompressionParameters *cp;
+    ZSTD_CCtx *cctx = NULL;
+    int have_prefix = (prefix != NULL && prefix != Py_None);
+    int plain;
+
+    if (check_level(&level) || check_cparams(params, &cp)
+        || check_dict(dict, &zd))
+        return NULL;
+    if (have_prefix) {
+        if (zd != NULL) {
+            PyErr_SetString(PyExc_ValueError,
+                            "dict and prefix cannot be used together");
+            have_prefix = 0;
+            goto done;
+        }
+        if (obj_AsByteBuffer(prefix, &prefixbuf)) {
+            have_prefix = 0;
+            goto done;
+        }
+    }
+    plain = (threads == 0 && zd == NULL && cp == NULL && !have_prefix);
+
+    cctx = get_thread_cctx();
+    if (cctx == NULL)
+        goto done;
+
+    if (!plain) {
+        if (cctx_set_params(cctx, level, threads, cp))
+            goto done;
+        if (zd != NULL && cctx_ref_dict(cctx, zd, level))
+            goto done;
+        if (have_prefix && cctx_ref_prefix(cctx, &prefixbuf, level))
+            goto done;
+    }
+
+    if (IS_BUFFER_SEQUENCE(src)) {
+        if (plain && cctx_set_params(cctx, level, 0, NULL))
+            goto done;
+        dst = compress_sequence(cctx, src);
+        goto done;
+    }
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        goto done;
+
+    if (plain)
+        dst = compress_with_cctx(cctx, &srcbuf, level);
+    else
+        dst = compress_with_params(cctx, &srcbuf);
+
+    PyBuffer_Release(&srcbuf);
+
+ done:
+    if (zd != NULL) {
+        /* Don't leave the thread's context referring to the digested
+           dictionary, which may be freed once it is unpinned.  */
+        if (cctx != NULL)
+            ZSTD_CCtx_refCDict(cctx, NULL);
+        zstddict_unpin(zd);
+    }
+    if (have_prefix) {
+        /* Likewise for the prefix, in case it was never used.  */
+        if (cctx != NULL)
+            ZSTD_CCtx_refPrefix(cctx, NULL, 0);
+        PyBuffer_Release(&prefixbuf);
+    }
+    return dst;
+}
+
+static PyObject *compress(PyObject* self, PyObject *args, PyObject *kwds)
+{
+    PyObject *src;
+    PyObject *dict = NULL;
+    PyObject *params = NULL;
+    PyObject *prefix = NULL;
+    int level = ZSTD_CLEVEL_DEFAULT;
+    int threads = 0;
+
+    static char *kwlist[] = {"data", "level", "threads", "dict", "params",
+                             "prefix", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|iiOOO:compress", kwlist,
+                                     &src, &level, &threads, &dict, &params,
+                                     &prefix))
+        return NULL;
+    return do_compress(src, level, threads, dict, params, prefix);
+}
+
+#ifdef HAVE_FASTCALL
+static PyObject *
+compress_fast(PyObject *self, PyObject *const *args, Py_ssize_t nargs,
+              PyObject *kwnames)
+{
+    int level = ZSTD_CLEVEL_DEFAULT;
+
+    if (kwnames == NULL && nargs >= 1 && nargs <= 2
+        && (nargs == 1 || fastcall_level(args[1], &level) == 0))
+        return do_compress(args[0], level, 0, NULL, NULL, NULL);
+    return fastcall_fallback((PyCFunctionWithKeywords)compress, self,
+                             args, nargs, kwnames);
+}
+#endif
+
+
+PyDoc_STRVAR(ZstdCompressor_doc,
+    "Compressor(level="SZD", threads=0, dict=None, params=None)\n"
+    "--\n\n"
+    "Reusable compression context.\n"
+    "Each call to the compress() method produces one complete compressed\n"
+    "frame, exactly as the module-level compress() function would, but\n"
+    "the underlying libzstd context is allocated only once.  This saves\n"
+    "time when compressing many small inputs.  The other arguments have\n"
+    "the same meaning as for compress().\n"
+    "\n"
+    "A Compressor may be shared between threads, but only one thread at\n"
+    "a time will be able to use it.");
+
+static int
+ZstdCompressor_init(ZstdCompressor *self, PyObject *args, PyObject *kwds)
+{
+    int level = ZSTD_CLEVEL_DEFAULT;
+    int threads = 0;
+    PyObject *dict = NULL;
+    PyObject *params = NULL;
+    PyObject *old_dict, *old_params;
+    ZstdDict *zd;
+    ZstdCompressionParameters *cp;
+
+    static char *kwlist[] = {"level", "threads", "dict", "params", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|iiOO:Compressor", kwlist,
+                                     &level, &threads, &dict, &params))
+        return -1;
+
+    if (check_level(&level) || check_cparams(params, &cp)
+        || check_dict(dict, &zd))
+        return -1;
+
+    if (self->lock == NULL) {
+        self->lock = PyThread_allocate_lock();
+        if (self->lock == NULL) {
+            PyErr_SetString(PyExc_MemoryError, "unable to allocate lock");
+            goto fail;
+        }
+    }
+    if (self->cctx == NULL) {
+        self->cctx = ZSTD_createCCtx();
+        if (self->cctx == NULL) {
+            PyErr_NoMemory();
+            goto fail;
+        }
+    }
+    if (threads != 0 || zd != NULL || cp != NULL) {
+        if (cctx_set_params(self->cctx, level, threads, cp))
+            goto fail;
+        if (zd != NULL && cctx_ref_dict(self->cctx, zd, level))
+            goto fail;
+    } else {
+        ZSTD_CCtx_reset(self->cctx, ZSTD_reset_session_and_parameters);
+    }
+    self->level = level;
+    self->threads = threads;
+    old_params = self->params;
+    Py_XINCREF(cp);
+    self->params = (PyObject *)cp;
+    Py_XDECREF(old_params);
+    /* The object keeps its dictionary pinned.  */
+    old_dict = self->dict;
+    self->dict = (PyObject *)zd;
+    if (old_dict != NULL)
+        zstddict_unpin((ZstdDict *)old_dict);
+    return 0;
+
+ fail:
+    if (zd != NULL)
+        zstddict_unpin(zd);
+    return -1;
+}
+
+static void
+ZstdCompressor_dealloc(ZstdCompressor *self)
+{
+    if (self->cctx != NULL)
+        ZSTD_freeCCtx(self->cctx);
+    if (self->lock != NULL)
+        PyThread_free_lock(self->lock);
+    if (self->dict != NULL)
+        zstddict_unpin((ZstdDict *)self->dict);
+    Py_XDECREF(self->params);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+PyDoc_STRVAR(ZstdCompressor_compress_doc,
+    "compress(data)\n"
+    "--\n\n"
+    "Compress data and return the compressed form.\n"
+    "data may be a list or tuple of bytes-like objects, as for the\n"
+    "module-level compress().\n"
+    "Raises a zstd.Error exception if any error occurs.");
+
+static PyObject *
+ZstdCompressor_do_compress(ZstdCompressor *self, PyObject *src)
+{
+    Py_buffer srcbuf;
+    PyObject *dst;
+
+    if (self->cctx == NULL) {
+        PyErr_SetString(PyExc_ValueError, "Compressor is not initialized");
+        return NULL;
+    }
+
+    if (IS_BUFFER_SEQUENCE(src)) {
+        ENTER_ZSTD(self);
+        if (self->threads == 0 && self->dict == NULL && self->params == NULL
+            && cctx_set_params(self->cctx, self->level, 0, NULL))
+            dst = NULL;
+        else
+            dst = compress_sequence(self->cctx, src);
+        LEAVE_ZSTD(self);
+        return dst;
+    }
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    ENTER_ZSTD(self);
+    if (self->threads == 0 && self->dict == NULL && self->params == NULL)
+        dst = compress_with_cctx(self->cctx, &srcbuf, self->level);
+    else
+        dst = compress_with_params(self->cctx, &srcbuf);
+    LEAVE_ZSTD(self);
+
+    PyBuffer_Release(&srcbuf);
+    return dst;
+}
+
+static PyObject *
+ZstdCompressor_compress(ZstdCompressor *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *src;
+
+    static char *kwlist[] = {"data", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O:compress", kwlist, &src))
+        return NULL;
+    return ZstdCompressor_do_compress(self, src);
+}
+
+#ifdef HAVE_FASTCALL
+static PyObject *
+ZstdCompressor_compress_fast(ZstdCompressor *self, PyObject *const *args,
+                             Py_ssize_t nargs, PyObject *kwnames)
+{
+    if (kwnames == NULL && nargs == 1)
+        return ZstdCompressor_do_compress(self, args[0]);
+    return fastcall_fallback((PyCFunctionWithKeywords)ZstdCompressor_compress,
+                             (PyObject *)self, args, nargs, kwnames);
+}
+#endif
+
+static PyMethodDef ZstdCompressor_methods[] = {
+#ifdef HAVE_FASTCALL
+    {"compress", (PyCFunction)(void(*)(void))ZstdCompressor_compress_fast,
+     METH_FASTCALL|METH_KEYWORDS, ZstdCompressor_compress_doc},
+#else
+    {"compress", (PyCFunction)ZstdCompressor_compress,
+     METH_VARARGS|METH_KEYWORDS, ZstdCompressor_compress_doc},
+#endif
+    {NULL, NULL, 0, NULL}
+};
+
+static PyMemberDef ZstdCompressor_members[] = {
+    {"level", T_INT, offsetof(ZstdCompressor, level), READONLY,
+     "The compression level."},
+    {"threads", T_INT, offsetof(ZstdCompressor, threads), READONLY,
+     "The number of worker threads."},
+    {"dict", T_OBJECT, offsetof(ZstdCompressor, dict), READONLY,
+     "The ZstdDict in use, or None."},
+    {"params", T_OBJECT, offsetof(ZstdCompressor, params), READONLY,
+     "The CompressionParameters in use, or None."},
+    {NULL, 0, 0, 0, NULL}
+};
+
+static PyTypeObject ZstdCompressorType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.Compressor",                     /* tp_name */
+    sizeof(ZstdCompressor),                 /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor)ZstdCompressor_dealloc,     /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    ZstdCompressor_doc,                     /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    ZstdCompressor_methods,                 /* tp_methods */
+    ZstdCompressor_members,                 /* tp_members */
+    0,                                      /* tp_getset */
+    0,                                      /* tp_base */
+    0,                                      /* tp_dict */
+    0,                                      /* tp_descr_get */
+    0,                                      /* tp_descr_set */
+    0,                                      /* tp_dictoffset */
+    (initproc)ZstdCompressor_init,          /* tp_init */
+    0,                                      /* tp_alloc */
+    PyType_GenericNew,                      /* tp_new */
+};
+
+
+/*
+ * Running batches of independent jobs on several threads.
+ */
+
+/* One input and one output buffer of a batch job.  DST points into a
+   bytes object (or other buffer) allocated before the GIL is released;
+   RESULT receives the libzstd return code.  */
+typedef struct {
+    Py_buffer src;
+    char *dst;
+    size_t dst_size;
+    size_t result;
+    unsigned long long ns;      /* time taken, if statistics are enabled */
+} batch_item;
+
+/* A batch of independent jobs, shared out among the calling thread
+   and some number of helper threads.  None of the threads may touch
+   Python objects or the Python allocator while running jobs.  */
+typedef struct batch_s batch_t;
+typedef struct batch_worker_s batch_worker;
+struct batch_s {
+    batch_item *items;
+    Py_ssize_t nitems;
+    Py_ssize_t next;            /* next item to hand out */
+    int running;                /* number of helper threads not finished */
+    PyThread_type_lock mutex;   /* protects next and running */
+    PyThread_type_lock done;    /* held until all helpers are finished */
+    int timed;                  /* whether to time each item */
+
+    /* Job-specific parameters.  */
+    int level;
+    ZSTD_DDict *ddict;
+
+    /* Get the libzstd context of a helper thread, creating it if need
+       be, and process one item using a context.  */
+    void *(*worker_ctx)(batch_worker *w);
+    void (*run)(batch_t *batch, batch_item *item, void *ctx);
+};
+
+/* A helper thread.  Helper threads are kept in a pool between batches,
+   together with the libzstd contexts they have created, so that
+   starting threads and allocating contexts is not paid for again on
+   every call.  An idle helper waits to acquire WAKE; to hand it a
+   batch, set BATCH and release WAKE.  A NULL BATCH tells it to exit.  */
+struct batch_worker_s {
+    PyThread_type_lock wake;
+    batch_t *batch;
+    ZSTD_CCtx *cctx;            /* created on first use */
+    ZSTD_DCtx *dctx;            /* likewise */
+};
+
+/* The idle helpers.  The pool is only touched with the GIL held; while
+   a batch runs, the helpers it took from the pool belong to it alone.
+   At most BATCH_POOL_SIZE idle helpers are kept; any more than that
+   exit when their batch is finished.  */
+#define BATCH_POOL_SIZE 32
+static batch_worker *batch_pool[BATCH_POOL_SIZE];
+static int batch_pool_count = 0;
+#ifndef _WIN32
+/* The process the helpers belong to.  A child process created by
+   fork() has none of them, only their pool entries.  */
+static pid_t batch_pool_pid;
+#endif
+
+/* Process one item, timing it if statistics are enabled.  */
+static inline void
+batch_run_item(batch_t *batch, batch_item *item, void *ctx)
+{
+    unsigned long long t = batch->timed ? stats_clock() : 0;
+    batch->run(batch, item, ctx);
+    item->ns = stats_elapsed(t);
+}
+
+/* Process items until there are none left.  */
+static void
+batch_work(batch_t *batch, void *ctx)
+{
+    Py_ssize_t i;
+    for (;;) {
+        PyThread_acquire_lock(batch->mutex, 1);
+        i = batch->next++;
+        PyThread_release_lock(batch->mutex);
+        if (i >= batch->nitems)
+            break;
+        batch_run_item(batch, &batch->items[i], ctx);
+    }
+}
+
+/* Tell BATCH that one of its helpers has finished.  */
+static void
+batch_helper_done(batch_t *batch)
+{
+    int last;
+
+    PyThread_acquire_lock(batch->mutex, 1);
+    last = (--batch->running == 0);
+    PyThread_release_lock(batch->mutex);
+    /* After this, the batch may be freed at any moment.  */
+    if (last)
+        PyThread_release_lock(batch->done);
+}
+
+/* Body of each helper thread.  */
+static void
+batch_helper(void *arg)
+{
+    batch_worker *w = (batch_worker *)arg;
+    batch_t *batch;
+    void *ctx;
+
+    for (;;) {
+        PyThread_acquire_lock(w->wake, 1);
+        batch = w->batch;
+        if (batch == NULL)
+            break;
+        /* If no context could be created, leave the work to the
+           others; the calling thread always has a context.  */
+        ctx = batch->worker_ctx(w);
+        if (ctx != NULL)
+            batch_work(batch, ctx);
+        batch_helper_done(batch);
+    }
+
+    ZSTD_freeCCtx(w->cctx);
+    ZSTD_freeDCtx(w->dctx);
+    PyThread_free_lock(w->wake);
+    free(w);
+}
+
+/* Take a helper from the pool, or start a new one.  Returns NULL if no
+   helper could be started.  Call with the GIL held.  */
+static batch_worker *
+batch_worker_get(void)
+{
+    batch_worker *w;
+
+#ifndef _WIN32
+    if (batch_pool_count > 0 && batch_pool_pid != getpid())
+        batch_pool_count = 0;   /* abandon the parent's helpers */
+#endif
+    if (batch_pool_count > 0)
+        return batch_pool[--batch_pool_count];
+
+    /* Helpers free themselves without the GIL, so they are allocated
+       with malloc() rather than the Python allocator.  */
+    w = (batch_worker *)calloc(1, sizeof(batch_worker));
+    if (w == NULL)
+        return NULL;
+    w->wake = PyThread_allocate_lock();
+    if (w->wake == NULL) {
+        free(w);
+        return NULL;
+    }
+    PyThread_acquire_lock(w->wake, 1);
+    if (PyThread_start_new_thread(batch_helper, w) == (unsigned long)-1) {
+        PyThread_free_lock(w->wake);
+        free(w);
+        return NULL;
+    }
+    return w;
+}
+
+/* Return an idle helper to the pool, or tell it to exit if the pool is
+   full.  Call with the GIL held.  */
+static void
+batch_worker_put(batch_worker *w)
+{
+#ifndef _WIN32
+    if (batch_pool_count == 0)
+        batch_pool_pid = getpid();
+#endif
+    if (batch_pool_count < BATCH_POOL_SIZE) {
+        batch_pool[batch_pool_count++] = w;
+    } else {
+        w->batch = NULL;
+        PyThread_release_lock(w->wake);
+    }
+}
+
+/* Run all the items of BATCH, using CTX in the calling thread and up
+   to NTHREADS additional helper threads, each with its own context.
+   Must be called with the GIL held; releases it while jobs run.
+   Returns 0 on success, -1 on failure (with an exception set), in
+   which case no jobs have been run.  */
+static int
+batch_run(batch_t *batch, void *ctx, int nthreads)
+{
+    batch_worker *workers[BATCH_POOL_SIZE];
+    int i, n;
+
+    batch->next = 0;
+    batch->running = 0;
+    batch->timed = stats_enabled;
+    batch->mutex = NULL;
+    batch->done = NULL;
+
+    if (nthreads > batch->nitems - 1)
+        nthreads = (int)(batch->nitems > 0 ? batch->nitems - 1 : 0);
+    if (nthreads > BATCH_POOL_SIZE)
+        nthreads = BATCH_POOL_SIZE;
+    if (nthreads > 0) {
+        batch->mutex = PyThread_allocate_lock();
+        batch->done = PyThread_allocate_lock();
+        if (batch->mutex == NULL || batch->done == NULL) {
+            if (batch->mutex) PyThread_free_lock(batch->mutex);
+            if (batch->done) PyThread_free_lock(batch->done);
+            PyErr_SetString(PyExc_MemoryError, "unable to allocate lock");
+            return -1;
+        }
+        PyThread_acquire_lock(batch->done, 1);
+    }
+    /* Carry on with however many helpers could be had.  */
+    for (n = 0; n < nthreads; n++) {
+        workers[n] = batch_worker_get();
+        if (workers[n] == NULL)
+            break;
+    }
+
+    Py_BEGIN_ALLOW_THREADS;
+    if (n == 0) {
+        Py_ssize_t j;
+        for (j = 0; j < batch->nitems; j++)
+            batch_run_item(batch, &batch->items[j], ctx);
+    } else {
+        batch->running = n;
+        for (i = 0; i < n; i++) {
+            workers[i]->batch = batch;
+            PyThread_release_lock(workers[i]->wake);
+        }
+        batch_work(batch, ctx);
+        PyThread_acquire_lock(batch->done, 1);
+    }
+    Py_END_ALLOW_THREADS;
+
+    for (i = 0; i < n; i++)
+        batch_worker_put(workers[i]);
+    if (nthreads > 0) {
+        PyThread_release_lock(batch->done);
+        PyThread_free_lock(batch->done);
+        PyThread_free_lock(batch->mutex);
+    }
+    return 0;
+}
+
+/* Add the items of a finished batch to the statistics for OP.  */
+static void
+batch_record(batch_t *batch, int op)
+{
+    Py_ssize_t i;
+    batch_item *item;
+    for (i = 0; i < batch->nitems; i++) {
+        item = &batch->items[i];
+        stats_record(op, item->ns, item->src.len, item->result,
+                     item->result);
+    }
+}
+
+static void *
+batch_worker_cctx(batch_worker *w)
+{
+    if (w->cctx == NULL)
+        w->cctx = ZSTD_createCCtx();
+    return w->cctx;
+}
+
+static void *
+batch_worker_dctx(batch_worker *w)
+{
+    if (w->dctx == NULL)
+        w->dctx = ZSTD_createDCtx();
+    return w->dctx;
+}
+
+static void
+batch_compress_item(batch_t *batch, batch_item *item, void *ctx)
+{
+    item->result = ZSTD_compressCCtx((ZSTD_CCtx *)ctx,
+                                     item->dst, item->dst_size,
+                                     item->src.buf, item->src.len,
+                                     batch->level);
+}
+
+static void
+batch_decompress_item(batch_t *batch, batch_item *item, void *ctx)
+{
+    if (batch->ddict == NULL)
+        item->result = ZSTD_decompressDCtx((ZSTD_DCtx *)ctx,
+                                           item->dst, item->dst_size,
+                                           item->src.buf, item->src.len);
+    else
+        item->result = ZSTD_decompress_usingDDict((ZSTD_DCtx *)ctx,
+                                                  item->dst, item->dst_size,
+                                                  item->src.buf,
+                                                  item->src.len,
+                                                  batch->ddict);
+}
+
+/* Whether SRC starts with the magic number of a skippable frame.  */
+static inline int
+is_skippable_frame(const char *src, size_t len)
+{
+    const unsigned char *p = (const unsigned char *)src;
+    unsigned int magic;
+
+    if (len < 4)
+        return 0;
+    magic = p[0] | (p[1] << 8) | (p[2] << 16) | ((unsigned int)p[3] << 24);
+    return (magic & ZSTD_MAGIC_SKIPPABLE_MASK) == ZSTD_MAGIC_SKIPPABLE_START;
+}
+
+/* Limits on the output of decompress() and Decompressor, which are
+   checked against the frame headers before any output is allocated,
+   so that a small hostile input cannot make us allocate a lot of
+   memory.  MAX_OUTPUT is a limit on the total decompressed size, and
+   WINDOW_LOG_MAX on the window size of each frame; either may be 0
+   for no limit.  One-shot decompression does not need a window
+   buffer, so libzstd does not check WINDOW_LOG_MAX itself, but frames
+   with a large window are also frames with a large output.  */
+
+static int
+check_output_size(unsigned long long size, size_t max_output)
+{
+    if (max_output != 0 && size > max_output) {
+        PyErr_Format(ZstdError, "Decompression error: output would exceed "
+                     "max_output_size (%zu bytes)", max_output);
+        return -1;
+    }
+    return 0;
+}
+
+/* Check the window size of the frame at the start of SRC, which is
+   LEN bytes long.  Invalid frame headers are left for the decoder to
+   report.  */
+static int
+check_frame_window(const char *src, size_t len, int window_log_max)
+{
+    ZSTD_frameHeader zfh;
+
+    if (window_log_max == 0 || ZSTD_getFrameHeader(&zfh, src, len) != 0)
+        return 0;
+    if (zfh.frameType == ZSTD_frame
+        && zfh.windowSize > (1ULL << window_log_max)) {
+        PyErr_Format(ZstdError, "Decompression error: frame needs a "
+                     "window of %llu bytes, more than window_log_max "
+                     "(%d) allows", zfh.windowSize, window_log_max);
+        return -1;
+    }
+    return 0;
+}
+
+/* Decompress SRCBUF, which holds one or more frames, some of which do
+   not record their decompressed size, into a new bytes object that
+   starts small and grows geometrically, up to MAX_OUTPUT bytes (0 for
+   no limit).  DDICT may be NULL for no dictionary.  This decompresses
+   as a stream, so the window size limit set on DCTX applies.  DCTX is
+   left ready for another frame.  The caller must ensure that no other
+   thread is using DCTX.  */
+static PyObject *
+decompress_growing(ZSTD_DCtx *dctx, Py_buffer *srcbuf, ZSTD_DDict *ddict,
+                   size_t max_output)
+{
+    PyObject *dst = NULL;
+    ZSTD_inBuffer in;
+    ZSTD_outBuffer out;
+    size_t limit = max_output != 0 ? max_output : (size_t)PY_SSIZE_T_MAX;
+    size_t initial = ZSTD_DStreamOutSize();
+    size_t rv;
+    unsigned long long t, ns = 0;
+
+    ZSTD_DCtx_reset(dctx, ZSTD_reset_session_only);
+    if (ddict != NULL) {
+        rv = ZSTD_DCtx_refDDict(dctx, ddict);
+        if (ZSTD_isError(rv)) {
+            PyErr_Format(ZstdError, "Decompression error: %s",
+                         ZSTD_getErrorName(rv));
+            return NULL;
+        }
+    }
+
+    if (initial > limit)
+        initial = limit;
+    if (outbuf_init(&dst, &out, initial))
+        goto done;
+
+    in.src = srcbuf->buf;
+    in.size = srcbuf->len;
+    in.pos = 0;
+
+    /* As in decompress_to_writer(), output that does not fill the
+       buffer means all the input has been used up.  */
+    for (;;) {
+        t = stats_start();
+        Py_BEGIN_ALLOW_THREADS;
+        do
+            rv = ZSTD_decompressStream(dctx, &out, &in);
+        while (!ZSTD_isError(rv) && out.pos < out.size
+               && in.pos < in.size);
+        t = stats_elapsed(t);
+        Py_END_ALLOW_THREADS;
+        ns += t;
+
+        if (ZSTD_isError(rv)) {
+            stats_record(STATS_DECOMPRESS, ns, 0, 0, rv);
+            PyErr_Format(ZstdError, "Decompression error: %s",
+                         ZSTD_getErrorName(rv));
+            Py_CLEAR(dst);
+            goto done;
+        }
+        if (out.pos < out.size || (in.pos == in.size && rv == 0))
+            break;
+        if (out.size >= limit) {
+            check_output_size((unsigned long long)out.size + 1, max_output);
+            Py_CLEAR(dst);
+            goto done;
+        }
+        if (outbuf_grow(&dst, &out, limit))
+            goto done;
+    }
+
+    if (rv != 0) {
+        PyErr_SetString(ZstdError, "Compressed data ended before the "
+                        "end of a frame");
+        Py_CLEAR(dst);
+        goto done;
+    }
+    stats_record(STATS_DECOMPRESS, ns, in.pos, out.pos, 0);
+    outbuf_finish(&dst, &out);
+
+ done:
+    ZSTD_DCtx_reset(dctx, ZSTD_reset_session_only);
+    if (ddict != NULL)
+        ZSTD_DCtx_refDDict(dctx, NULL);
+    return dst;
+}
+
+/* Decompress SRCBUF, which holds several concatenated frames, into a
+   single new bytes object, sized from the frame headers.  Each frame
+   is decompressed into its own slice of the output, by DCTX in the
+   calling thread and by up to THREADS additional threads.  */
+static PyObject *
+decompress_frames(ZSTD_DCtx *dctx, Py_buffer *srcbuf, ZSTD_DDict *ddict,
+                  int threads, size_t max_output, int window_log_max)
+{
+    const char *src = (const char *)srcbuf->buf;
+    size_t len = (size_t)srcbuf->len;
+    size_t pos, size;
+    unsigned long long frame_size, total = 0;
+    Py_ssize_t i, n = 0;
+    batch_item *items;
+    batch_t batch;
+    PyObject *dst = NULL;
+    char *dst_ptr;
+
+    for (pos = 0; pos < len; pos += size) {
+        size = ZSTD_findFrameCompressedSize(src + pos, len - pos);
+        if (ZSTD_isError(size)) {
+            PyErr_Format(ZstdError, "Invalid frame at offset %zu: %s",
+                         pos, ZSTD_getErrorName(size));
+            return NULL;
+        }
+        if (!is_skippable_frame(src + pos, size))
+            n++;
+    }
+
+    items = PyMem_New(batch_item, n > 0 ? n : 1);
+    if (items == NULL)
+        return PyErr_NoMemory();
+
+    i = 0;
+    for (pos = 0; pos < len; pos += size) {
+        size = ZSTD_findFrameCompressedSize(src + pos, len - pos);
+        if (is_skippable_frame(src + pos, size))
+            continue;
+        frame_size = ZSTD_getFrameContentSize(src + pos, size);
+        if (frame_size == ZSTD_CONTENTSIZE_ERROR) {
+            PyErr_SetString(ZstdError, "compressed data is invalid");
+            goto done;
+        }
+        if (frame_size == ZSTD_CONTENTSIZE_UNKNOWN) {
+            PyMem_Free(items);
+            return decompress_growing(dctx, srcbuf, ddict, max_output);
+        }
+        if (frame_size > (unsigned long long)PY_SSIZE_T_MAX - total) {
+            PyErr_SetString(ZstdError, "decompressed data is too large "
+                            "for a bytes object");
+            goto done;
+        }
+        total += frame_size;
+        if (check_output_size(total, max_output)
+            || check_frame_window(src + pos, size, window_log_max))
+            goto done;
+        /* Only the pointer and length are used; the buffer is not
+           acquired, so must not be released.  */
+        items[i].src.buf = (void *)(src + pos);
+        items[i].src.len = (Py_ssize_t)size;
+        items[i].dst_size = (size_t)frame_size;
+        items[i].result = 0;
+        i++;
+    }
+
+    dst = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)total);
+    if (dst == NULL)
+        goto done;
+    dst_ptr = PyBytes_AS_STRING(dst);
+    for (i = 0; i < n; i++) {
+        items[i].dst = dst_ptr;
+        dst_ptr += items[i].dst_size;
+    }
+
+    batch.items = items;
+    batch.nitems = n;
+    batch.level = 0;
+    batch.ddict = ddict;
+    batch.worker_ctx = batch_worker_dctx;
+    batch.run = batch_decompress_item;
+    if (batch_run(&batch, dctx, threads)) {
+        Py_CLEAR(dst);
+        goto done;
+    }
+    batch_record(&batch, STATS_DECOMPRESS);
+
+    for (i = 0; i < n; i++) {
+        if (ZSTD_isError(items[i].result)) {
+            PyErr_Format(ZstdError, "frame %zd: Decompression error: %s",
+                         i, ZSTD_getErrorName(items[i].result));
+            Py_CLEAR(dst);
+            break;
+        }
+        if (items[i].result != items[i].dst_size) {
+            PyErr_Format(ZstdError, "frame %zd: Decompression error: "
+                         "length mismatch (expected %zu, got %zu bytes)",
+                         i, items[i].dst_size, items[i].result);
+            Py_CLEAR(dst);
+            break;
+        }
+    }
+
+ done:
+    PyMem_Free(items);
+    return dst;
+}
+
+/* Decompress the contents of SRCBUF into a new bytes object, using DCTX
+   and DDICT, which may be NULL for no dictionary.  If SRCBUF holds
+   several frames, up to THREADS additional threads may be used.
+   MAX_OUTPUT and WINDOW_LOG_MAX are limits, as for check_output_size()
+   and check_frame_window().  The caller must ensure that no other
+   thread is using DCTX.  */
+static PyObject *
+decompress_with_dctx(ZSTD_DCtx *dctx, Py_buffer *srcbuf, ZSTD_DDict *ddict,
+                     int threads, size_t max_output, int window_log_max)
+{
+    PyObject *dst;
+    char *dst_ptr;
+    size_t dst_size;
+    size_t c_size;
+    unsigned long long raw_frame_size;
+    unsigned long long t;
+
+    c_size = ZSTD_findFrameCompressedSize(srcbuf->buf, srcbuf->len);
+    if (!ZSTD_isError(c_size) && c_size < (size_t)srcbuf->len)
+        return decompress_frames(dctx, srcbuf, ddict, threads,
+                                 max_output, window_log_max);
+
+    raw_frame_size = ZSTD_getFrameContentSize(srcbuf->buf, srcbuf->len);
+    if (raw_frame_size == ZSTD_CONTENTSIZE_ERROR) {
+        PyErr_SetString(ZstdError, "compressed data is invalid");
+        return NULL;
+    }
+    if (raw_frame_size == ZSTD_CONTENTSIZE_UNKNOWN)
+        return decompress_growing(dctx, srcbuf, ddict, max_output);
+    if (raw_frame_size > (unsigned long long)PY_SSIZE_T_MAX) {
+        PyErr_SetString(ZstdError,
+                        "decompressed data is too large for a bytes object");
+        return NULL;
+    }
+    if (check_output_size(raw_frame_size, max_output)
+        || check_frame_window(srcbuf->buf, srcbuf->len, window_log_max))
+        return NULL;
+
+    dst_size = (size_t) raw_frame_size;
+    dst = PyBytes_FromStringAndSize(NULL, dst_size);
+
+    if (dst != NULL) {
+        dst_ptr = PyBytes_AS_STRING(dst);
+
+        t = stats_start();
+        BEGIN_ALLOW_THREADS_UNLESS_SMALL(dst_size);
+        if (ddict == NULL)
+            c_size = ZSTD_decompressDCtx(dctx, dst_ptr, dst_size,
+                                         srcbuf->buf, srcbuf->len);
+        else
+            c_size = ZSTD_decompress_usingDDict(dctx, dst_ptr, dst_size,
+                                                srcbuf->buf, srcbuf->len,
+                                                ddict);
+        t = stats_elapsed(t);
+        END_ALLOW_THREADS_UNLESS_SMALL;
+        stats_record(STATS_DECOMPRESS, t, srcbuf->len, c_size, c_size);
+
+        if (ZSTD_isError(c_size)) {
+            PyErr_Format(ZstdError, "Decompression error: %s",
+                         ZSTD_getErrorName(c_size));
+            Py_CLEAR(dst);
+
+        } else if (c_size != dst_size) {
+            PyErr_Format(ZstdError, "Decompression error: length mismatch "
+                         "(expected %zu, got %zu bytes)", dst_size, c_size);
+            Py_CLEAR(dst);
+        }
+    }
+    return dst;
+}
+
+/* Pool of decompression contexts for the module-level decompress().
+   Contexts are taken from and returned to the pool only while holding
+   the GIL, which is what makes this safe.  While a thread is using a
+   context, with the GIL released, no other thread can get at it.
+   The pool holds at most DCTX_POOL_SIZE idle contexts; any more than
+   that are freed when they are returned.  */
+#define DCTX_POOL_SIZE 16
+static ZSTD_DCtx *dctx_pool[DCTX_POOL_SIZE];
+static int dctx_pool_count = 0;
+
+/* Take a decompression context from the pool, or create a new one.
+   Returns NULL, with an exception set, on failure.  */
+static ZSTD_DCtx *
+dctx_pool_get(void)
+{
+    ZSTD_DCtx *dctx;
+    if (dctx_pool_count > 0)
+        return dctx_pool[--dctx_pool_count];
+
+    dctx = ZSTD_createDCtx();
+    if (dctx == NULL)
+        PyErr_NoMemory();
+    return dctx;
+}
+
+/* Return a decompression context to the pool, or free it if the pool
+   is full.  */
+static void
+dctx_pool_put(ZSTD_DCtx *dctx)
+{
+    if (dctx_pool_count < DCTX_POOL_SIZE)
+        dctx_pool[dctx_pool_count++] = dctx;
+    else
+        ZSTD_freeDCtx(dctx);
+}
+
+
+PyDoc_STRVAR(decompress_doc,
+    "decompress(data, dict=None, params=None, threads=0, max_output_size=0,\n"
+    "           prefix=None)\n"
+    "--\n\n"
+    "Decompress data and return the uncompressed form.\n"
+    "If the data was compressed using a dictionary, the same dictionary\n"
+    "must either be passed as dict, or have been registered with\n"
+    "register_dictionary(), in which case it is found automatically.\n"
+    "params may be a DecompressionParameters object; its window_log_max\n"
+    "rejects frames with a larger window.\n"
+    "\n"
+    "data may hold several concatenated frames; the result is their\n"
+    "concatenation.  If threads is nonzero, the frames are shared out\n"
+    "among the calling thread and that many additional threads.  Frames\n"
+    "that do not record their decompressed size are decompressed as a\n"
+    "stream, into an output buffer that grows as needed.\n"
+    "\n"
+    "If max_output_size is nonzero, data that would decompress to more\n"
+    "than that many bytes is rejected, before allocating the output if\n"
+    "the frames record their size.\n"
+    "\n"
+    "If the data was compressed as a delta against a prefix, the same\n"
+    "prefix must be passed here.  It applies to every frame in data.\n"
+    "\n"
+    "Raises a zstd.Error exception if any error occurs.");
+
+/* Digest PREFIX, by reference, for decompressing frames compressed
+   against it.  This is what ZSTD_DCtx_refPrefix() does internally, but
+   a DDict can be shared by all the frames and threads of one call,
+   where a referenced prefix only applies to a single frame.  Returns
+   NULL, with an exception set, on failure.  */
+static ZSTD_DDict *
+prefix_ddict(Py_buffer *prefix)
+{
+    ZSTD_DDict *ddict;
+
+    ddict = ZSTD_createDDict_advanced(prefix->buf, prefix->len,
+                                      ZSTD_dlm_byRef, ZSTD_dct_rawContent,
+                                      ZSTD_defaultCMem);
+    if (ddict == NULL)
+        PyErr_NoMemory();
+    return ddict;
+}
+
+/* The body of decompress(), once the arguments have been parsed.
+   DICT, PARAMS and PREFIX may be NULL.  */
+static PyObject *
+do_decompress(PyObject *src, PyObject *dict, PyObject *params, int threads,
+              Py_ssize_t max_output, PyObject *prefix)
+{
+    Py_buffer srcbuf;
+    Py_buffer prefixbuf;
+    PyObject *dst = NULL;
+    ZstdDict *zd;
+    ZstdDecompressionParameters *dp;
+    ZSTD_DDict *ddict = NULL;
+    ZSTD_DCtx *dctx;
+    int have_prefix = (prefix != NULL && prefix != Py_None);
+    int wlog = 0;
+
+    if (threads < 0) {
+        PyErr_Format(PyExc_ValueError, "invalid number of threads: %d",
+                     threads);
+        return NULL;
+    }
+    if (max_output < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "max_output_size must not be negative");
+        return NULL;
+    }
+    if (check_dparams(params, &dp) || check_dict(dict, &zd))
+        return NULL;
+    if (have_prefix) {
+        if (zd != NULL) {
+            PyErr_SetString(PyExc_ValueError,
+                            "dict and prefix cannot be used together");
+            have_prefix = 0;
+            goto done;
+        }
+        if (obj_AsByteBuffer(prefix, &prefixbuf)) {
+            have_prefix = 0;
+            goto done;
+        }
+        /* Frames that must be streamed need a window that reaches
+           back across the prefix, as chosen by compress().  */
+        if (dp == NULL || dp->window_log_max == 0)
+            wlog = prefix_window_log(prefixbuf.len);
+        if (wlog <= ZSTD_WINDOWLOG_LIMIT_DEFAULT)
+            wlog = 0;
+    }
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        goto done;
+
+    if (have_prefix) {
+        ddict = prefix_ddict(&prefixbuf);
+        if (ddict == NULL)
+            goto release;
+    }
+    if (!have_prefix && zd == NULL && find_frame_dict(&srcbuf, &zd))
+        goto release;
+    if (zd != NULL) {
+        ddict = zstddict_ddict(zd);
+        if (ddict == NULL)
+            goto release;
+    }
+
+    dctx = dctx_pool_get();
+    if (dctx == NULL)
+        goto release;
+
+    if ((dp == NULL || dctx_set_params(dctx, dp) == 0)
+        && (wlog == 0 || dctx_set_window_log_max(dctx, wlog) == 0))
+        dst = decompress_with_dctx(dctx, &srcbuf, ddict, threads,
+                                   (size_t)max_output,
+                                   dp != NULL ? dp->window_log_max : 0);
+
+    /* Contexts in the pool always have the default parameters.  */
+    if (dp != NULL || wlog != 0)
+        ZSTD_DCtx_reset(dctx, ZSTD_reset_session_and_parameters);
+    dctx_pool_put(dctx);
+ release:
+    PyBuffer_Release(&srcbuf);
+ done:
+    if (zd != NULL)
+        zstddict_unpin(zd);
+    if (have_prefix) {
+        if (ddict != NULL)
+            ZSTD_freeDDict(ddict);
+        PyBuffer_Release(&prefixbuf);
+    }
+    return dst;
+}
+
+static PyObject *decompress(PyObject* self, PyObject *args, PyObject *kwds)
+{
+    PyObject *src;
+    PyObject *dict = NULL;
+    PyObject *params = NULL;
+    PyObject *prefix = NULL;
+    int threads = 0;
+    Py_ssize_t max_output = 0;
+
+    static char *kwlist[] = {"data", "dict", "params", "threads",
+                             "max_output_size", "prefix", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|OOinO:decompress",
+                                     kwlist, &src, &dict, &params, &threads,
+                                     &max_output, &prefix))
+        return NULL;
+    return do_decompress(src, dict, params, threads, max_output, prefix);
+}
+
+#ifdef HAVE_FASTCALL
+static PyObject *
+decompress_fast(PyObject *self, PyObject *const *args, Py_ssize_t nargs,
+                PyObject *kwnames)
+{
+    if (kwnames == NULL && nargs == 1)
+        return do_decompress(args[0], NULL, NULL, 0, 0, NULL);
+    return fastcall_fallback((PyCFunctionWithKeywords)decompress, self,
+                             args, nargs, kwnames);
+}
+#endif
+
+
+/*
+ * Decompressor objects.
+ */
+
+typedef struct {
+    PyObject_HEAD
+    ZSTD_DCtx *dctx;
+    PyObject *dict;             /* ZstdDict in use, or NULL */
+    Py_ssize_t max_output;      /* 0 means no limit */
+    int window_log_max;         /* 0 means no limit */
+    PyThread_type_lock lock;
+} ZstdDecompressor;
+
+PyDoc_STRVAR(ZstdDecompressor_doc,
+    "Decompressor(dict=None, params=None, max_output_size=0)\n"
+    "--\n\n"
+    "Reusable decompression context.\n"
+    "Each call to the decompress() method decompresses its input, which\n"
+    "may hold several concatenated frames, including skippable ones,\n"
+    "exactly as the module-level decompress() function would, but using\n"
+    "a libzstd context that is allocated only once.  The arguments have\n"
+    "the same meaning as for decompress().\n"
+    "\n"
+    "A Decompressor may be shared between threads, but only one thread\n"
+    "at a time will be able to use it.");
+
+static int
+ZstdDecompressor_init(ZstdDecompressor *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *dict = NULL;
+    PyObject *params = NULL;
+    PyObject *old_dict;
+    ZstdDict *zd;
+    ZstdDecompressionParameters *dp;
+    Py_ssize_t max_output = 0;
+
+    static char *kwlist[] = {"dict", "params", "max_output_size", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|OOn:Decompressor", kwlist,
+                                     &dict, &params, &max_output))
+        return -1;
+
+    if (max_output < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "max_output_size must not be negative");
+        return -1;
+    }
+    if (check_dparams(params, &dp) || check_dict(dict, &zd))
+        return -1;
+
+    if (self->lock == NULL) {
+        self->lock = PyThread_allocate_lock();
+        if (self->lock == NULL) {
+            PyErr_SetString(PyExc_MemoryError, "unable to allocate lock");
+            goto fail;
+        }
+    }
+    if (self->dctx == NULL) {
+        self->dctx = ZSTD_createDCtx();
+        if (self->dctx == NULL) {
+            PyErr_NoMemory();
+            goto fail;
+        }
+    }
+    if (dctx_set_params(self->dctx, dp))
+        goto fail;
+    self->max_output = max_output;
+    self->window_log_max = dp != NULL ? dp->window_log_max : 0;
+    /* The object keeps its dictionary pinned.  */
+    old_dict = self->dict;
+    self->dict = (PyObject *)zd;
+    if (old_dict != NULL)
+        zstddict_unpin((ZstdDict *)old_dict);
+    return 0;
+
+ fail:
+    if (zd != NULL)
+        zstddict_unpin(zd);
+    return -1;
+}
+
+static void
+ZstdDecompressor_dealloc(ZstdDecompressor *self)
+{
+    if (self->dctx != NULL)
+        ZSTD_freeDCtx(self->dctx);
+    if (self->lock != NULL)
+        PyThread_free_lock(self->lock);
+    if (self->dict != NULL)
+        zstddict_unpin((ZstdDict *)self->dict);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+PyDoc_STRVAR(ZstdDecompressor_decompress_doc,
+    "decompress(data)\n"
+    "--\n\n"
+    "Decompress data and return the uncompressed form.\n"
+    "Raises a zstd.Error exception if any error occurs.");
+
+static PyObject *
+ZstdDecompressor_do_decompress(ZstdDecompressor *self, PyObject *src)
+{
+    Py_buffer srcbuf;
+    PyObject *dst = NULL;
+    ZstdDict *found = NULL;
+    ZSTD_DDict *ddict = NULL;
+
+    if (self->dctx == NULL) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Decompressor is not initialized");
+        return NULL;
+    }
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    if (self->dict != NULL) {
+        ddict = zstddict_ddict((ZstdDict *)self->dict);
+        if (ddict == NULL)
+            goto done;
+    } else {
+        if (find_frame_dict(&srcbuf, &found))
+            goto done;
+        if (found != NULL) {
+            ddict = zstddict_ddict(found);
+            if (ddict == NULL)
+                goto done;
+        }
+    }
+
+    ENTER_ZSTD(self);
+    dst = decompress_with_dctx(self->dctx, &srcbuf, ddict, 0,
+                               (size_t)self->max_output,
+                               self->window_log_max);
+    LEAVE_ZSTD(self);
+
+ done:
+    if (found != NULL)
+        zstddict_unpin(found);
+    PyBuffer_Release(&srcbuf);
+    return dst;
+}
+
+static PyObject *
+ZstdDecompressor_decompress(ZstdDecompressor *self,
+                            PyObject *args, PyObject *kwds)
+{
+    PyObject *src;
+
+    static char *kwlist[] = {"data", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O:decompress", kwlist,
+                                     &src))
+        return NULL;
+    return ZstdDecompressor_do_decompress(self, src);
+}
+
+#ifdef HAVE_FASTCALL
+static PyObject *
+ZstdDecompressor_decompress_fast(ZstdDecompressor *self,
+                                 PyObject *const *args, Py_ssize_t nargs,
+                                 PyObject *kwnames)
+{
+    if (kwnames == NULL && nargs == 1)
+        return ZstdDecompressor_do_decompress(self, args[0]);
+    return fastcall_fallback(
+        (PyCFunctionWithKeywords)ZstdDecompressor_decompress,
+        (PyObject *)self, args, nargs, kwnames);
+}
+#endif
+
+static PyMethodDef ZstdDecompressor_methods[] = {
+#ifdef HAVE_FASTCALL
+    {"decompress",
+     (PyCFunction)(void(*)(void))ZstdDecompressor_decompress_fast,
+     METH_FASTCALL|METH_KEYWORDS, ZstdDecompressor_decompress_doc},
+#else
+    {"decompress", (PyCFunction)ZstdDecompressor_decompress,
+     METH_VARARGS|METH_KEYWORDS, ZstdDecompressor_decompress_doc},
+#endif
+    {NULL, NULL, 0, NULL}
+};
+
+static PyMemberDef ZstdDecompressor_members[] = {
+    {"dict", T_OBJECT, offsetof(ZstdDecompressor, dict), READONLY,
+     "The ZstdDict in use, or None."},
+    {"max_output_size", T_PYSSIZET, offsetof(ZstdDecompressor, max_output),
+     READONLY, "The limit on the size of each output, or 0 for none."},
+    {NULL, 0, 0, 0, NULL}
+};
+
+static PyTypeObject ZstdDecompressorType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.Decompressor",                   /* tp_name */
+    sizeof(ZstdDecompressor),               /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor)ZstdDecompressor_dealloc,   /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    ZstdDecompressor_doc,                   /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    ZstdDecompressor_methods,               /* tp_methods */
+    ZstdDecompressor_members,               /* tp_members */
+    0,                                      /* tp_getset */
+    0,                                      /* tp_base */
+    0,                                      /* tp_dict */
+    0,                                      /* tp_descr_get */
+    0,                                      /* tp_descr_set */
+    0,                                      /* tp_dictoffset */
+    (initproc)ZstdDecompressor_init,        /* tp_init */
+    0,                                      /* tp_alloc */
+    PyType_GenericNew,                      /* tp_new */
+};
+
+/*
+ * Streaming compression objects.
+ */
+
+typedef struct {
+    PyObject_HEAD
+    ZSTD_CCtx *cctx;
+    int level;
+    PyObject *dict;             /* ZstdDict in use, or NULL */
+    PyThread_type_lock lock;
+} ZstdCompressObj;
+
+static PyTypeObject ZstdCompressObjType;
+
+PyDoc_STRVAR(compressobj_doc,
+    "compressobj(level="SZD", threads=0, dict=None, params=None)\n"
+    "--\n\n"
+    "Return a compression object, for compressing data streams that\n"
+    "will not fit into memory at once.  The arguments have the same\n"
+    "meaning as for compress().\n"
+    "\n"
+    "Raises a zstd.Error exception if any error occurs.");
+
+static PyObject *
+compressobj(PyObject *self, PyObject *args, PyObject *kwds)
+{
+    ZstdCompressObj *obj;
+    int level = ZSTD_CLEVEL_DEFAULT;
+    int threads = 0;
+    PyObject *dict = NULL;
+    PyObject *params = NULL;
+    ZstdDict *zd;
+    ZstdCompressionParameters *cp;
+
+    static char *kwlist[] = {"level", "threads", "dict", "params", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|iiOO:compressobj", kwlist,
+                                     &level, &threads, &dict, &params))
+        return NULL;
+
+    if (check_level(&level) || check_cparams(params, &cp)
+        || check_dict(dict, &zd))
+        return NULL;
+
+    obj = PyObject_New(ZstdCompressObj, &ZstdCompressObjType);
+    if (obj == NULL) {
+        if (zd != NULL)
+            zstddict_unpin(zd);
+        return NULL;
+    }
+    obj->level = level;
+    obj->cctx = NULL;
+    /* The object keeps its dictionary pinned.  */
+    obj->dict = (PyObject *)zd;
+    obj->lock = PyThread_allocate_lock();
+    if (obj->lock == NULL) {
+        Py_DECREF(obj);
+        PyErr_SetString(PyExc_MemoryError, "unable to allocate lock");
+        return NULL;
+    }
+    obj->cctx = ZSTD_createCCtx();
+    if (obj->cctx == NULL) {
+        Py_DECREF(obj);
+        return PyErr_NoMemory();
+    }
+
+    if (cctx_set_params(obj->cctx, level, threads, cp)
+        || (zd != NULL && cctx_ref_dict(obj->cctx, zd, level))) {
+        Py_DECREF(obj);
+        return NULL;
+    }
+    return (PyObject *)obj;
+}
+
+static void
+ZstdCompressObj_dealloc(ZstdCompressObj *self)
+{
+    if (self->cctx != NULL)
+        ZSTD_freeCCtx(self->cctx);
+    if (self->lock != NULL)
+        PyThread_free_lock(self->lock);
+    if (self->dict != NULL)
+        zstddict_unpin((ZstdDict *)self->dict);
+    PyObject_Del(self);
+}
+
+/* Run ZSTD_compressStream2 over all of IN, in MODE, appending output
+   to a new bytes object, which is returned.  The caller must hold the
+   object's lock.  With ZSTD_e_continue, stop once all input has been
+   consumed; otherwise, stop once libzstd reports the flush is done.  */
+static PyObject *
+compressobj_run(ZstdCompressObj *self, ZSTD_inBuffer *in,
+                ZSTD_EndDirective mode)
+{
+    PyObject *dst;
+    ZSTD_outBuffer out;
+    size_t initial;
+    size_t in_start = in->pos;
+    size_t rv;
+    unsigned long long t, ns = 0;
+
+    initial = ZSTD_CStreamOutSize();
+    if (mode == ZSTD_e_continue && initial > ZSTD_compressBound(in->size))
+        initial = ZSTD_compressBound(in->size);
+    if (outbuf_init(&dst, &out, initial))
+        return NULL;
+
+    for (;;) {
+        if (out.pos == out.size && outbuf_grow(&dst, &out, (size_t)-1))
+            return NULL;
+
+        t = stats_start();
+        Py_BEGIN_ALLOW_THREADS;
+        rv = ZSTD_compressStream2(self->cctx, &out, in, mode);
+        t = stats_elapsed(t);
+        Py_END_ALLOW_THREADS;
+        ns += t;
+
+        if (ZSTD_isError(rv)) {
+            stats_record(STATS_COMPRESS_STREAM, ns, 0, 0, rv);
+            PyErr_Format(ZstdError, "Compression error: %s",
+                         ZSTD_getErrorName(rv));
+            /* The frame in progress is unusable; start afresh.  */
+            ZSTD_CCtx_reset(self->cctx, ZSTD_reset_session_only);
+            Py_DECREF(dst);
+            return NULL;
+        }
+        if (mode == ZSTD_e_continue ? in->pos == in->size : rv == 0)
+            break;
+    }
+    stats_record(STATS_COMPRESS_STREAM, ns, in->pos - in_start, out.pos, 0);
+
+    if (outbuf_finish(&dst, &out))
+        return NULL;
+    return dst;
+}
+
+PyDoc_STRVAR(ZstdCompressObj_compress_doc,
+    "compress(data)\n"
+    "--\n\n"
+    "Compress data, returning a bytes object containing compressed data\n"
+    "for at least part of it.  This data should be concatenated to the\n"
+    "output produced by any preceding calls to compress().  Some input\n"
+    "may be kept in internal buffers for later processing.");
+
+static PyObject *
+ZstdCompressObj_compress(ZstdCompressObj *self, PyObject *args,
+                         PyObject *kwds)
+{
+    PyObject *src;
+    Py_buffer srcbuf;
+    PyObject *dst;
+    ZSTD_inBuffer in;
+
+    static char *kwlist[] = {"data", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O:compress", kwlist, &src))
+        return NULL;
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    in.src = srcbuf.buf;
+    in.size = srcbuf.len;
+    in.pos = 0;
+
+    ENTER_ZSTD(self);
+    dst = compressobj_run(self, &in, ZSTD_e_continue);
+    LEAVE_ZSTD(self);
+
+    PyBuffer_Release(&srcbuf);
+    return dst;
+}
+
+PyDoc_STRVAR(ZstdCompressObj_flush_doc,
+    "flush(mode=FLUSH_FRAME)\n"
+    "--\n\n"
+    "Return a bytes object containing any remaining compressed data.\n"
+    "With mode=FLUSH_FRAME (the default), the current frame is ended,\n"
+    "and the next call to compress() will begin a new frame.  With\n"
+    "mode=FLUSH_BLOCK, all data provided so far is compressed and\n"
+    "returned, but the frame remains open, so the output can be\n"
+    "decompressed up to this point while compression continues.");
+
+static PyObject *
+ZstdCompressObj_flush(ZstdCompressObj *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *dst;
+    ZSTD_inBuffer in;
+    int mode = ZSTD_e_end;
+
+    static char *kwlist[] = {"mode", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|i:flush", kwlist, &mode))
+        return NULL;
+
+    if (mode != ZSTD_e_end && mode != ZSTD_e_flush) {
+        PyErr_Format(PyExc_ValueError, "invalid flush mode: %d", mode);
+        return NULL;
+    }
+
+    in.src = NULL;
+    in.size = 0;
+    in.pos = 0;
+
+    ENTER_ZSTD(self);
+    dst = compressobj_run(self, &in, (ZSTD_EndDirective)mode);
+    LEAVE_ZSTD(self);
+
+    return dst;
+}
+
+static PyMethodDef ZstdCompressObj_methods[] = {
+    {"compress", (PyCFunction)ZstdCompressObj_compress,
+     METH_VARARGS|METH_KEYWORDS, ZstdCompressObj_compress_doc},
+    {"flush", (PyCFunction)ZstdCompressObj_flush,
+     METH_VARARGS|METH_KEYWORDS, ZstdCompressObj_flush_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static PyMemberDef ZstdCompressObj_members[] = {
+    {"level", T_INT, offsetof(ZstdCompressObj, level), READONLY,
+     "The compression level."},
+    {NULL, 0, 0, 0, NULL}
+};
+
+PyDoc_STRVAR(ZstdCompressObj_doc,
+    "Compression object, as returned by compressobj().\n"
+    "Pass successive pieces of the data to compress(), and concatenate\n"
+    "its results with that of a final call to flush(), which ends the\n"
+    "frame.  A compression object may be used again after flush(), to\n"
+    "compress a new frame with the same settings.\n"
+    "\n"
+    "A compression object may be shared between threads, but only one\n"
+    "thread at a time will be able to use it.");
+
+static PyTypeObject ZstdCompressObjType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.CompressObj",                    /* tp_name */
+    sizeof(ZstdCompressObj),                /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor)ZstdCompressObj_dealloc,    /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    ZstdCompressObj_doc,                    /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    ZstdCompressObj_methods,                /* tp_methods */
+    ZstdCompressObj_members,                /* tp_members */
+};
+
+
+/*
+ * Streaming decompression objects.
+ */
+
+typedef struct {
+    PyObject_HEAD
+    ZSTD_DCtx *dctx;
+    char eof;
+    char needs_input;
+    PyObject *unused_data;
+    PyObject *pending;          /* input not yet consumed, or NULL */
+    PyObject *dict;             /* ZstdDict in use, or NULL */
+    PyThread_type_lock lock;
+} ZstdDecompressObj;
+
+static PyTypeObject ZstdDecompressObjType;
+
+PyDoc_STRVAR(decompressobj_doc,
+    "decompressobj(dict=None, params=None)\n"
+    "--\n\n"
+    "Return a decompression object, for decompressing a single frame\n"
+    "incrementally.  Unlike decompress(), this works whether or not\n"
+    "the frame header records the size of the decompressed data.\n"
+    "The arguments have the same meaning as for decompress().\n"
+    "\n"
+    "Raises a zstd.Error exception if any error occurs.");
+
+static PyObject *
+decompressobj(PyObject *self, PyObject *args, PyObject *kwds)
+{
+    ZstdDecompressObj *obj;
+    PyObject *dict = NULL;
+    PyObject *params = NULL;
+    ZstdDict *zd;
+    ZstdDecompressionParameters *dp;
+    ZSTD_DDict *ddict = NULL;
+    size_t rv;
+
+    static char *kwlist[] = {"dict", "params", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|OO:decompressobj", kwlist,
+                                     &dict, &params))
+        return NULL;
+
+    if (check_dparams(params, &dp) || check_dict(dict, &zd))
+        return NULL;
+    if (zd != NULL) {
+        ddict = zstddict_ddict(zd);
+        if (ddict == NULL) {
+            zstddict_unpin(zd);
+            return NULL;
+        }
+    }
+
+    obj = PyObject_New(ZstdDecompressObj, &ZstdDecompressObjType);
+    if (obj == NULL) {
+        if (zd != NULL)
+            zstddict_unpin(zd);
+        return NULL;
+    }
+    obj->dctx = NULL;
+    obj->eof = 0;
+    obj->needs_input = 1;
+    obj->pending = NULL;
+    /* The object keeps its dictionary pinned.  */
+    obj->dict = (PyObject *)zd;
+    obj->unused_data = PyBytes_FromStringAndSize(NULL, 0);
+    obj->lock = PyThread_allocate_lock();
+    if (obj->unused_data == NULL) {
+        Py_DECREF(obj);
+        return NULL;
+    }
+    if (obj->lock == NULL) {
+        Py_DECREF(obj);
+        PyErr_SetString(PyExc_MemoryError, "unable to allocate lock");
+        return NULL;
+    }
+    obj->dctx = ZSTD_createDCtx();
+    if (obj->dctx == NULL) {
+        Py_DECREF(obj);
+        return PyErr_NoMemory();
+    }
+    if (dp != NULL && dctx_set_params(obj->dctx, dp)) {
+        Py_DECREF(obj);
+        return NULL;
+    }
+    if (ddict != NULL) {
+        rv = ZSTD_DCtx_refDDict(obj->dctx, ddict);
+        if (ZSTD_isError(rv)) {
+            PyErr_Format(ZstdError, "Decompression error: %s",
+                         ZSTD_getErrorName(rv));
+            Py_DECREF(obj);
+            return NULL;
+        }
+    }
+    return (PyObject *)obj;
+}
+
+static void
+ZstdDecompressObj_dealloc(ZstdDecompressObj *self)
+{
+    if (self->dctx != NULL)
+        ZSTD_freeDCtx(self->dctx);
+    if (self->lock != NULL)
+        PyThread_free_lock(self->lock);
+    Py_XDECREF(self->unused_data);
+    Py_XDECREF(self->pending);
+    if (self->dict != NULL)
+        zstddict_unpin((ZstdDict *)self->dict);
+    PyObject_Del(self);
+}
+
+/* Decompress from IN, producing at most MAX_LENGTH bytes of output
+   (any amount if MAX_LENGTH is negative), and return the output as a
+   new bytes object.  The caller must hold the object's lock.  */
+static PyObject *
+decompressobj_run(ZstdDecompressObj *self, ZSTD_inBuffer *in,
+                  Py_ssize_t max_length)
+{
+    PyObject *dst;
+    ZSTD_outBuffer out;
+    size_t initial;
+    size_t limit;
+    size_t in_start = in->pos;
+    size_t rv;
+    unsigned long long t, ns = 0;
+
+    limit = max_length < 0 ? (size_t)-1 : (size_t)max_length;
+    initial = ZSTD_DStreamOutSize();
+    if (initial > limit)
+        initial = limit;
+    if (outbuf_init(&dst, &out, initial))
+        return NULL;
+
+    while (out.size > 0) {
+        t = stats_start();
+        Py_BEGIN_ALLOW_THREADS;
+        rv = ZSTD_decompressStream(self->dctx, &out, in);
+        t = stats_elapsed(t);
+        Py_END_ALLOW_THREADS;
+        ns += t;
+
+        if (ZSTD_isError(rv)) {
+            stats_record(STATS_DECOMPRESS_STREAM, ns, 0, 0, rv);
+            PyErr_Format(ZstdError, "Decompression error: %s",
+                         ZSTD_getErrorName(rv));
+            Py_DECREF(dst);
+            return NULL;
+        }
+        if (rv == 0) {
+            self->eof = 1;
+            break;
+        }
+        if (out.pos == out.size) {
+            /* There may be more output even if all input was used.  */
+            if (out.size == limit)
+                break;
+            if (outbuf_grow(&dst, &out, limit))
+                return NULL;
+        } else if (in->pos == in->size) {
+            break;
+        }
+    }
+
+    stats_record(STATS_DECOMPRESS_STREAM, ns, in->pos - in_start, out.pos,
+                 0);
+
+    /* If the output buffer is full, libzstd may still be holding more
+       output, so don't ask for more input yet.  */
+    if (self->eof)
+        self->needs_input = 0;
+    else if (in->pos == in->size)
+        self->needs_input = (out.pos < out.size);
+    else
+        self->needs_input = 0;
+
+    if (outbuf_finish(&dst, &out))
+        return NULL;
+    return dst;
+}
+
+PyDoc_STRVAR(ZstdDecompressObj_decompress_doc,
+    "decompress(data, max_length=-1)\n"
+    "--\n\n"
+    "Decompress data, returning a bytes object containing the\n"
+    "uncompressed data corresponding to at least part of it.  Some\n"
+    "input may be kept in internal buffers for later processing.\n"
+    "\n"
+    "If max_length is nonnegative, return at most max_length bytes of\n"
+    "decompressed data.  If this limit is reached and further output\n"
+    "can be produced, the needs_input attribute will be False, and the\n"
+    "next call to decompress() may provide data as b'' to obtain more\n"
+    "of the output.\n"
+    "\n"
+    "Once the end of the frame is reached, the eof attribute becomes\n"
+    "True, and any data found after the end of the frame is stored in\n"
+    "the unused_data attribute.  Attempting to decompress more data\n"
+    "after this raises EOFError.");
+
+static PyObject *
+ZstdDecompressObj_decompress(ZstdDecompressObj *self, PyObject *args,
+                             PyObject *kwds)
+{
+    PyObject *src;
+    Py_buffer srcbuf;
+    PyObject *input = NULL;
+    PyObject *dst = NULL;
+    ZSTD_inBuffer in;
+    Py_ssize_t max_length = -1;
+
+    static char *kwlist[] = {"data", "max_length", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|n:decompress", kwlist,
+                                     &src, &max_length))
+        return NULL;
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    ENTER_ZSTD(self);
+
+    if (self->eof) {
+        PyErr_SetString(PyExc_EOFError, "End of stream already reached");
+        goto done;
+    }
+
+    /* If there is input left over from a previous call, it has to be
+       processed first.  */
+    if (self->pending != NULL) {
+        Py_ssize_t plen = PyBytes_GET_SIZE(self->pending);
+        input = PyBytes_FromStringAndSize(NULL, plen + srcbuf.len);
+        if (input == NULL)
+            goto done;
+        memcpy(PyBytes_AS_STRING(input),
+               PyBytes_AS_STRING(self->pending), plen);
+        memcpy(PyBytes_AS_STRING(input) + plen, srcbuf.buf, srcbuf.len);
+        Py_CLEAR(self->pending);
+        in.src = PyBytes_AS_STRING(input);
+        in.size = PyBytes_GET_SIZE(input);
+    } else {
+        in.src = srcbuf.buf;
+        in.size = srcbuf.len;
+    }
+    in.pos = 0;
+
+    dst = decompressobj_run(self, &in, max_length);
+    if (dst == NULL)
+        goto done;
+
+    if (in.pos < in.size) {
+        PyObject *rest = PyBytes_FromStringAndSize(
+            (const char *)in.src + in.pos, in.size - in.pos);
+        if (rest == NULL) {
+            Py_CLEAR(dst);
+            goto done;
+        }
+        if (self->eof) {
+            Py_DECREF(self->unused_data);
+            self->unused_data = rest;
+        } else {
+            self->pending = rest;
+        }
+    }
+
+ done:
+    LEAVE_ZSTD(self);
+    Py_XDECREF(input);
+    PyBuffer_Release(&srcbuf);
+    return dst;
+}
+
+static PyMethodDef ZstdDecompressObj_methods[] = {
+    {"decompress", (PyCFunction)ZstdDecompressObj_decompress,
+     METH_VARARGS|METH_KEYWORDS, ZstdDecompressObj_decompress_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static PyMemberDef ZstdDecompressObj_members[] = {
+    {"eof", T_BOOL, offsetof(ZstdDecompressObj, eof), READONLY,
+     "True if the end of the frame has been reached."},
+    {"needs_input", T_BOOL, offsetof(ZstdDecompressObj, needs_input),
+     READONLY,
+     "False if decompress() can produce more output without more input."},
+    {"unused_data", T_OBJECT_EX, offsetof(ZstdDecompressObj, unused_data),
+     READONLY, "Data found after the end of the frame."},
+    {NULL, 0, 0, 0, NULL}
+};
+
+PyDoc_STRVAR(ZstdDecompressObj_doc,
+    "Decompression object, as returned by decompressobj().\n"
+    "Pass successive pieces of a compressed frame to decompress(), and\n"
+    "concatenate its results.  eof becomes true at the end of the\n"
+    "frame; any data that follows it is kept in unused_data.\n"
+    "\n"
+    "A decompression object may be shared between threads, but only one\n"
+    "thread at a time will be able to use it.");
+
+static PyTypeObject ZstdDecompressObjType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.DecompressObj",                  /* tp_name */
+    sizeof(ZstdDecompressObj),              /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor)ZstdDecompressObj_dealloc,  /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    ZstdDecompressObj_doc,                  /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    ZstdDecompressObj_methods,              /* tp_methods */
+    ZstdDecompressObj_members,              /* tp_members */
+};
+
+
+/*
+ * Compression into caller-supplied buffers.
+ */
+
+PyDoc_STRVAR(compress_into_doc,
+    "compress_into(data, buffer, level="SZD", threads=0)\n"
+    "--\n\n"
+    "Compress data, writing the compressed form into buffer, which\n"
+    "must be a writable bytes-like object, such as a bytearray, a\n"
+    "memoryview or an mmap.  Returns the number of bytes written.\n"
+    "The level and threads arguments have the same meaning as for\n"
+    "compress().  A buffer of compress_bound(len(data)) bytes is always\n"
+    "big enough.\n"
+    "\n"
+    "Raises a zstd.Error exception if any error occurs, including if\n"
+    "the buffer is too small.");
+
+static PyObject *compress_into(PyObject* self, PyObject *args,
+                               PyObject *kwds)
+{
+    PyObject *src, *dst;
+    Py_buffer srcbuf, dstbuf;
+    ZSTD_CCtx *cctx;
+    size_t c_size;
+    unsigned long long t;
+    int level = ZSTD_CLEVEL_DEFAULT;
+    int threads = 0;
+
+    static char *kwlist[] = {"data", "buffer", "level", "threads", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OO|ii:compress_into",
+                                     kwlist, &src, &dst, &level, &threads))
+        return NULL;
+
+    if (check_level(&level))
+        return NULL;
+
+    cctx = get_thread_cctx();
+    if (cctx == NULL)
+        return NULL;
+
+    if (threads != 0 && cctx_set_params(cctx, level, threads, NULL))
+        return NULL;
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+    if (obj_AsWritableByteBuffer(dst, &dstbuf)) {
+        PyBuffer_Release(&srcbuf);
+        return NULL;
+    }
+
+    t = stats_start();
+    Py_BEGIN_ALLOW_THREADS;
+    if (threads == 0)
+        c_size = ZSTD_compressCCtx(cctx, dstbuf.buf, dstbuf.len,
+                                   srcbuf.buf, srcbuf.len, level);
+    else
+        c_size = ZSTD_compress2(cctx, dstbuf.buf, dstbuf.len,
+                                srcbuf.buf, srcbuf.len);
+    t = stats_elapsed(t);
+    Py_END_ALLOW_THREADS;
+    stats_record(STATS_COMPRESS, t, srcbuf.len, c_size, c_size);
+
+    PyBuffer_Release(&dstbuf);
+    PyBuffer_Release(&srcbuf);
+
+    if (ZSTD_isError(c_size)) {
+        PyErr_Format(ZstdError, "Compression error: %s",
+                     ZSTD_getErrorName(c_size));
+        return NULL;
+    }
+    return PyLong_FromSize_t(c_size);
+}
+
+PyDoc_STRVAR(decompress_into_doc,
+    "decompress_into(data, buffer)\n"
+    "--\n\n"
+    "Decompress data, writing the uncompressed form into buffer, which\n"
+    "must be a writable bytes-like object, such as a bytearray, a\n"
+    "memoryview or an mmap.  Returns the number of bytes written.\n"
+    "Unlike decompress(), this works even if the frame header does not\n"
+    "record the size of the decompressed data, as long as the buffer is\n"
+    "big enough.\n"
+    "\n"
+    "Raises a zstd.Error exception if any error occurs, including if\n"
+    "the buffer is too small.");
+
+static PyObject *decompress_into(PyObject* self, PyObject *args,
+                                 PyObject *kwds)
+{
+    PyObject *src, *dst;
+    Py_buffer srcbuf, dstbuf;
+    ZSTD_DCtx *dctx;
+    size_t c_size;
+    unsigned long long raw_frame_size;
+    unsigned long long t;
+
+    static char *kwlist[] = {"data", "buffer", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OO:decompress_into",
+                                     kwlist, &src, &dst))
+        return NULL;
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+    if (obj_AsWritableByteBuffer(dst, &dstbuf)) {
+        PyBuffer_Release(&srcbuf);
+        return NULL;
+    }
+
+    raw_frame_size = ZSTD_getFrameContentSize(srcbuf.buf, srcbuf.len);
+    if (raw_frame_size == ZSTD_CONTENTSIZE_ERROR) {
+        PyErr_SetString(ZstdError, "compressed data is invalid");
+        goto fail;
+    }
+    if (raw_frame_size != ZSTD_CONTENTSIZE_UNKNOWN
+        && raw_frame_size > (unsigned long long)dstbuf.len) {
+        PyErr_Format(ZstdError, "buffer is too small: %zd bytes, "
+                     "decompressed data is %llu bytes",
+                     dstbuf.len, raw_frame_size);
+        goto fail;
+    }
+
+    dctx = dctx_pool_get();
+    if (dctx == NULL)
+        goto fail;
+
+    t = stats_start();
+    Py_BEGIN_ALLOW_THREADS;
+    c_size = ZSTD_decompressDCtx(dctx, dstbuf.buf, dstbuf.len,
+                                 srcbuf.buf, srcbuf.len);
+    t = stats_elapsed(t);
+    Py_END_ALLOW_THREADS;
+    stats_record(STATS_DECOMPRESS, t, srcbuf.len, c_size, c_size);
+
+    dctx_pool_put(dctx);
+    PyBuffer_Release(&dstbuf);
+    PyBuffer_Release(&srcbuf);
+
+    if (ZSTD_isError(c_size)) {
+        PyErr_Format(ZstdError, "Decompression error: %s",
+                     ZSTD_getErrorName(c_size));
+        return NULL;
+    }
+    return PyLong_FromSize_t(c_size);
+
+ fail:
+    PyBuffer_Release(&dstbuf);
+    PyBuffer_Release(&srcbuf);
+    return NULL;
+}
+
+PyDoc_STRVAR(compress_bound_doc,
+    "compress_bound(size)\n"
+    "--\n\n"
+    "Return the largest possible size of the compressed form of\n"
+    "size bytes of data, for sizing buffers passed to compress_into().");
+
+static PyObject *compress_bound(PyObject* self, PyObject *args)
+{
+    Py_ssize_t size;
+    size_t bound;
+
+    if (!PyArg_ParseTuple(args, "n:compress_bound", &size))
+        return NULL;
+    if (size < 0) {
+        PyErr_SetString(PyExc_ValueError, "size must not be negative");
+        return NULL;
+    }
+    bound = ZSTD_compressBound((size_t)size);
+    if (ZSTD_isError(bound)) {
+        PyErr_SetString(PyExc_OverflowError, "size is too large");
+        return NULL;
+    }
+    return PyLong_FromSize_t(bound);
+}
+
+/*
+ * Frame inspection.
+ */
+
+static PyTypeObject FrameInfoType;
+
+static PyStructSequence_Field frame_info_fields[] = {
+    {"content_size", "total size of the decompressed data, "
+                     "or None if any frame does not record it"},
+    {"window_size", "largest window size of any frame: the amount of "
+                    "memory needed to decompress it in a stream"},
+    {"dict_id", "ID of the dictionary needed by the first frame, or 0"},
+    {"has_checksum", "whether the first frame has a content checksum"},
+    {"frame_count", "number of frames, not counting skippable frames"},
+    {NULL, NULL}
+};
+
+static PyStructSequence_Desc frame_info_desc = {
+    "zstd.FrameInfo",
+    "Information about compressed data, as returned by get_frame_info().",
+    frame_info_fields,
+    5
+};
+
+PyDoc_STRVAR(get_frame_info_doc,
+    "get_frame_info(data)\n"
+    "--\n\n"
+    "Return a FrameInfo describing data, which must hold one or more\n"
+    "complete frames, without decompressing it.  This reads only the\n"
+    "frame and block headers, so it is cheap even for large inputs.\n"
+    "\n"
+    "Raises a zstd.Error exception if the data is invalid or\n"
+    "truncated.");
+
+static PyObject *get_frame_info(PyObject* self, PyObject *args)
+{
+    PyObject *src;
+    Py_buffer srcbuf;
+    PyObject *info = NULL;
+    ZSTD_frameHeader zfh;
+    const char *p;
+    size_t pos, size, rv;
+    unsigned long long content_size = 0;
+    unsigned long long window_size = 0;
+    unsigned int dict_id = 0;
+    int has_checksum = 0;
+    Py_ssize_t count = 0;
+
+    if (!PyArg_ParseTuple(args, "O:get_frame_info", &src))
+        return NULL;
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    p = (const char *)srcbuf.buf;
+    for (pos = 0; pos < (size_t)srcbuf.len; pos += size) {
+        size = ZSTD_findFrameCompressedSize(p + pos, srcbuf.len - pos);
+        if (ZSTD_isError(size)) {
+            PyErr_Format(ZstdError, "Invalid frame at offset %zu: %s",
+                         pos, ZSTD_getErrorName(size));
+            goto done;
+        }
+        if (is_skippable_frame(p + pos, size))
+            continue;
+
+        /* Can't fail, since ZSTD_findFrameCompressedSize didn't.  */
+        rv = ZSTD_getFrameHeader(&zfh, p + pos, size);
+        if (rv != 0) {
+            PyErr_Format(ZstdError, "Invalid frame at offset %zu", pos);
+            goto done;
+        }
+        if (count == 0) {
+            dict_id = zfh.dictID;
+            has_checksum = zfh.checksumFlag;
+        }
+        if (zfh.frameContentSize == ZSTD_CONTENTSIZE_UNKNOWN
+            || content_size == ZSTD_CONTENTSIZE_UNKNOWN)
+            content_size = ZSTD_CONTENTSIZE_UNKNOWN;
+        else
+            content_size += zfh.frameContentSize;
+        if (zfh.windowSize > window_size)
+            window_size = zfh.windowSize;
+        count++;
+    }
+    if (count == 0) {
+        PyErr_SetString(ZstdError, "No zstd frame found");
+        goto done;
+    }
+
+    info = PyStructSequence_New(&FrameInfoType);
+    if (info == NULL)
+        goto done;
+    if (content_size == ZSTD_CONTENTSIZE_UNKNOWN) {
+        Py_INCREF(Py_None);
+        PyStructSequence_SET_ITEM(info, 0, Py_None);
+    } else {
+        PyStructSequence_SET_ITEM(info, 0,
+                                  PyLong_FromUnsignedLongLong(content_size));
+    }
+    PyStructSequence_SET_ITEM(info, 1,
+                              PyLong_FromUnsignedLongLong(window_size));
+    PyStructSequence_SET_ITEM(info, 2, PyLong_FromUnsignedLong(dict_id));
+    PyStructSequence_SET_ITEM(info, 3, PyBool_FromLong(has_checksum));
+    PyStructSequence_SET_ITEM(info, 4, PyLong_FromSsize_t(count));
+    if (PyErr_Occurred())
+        Py_CLEAR(info);
+
+ done:
+    PyBuffer_Release(&srcbuf);
+    return info;
+}
+
+PyDoc_STRVAR(find_frame_compressed_size_doc,
+    "find_frame_compressed_size(data)\n"
+    "--\n\n"
+    "Return the size of the compressed frame, or skippable frame, at\n"
+    "the start of data, which may be followed by other data.  The\n"
+    "frame must be complete.\n"
+    "\n"
+    "Raises a zstd.Error exception if the data is invalid or\n"
+    "truncated.");
+
+static PyObject *find_frame_compressed_size(PyObject* self, PyObject *args)
+{
+    PyObject *src;
+    Py_buffer srcbuf;
+    size_t size;
+
+    if (!PyArg_ParseTuple(args, "O:find_frame_compressed_size", &src))
+        return NULL;
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    size = ZSTD_findFrameCompressedSize(srcbuf.buf, srcbuf.len);
+    PyBuffer_Release(&srcbuf);
+
+    if (ZSTD_isError(size)) {
+        PyErr_Format(ZstdError, "Invalid frame: %s", ZSTD_getErrorName(size));
+        return NULL;
+    }
+    return PyLong_FromSize_t(size);
+}
+
+/*
+ * Compression and decompression of whole files, one large output
+ * chunk at a time.
+ */
+
+/* Size of each chunk of output handed to the write callable.  Large,
+   so that the GIL is taken back, and the callable run, rarely.  */
+#define WRITER_CHUNK_SIZE (4 * 1024 * 1024)
+
+/* Pass the first OUT->pos bytes of *CHUNK to WRITE, consuming the
+   reference to *CHUNK.  Returns 0 on success, -1 on failure.  */
+static int
+writer_emit(PyObject *write, PyObject **chunk, ZSTD_outBuffer *out)
+{
+    PyObject *rv;
+
+    if (out->pos == 0 || outbuf_finish(chunk, out)) {
+        Py_CLEAR(*chunk);
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    rv = PyObject_CallFunctionObjArgs(write, *chunk, NULL);
+    Py_CLEAR(*chunk);
+    if (rv == NULL)
+        return -1;
+    Py_DECREF(rv);
+    return 0;
+}
+
+PyDoc_STRVAR(compress_to_writer_doc,
+    "compress_to_writer(data, write, level="SZD", threads=0, params=None)\n"
+    "--\n\n"
+    "Compress data as a single frame, passing the compressed form to\n"
+    "the callable write in chunks of several megabytes.  Returns the\n"
+    "total size of the compressed data.  The other arguments have the\n"
+    "same meaning as for compress().  The GIL is released while\n"
+    "compressing, and only taken back to call write.\n"
+    "\n"
+    "This is the engine of compress_file(), which memory-maps the\n"
+    "input file.");
+
+static PyObject *compress_to_writer(PyObject* self, PyObject *args,
+                                    PyObject *kwds)
+{
+    PyObject *src, *write;
+    PyObject *params = NULL;
+    PyObject *chunk;
+    Py_buffer srcbuf;
+    ZstdCompressionParameters *cp;
+    ZstdCompressor *cached;
+    ZSTD_CCtx *cctx;
+    ZSTD_inBuffer in;
+    ZSTD_outBuffer out;
+    unsigned long long total = 0;
+    unsigned long long t, ns = 0;
+    size_t rv;
+    int level = ZSTD_CLEVEL_DEFAULT;
+    int threads = 0;
+
+    static char *kwlist[] = {"data", "write", "level", "threads", "params",
+                             NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OO|iiO:compress_to_writer",
+                                     kwlist, &src, &write, &level, &threads,
+                                     &params))
+        return NULL;
+
+    if (check_level(&level) || check_cparams(params, &cp))
+        return NULL;
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    cached = thread_cctx_take();
+    if (cached == NULL) {
+        PyBuffer_Release(&srcbuf);
+        return NULL;
+    }
+    cctx = cached->cctx;
+    if (cctx_set_params(cctx, level, threads, cp))
+        goto fail;
+    /* Record the size in the frame header, so that the output can also
+       be decompressed with decompress().  */
+    rv = ZSTD_CCtx_setPledgedSrcSize(cctx, (unsigned long long)srcbuf.len);
+    if (ZSTD_isError(rv)) {
+        PyErr_Format(ZstdError, "Compression error: %s",
+                     ZSTD_getErrorName(rv));
+        goto fail;
+    }
+
+    in.src = srcbuf.buf;
+    in.size = srcbuf.len;
+    in.pos = 0;
+
+    do {
+        if (outbuf_init(&chunk, &out, WRITER_CHUNK_SIZE))
+            goto fail;
+
+        t = stats_start();
+        Py_BEGIN_ALLOW_THREADS;
+        do
+            rv = ZSTD_compressStream2(cctx, &out, &in, ZSTD_e_end);
+        while (!ZSTD_isError(rv) && rv != 0 && out.pos < out.size);
+        t = stats_elapsed(t);
+        Py_END_ALLOW_THREADS;
+        ns += t;
+
+        if (ZSTD_isError(rv)) {
+            stats_record(STATS_COMPRESS, ns, 0, 0, rv);
+            Py_DECREF(chunk);
+            PyErr_Format(ZstdError, "Compression error: %s",
+                         ZSTD_getErrorName(rv));
+            goto fail;
+        }
+        total += out.pos;
+        if (writer_emit(write, &chunk, &out))
+            goto fail;
+    } while (rv != 0);
+    stats_record(STATS_COMPRESS, ns, srcbuf.len, (size_t)total, 0);
+
+    thread_cctx_put_back(cached);
+    PyBuffer_Release(&srcbuf);
+    return PyLong_FromUnsignedLongLong(total);
+
+ fail:
+    thread_cctx_put_back(cached);
+    PyBuffer_Release(&srcbuf);
+    return NULL;
+}
+
+PyDoc_STRVAR(decompress_to_writer_doc,
+    "decompress_to_writer(data, write, params=None)\n"
+    "--\n\n"
+    "Decompress data, which may hold any number of frames, passing the\n"
+    "uncompressed form to the callable write in chunks of several\n"
+    "megabytes.  Returns the total size of the uncompressed data.\n"
+    "Unlike decompress(), this works whether or not the frame headers\n"
+    "record the size of the data.  params may be a\n"
+    "DecompressionParameters object.  The GIL is released while\n"
+    "decompressing, and only taken back to call write.\n"
+    "\n"
+    "This is the engine of decompress_file(), which memory-maps the\n"
+    "input file.");
+
+static PyObject *decompress_to_writer(PyObject* self, PyObject *args,
+                                      PyObject *kwds)
+{
+    PyObject *src, *write;
+    PyObject *params = NULL;
+    PyObject *chunk;
+    PyObject *result = NULL;
+    Py_buffer srcbuf;
+    ZstdDecompressionParameters *dp;
+    ZSTD_DCtx *dctx;
+    ZSTD_inBuffer in;
+    ZSTD_outBuffer out;
+    unsigned long long total = 0;
+    unsigned long long t, ns = 0;
+    size_t rv = 0;
+
+    static char *kwlist[] = {"data", "write", "params", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OO|O:decompress_to_writer",
+                                     kwlist, &src, &write, &params))
+        return NULL;
+
+    if (check_dparams(params, &dp))
+        return NULL;
+
+    if (obj_AsByteBuffer(src, &srcbuf))
+        return NULL;
+
+    dctx = dctx_pool_get();
+    if (dctx == NULL)
+        goto release;
+    if (dp != NULL && dctx_set_params(dctx, dp))
+        goto done;
+
+    in.src = srcbuf.buf;
+    in.size = srcbuf.len;
+    in.pos = 0;
+
+    /* libzstd fills the output buffer whenever it can, so a chunk that
+       is not full means all the input has been used up, and all the
+       output produced.  */
+    if (in.size > 0) {
+        do {
+            if (outbuf_init(&chunk, &out, WRITER_CHUNK_SIZE))
+                goto done;
+
+            t = stats_start();
+            Py_BEGIN_ALLOW_THREADS;
+            do
+                rv = ZSTD_decompressStream(dctx, &out, &in);
+            while (!ZSTD_isError(rv) && out.pos < out.size
+                   && in.pos < in.size);
+            t = stats_elapsed(t);
+            Py_END_ALLOW_THREADS;
+            ns += t;
+
+            if (ZSTD_isError(rv)) {
+                stats_record(STATS_DECOMPRESS, ns, 0, 0, rv);
+                Py_DECREF(chunk);
+                PyErr_Format(ZstdError, "Decompression error: %s",
+                             ZSTD_getErrorName(rv));
+                goto done;
+            }
+            total += out.pos;
+            if (writer_emit(write, &chunk, &out))
+                goto done;
+            /* A full chunk may mean there is more output to come,
+               unless libzstd has just finished the last frame.  */
+        } while (out.pos == out.size && (rv != 0 || in.pos < in.size));
+    }
+    if (rv != 0) {
+        PyErr_SetString(ZstdError, "Compressed data ended before the "
+                        "end of a frame");
+        goto done;
+    }
+    stats_record(STATS_DECOMPRESS, ns, srcbuf.len, (size_t)total, 0);
+    result = PyLong_FromUnsignedLongLong(total);
+
+ done:
+    /* Contexts in the pool are always ready for a new frame, and have
+       the default parameters.  */
+    ZSTD_DCtx_reset(dctx, dp != NULL ? ZSTD_reset_session_and_parameters
+                                     : ZSTD_reset_session_only);
+    dctx_pool_put(dctx);
+ release:
+    PyBuffer_Release(&srcbuf);
+    return result;
+}
+
+/*
+ * Decompression iterators.
+ */
+
+/* Default size of each chunk yielded by decompress_iter().  */
+#define ITER_CHUNK_SIZE (128 * 1024)
+
+typedef struct {
+    PyObject_HEAD
+    ZSTD_DCtx *dctx;            /* NULL once finished */
+    char has_params;            /* whether dctx needs a full reset */
+    char frame_open;            /* in the middle of a frame */
+    char output_pending;        /* libzstd may hold more output */
+    char reuse;                 /* yield views of one buffer */
+    PyObject *source;           /* bytes-like object, if that is the source */
+    PyObject *read;             /* read method of a file, or NULL */
+    PyObject *iter;             /* iterator over chunks, or NULL */
+    PyObject *input;            /* object holding the current input */
+    Py_buffer inbuf;            /* buffer of INPUT, if not NULL */
+    ZSTD_inBuffer in;
+    PyObject *output;           /* bytearray reused for each chunk */
+    Py_ssize_t chunk_size;
+    PyObject *dict;             /* ZstdDict in use, or NULL */
+    PyThread_type_lock lock;
+} ZstdDecompressIter;
+
+static PyTypeObject ZstdDecompressIterType;
+
+/* Drop the current input, if any.  */
+static void
+decompress_iter_drop_input(ZstdDecompressIter *self)
+{
+    if (self->input != NULL) {
+        PyBuffer_Release(&self->inbuf);
+        Py_CLEAR(self->input);
+    }
+    self->in.src = NULL;
+    self->in.size = 0;
+    self->in.pos = 0;
+}
+
+/* Give the context back to the pool and drop everything the iterator
+   no longer needs, once it has finished, successfully or not.  */
+static void
+decompress_iter_finish(ZstdDecompressIter *self)
+{
+    decompress_iter_drop_input(self);
+    if (self->dctx != NULL) {
+        /* Contexts in the pool are always ready for a new frame, and
+           have the default parameters.  */
+        ZSTD_DCtx_reset(self->dctx,
+                        self->has_params || self->dict != NULL
+                        ? ZSTD_reset_session_and_parameters
+                        : ZSTD_reset_session_only);
+        dctx_pool_put(self->dctx);
+        self->dctx = NULL;
+    }
+    Py_CLEAR(self->source);
+    Py_CLEAR(self->read);
+    Py_CLEAR(self->iter);
+    if (self->dict != NULL) {
+        zstddict_unpin((ZstdDict *)self->dict);
+        self->dict = NULL;
+    }
+}
+
+/* Make the next piece of the source the current input.  Returns 1 if
+   there is more input, 0 at the end of the source, -1 on failure
+   (with an exception set).  */
+static int
+decompress_iter_next_input(ZstdDecompressIter *self)
+{
+    PyObject *obj;
+
+    decompress_iter_drop_input(self);
+    for (;;) {
+        if (self->source != NULL) {
+            /* The whole object is the only piece.  */
+            obj = self->source;
+            self->source = NULL;
+        } else if (self->read != NULL) {
+            obj = PyObject_CallFunction(self->read, "n",
+                                        (Py_ssize_t)ZSTD_DStreamInSize());
+        } else if (self->iter != NULL) {
+            obj = PyIter_Next(self->iter);
+            if (obj == NULL && !PyErr_Occurred())
+                return 0;
+        } else {
+            return 0;
+        }
+        if (obj == NULL)
+            return -1;
+        if (obj_AsByteBuffer(obj, &self->inbuf)) {
+            Py_DECREF(obj);
+            return -1;
+        }
+        if (self->inbuf.len > 0)
+            break;
+        PyBuffer_Release(&self->inbuf);
+        Py_DECREF(obj);
+        /* An empty read means the end of a file; an empty chunk from
+           an iterator means nothing.  */
+        if (self->read != NULL)
+            return 0;
+    }
+    self->input = obj;
+    self->in.src = self->inbuf.buf;
+    self->in.size = self->inbuf.len;
+    self->in.pos = 0;
+    return 1;
+}
+
+/* Fill OUT with decompressed data, as far as the source allows.
+   Returns 0 on success, -1 on failure (with an exception set).  */
+static int
+decompress_iter_fill(ZstdDecompressIter *self, ZSTD_outBuffer *out)
+{
+    size_t rv;
+    size_t in_start;
+    size_t out_start;
+    unsigned long long t;
+    int more;
+
+    while (out->pos < out->size) {
+        if (self->in.pos == self->in.size && !self->output_pending) {
+            more = decompress_iter_next_input(self);
+            if (more < 0)
+                return -1;
+            if (more == 0) {
+                if (self->frame_open) {
+                    PyErr_SetString(ZstdError, "Compressed data ended "
+                                    "before the end of a frame");
+                    return -1;
+                }
+                decompress_iter_finish(self);
+                return 0;
+            }
+        }
+
+        in_start = self->in.pos;
+        out_start = out->pos;
+        t = stats_start();
+        BEGIN_ALLOW_THREADS_UNLESS_SMALL(out->size - out->pos);
+        rv = ZSTD_decompressStream(self->dctx, out, &self->in);
+        t = stats_elapsed(t);
+        END_ALLOW_THREADS_UNLESS_SMALL;
+
+        if (ZSTD_isError(rv)) {
+            stats_record(STATS_DECOMPRESS_STREAM, t, 0, 0, rv);
+            PyErr_Format(ZstdError, "Decompression error: %s",
+                         ZSTD_getErrorName(rv));
+            return -1;
+        }
+        stats_record(STATS_DECOMPRESS_STREAM, t, self->in.pos - in_start,
+                     out->pos - out_start, 0);
+        /* A full output buffer means libzstd may be holding more
+           output, unless it has just finished a frame.  */
+        self->frame_open = (rv != 0);
+        self->output_pending = (out->pos == out->size && rv != 0);
+    }
+    return 0;
+}
+
+static PyObject *
+ZstdDecompressIter_next(ZstdDecompressIter *self)
+{
+    PyObject *chunk = NULL;
+    PyObject *view;
+    ZSTD_outBuffer out;
+
+    ENTER_ZSTD(self);
+    if (self->dctx == NULL)
+        goto done;
 
-/* Not all supported compilers understand the C99 'inline' keyword.  */
+    if (self->reuse) {
+        /* The buffer can be reached through the views handed out.  */
+        if (PyByteArray_GET_SIZE(self->output) != self->chunk_size) {
+            PyErr_SetString(PyExc_RuntimeError,
+                            "decompress_iter() buffer was resized");
+            goto fail;
+        }
+        out.dst = PyByteArray_AS_STRING(self->output);
+    } else {
+        chunk = PyBytes_FromStringAndSize(NULL, self->chunk_size);
+        if (chunk == NULL)
+            goto fail;
+        out.dst = PyBytes_AS_STRING(chunk);
+    }
+    out.size = (size_t)self->chunk_size;
+    out.pos = 0;
 
-#if !defined __STDC_VERSION__ || __STDC_VERSION < 199901L
-# if defined __SUNPRO_C || defined __hpux || defined _AIX
-#  define inline
-# elif defined _MSC_VER || defined __GNUC__
-#  define inline __inline
-# endif
-#endif
+    if (decompress_iter_fill(self, &out))
+        goto fail;
 
-#ifndef ZSTD_CLEVEL_MIN
-# define ZSTD_CLEVEL_MIN -5
-#endif
+    if (out.pos == 0) {
+        Py_CLEAR(chunk);
+    } else if (!self->reuse) {
+        if (out.pos < out.size)
+            _PyBytes_Resize(&chunk, out.pos);
+    } else {
+        view = PyMemoryView_FromObject(self->output);
+        if (view != NULL && out.pos < out.size) {
+            PyObject *slice = PySequence_GetSlice(view, 0, out.pos);
+            Py_DECREF(view);
+            view = slice;
+        }
+        chunk = view;
+    }
+    goto done;
 
-#ifndef ZSTD_CLEVEL_MAX
-# define ZSTD_CLEVEL_MAX 22
-#endif
+ fail:
+    Py_CLEAR(chunk);
+    decompress_iter_finish(self);
+ done:
+    LEAVE_ZSTD(self);
+    return chunk;
+}
 
-#ifndef ZSTD_CLEVEL_DEFAULT
-# define ZSTD_CLEVEL_DEFAULT 3
-#endif
+static int
+ZstdDecompressIter_traverse(ZstdDecompressIter *self, visitproc visit,
+                            void *arg)
+{
+    Py_VISIT(self->source);
+    Py_VISIT(self->read);
+    Py_VISIT(self->iter);
+    Py_VISIT(self->input);
+    return 0;
+}
 
-/* Python 2/3 differences.  */
-#if PY_MAJOR_VERSION >= 3
+static int
+ZstdDecompressIter_clear(ZstdDecompressIter *self)
+{
+    decompress_iter_finish(self);
+    return 0;
+}
 
-/* Module data was added in Python 3.  */
-static struct PyModuleDef ZstdModuleDef;
-struct module_state {
-    PyObject *error;
+static void
+ZstdDecompressIter_dealloc(ZstdDecompressIter *self)
+{
+    PyObject_GC_UnTrack(self);
+    decompress_iter_finish(self);
+    Py_XDECREF(self->output);
+    if (self->lock != NULL)
+        PyThread_free_lock(self->lock);
+    PyObject_GC_Del(self);
+}
+
+PyDoc_STRVAR(ZstdDecompressIter_doc,
+    "Iterator over decompressed data, as returned by decompress_iter().\n"
+    "Each item is a chunk of decompressed data; see decompress_iter()\n"
+    "for their size and type.  The iterator may be shared between\n"
+    "threads, but only one thread at a time will be able to advance it.");
+
+static PyTypeObject ZstdDecompressIterType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_zstd.DecompressIterator",             /* tp_name */
+    sizeof(ZstdDecompressIter),             /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor)ZstdDecompressIter_dealloc, /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_GC,  /* tp_flags */
+    ZstdDecompressIter_doc,                 /* tp_doc */
+    (traverseproc)ZstdDecompressIter_traverse, /* tp_traverse */
+    (inquiry)ZstdDecompressIter_clear,      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    PyObject_SelfIter,                      /* tp_iter */
+    (iternextfunc)ZstdDecompressIter_next,  /* tp_iternext */
 };
-#define GETSTATE(m) ((struct module_state*)PyModule_GetState(m))
-#define ZstdError   (GETSTATE(PyState_FindModule(&ZstdModuleDef))->error)
 
-/* This is used in a few places where we specifically want the
-   "normal" string type: bytes for Py2, unicode for Py3.  */
-#define PlainString_FromString(s) PyUnicode_FromString(s)
+PyDoc_STRVAR(decompress_iter_doc,
+    "decompress_iter(source, chunk_size=131072, dict=None, params=None,\n"
+    "                reuse_buffer=False)\n"
+    "--\n\n"
+    "Return an iterator over the decompressed form of source, in chunks\n"
+    "of chunk_size bytes (the last one may be shorter).  source may be\n"
+    "a bytes-like object, a binary file object, which is read from as\n"
+    "needed, or an iterable of bytes-like objects.  It may hold several\n"
+    "concatenated frames.  dict and params have the same meaning as for\n"
+    "decompressobj().\n"
+    "\n"
+    "Only one chunk of output is held at a time, so memory use does not\n"
+    "depend on the size of the data.  If reuse_buffer is true, every\n"
+    "chunk is a memoryview of the same buffer, which is overwritten by\n"
+    "the next chunk; otherwise each chunk is a new bytes object.\n"
+    "\n"
+    "Raises a zstd.Error exception if any error occurs, including if\n"
+    "the source ends in the middle of a frame.");
 
-#else
+static PyObject *decompress_iter(PyObject* self, PyObject *args,
+                                 PyObject *kwds)
+{
+    ZstdDecompressIter *it;
+    PyObject *source;
+    PyObject *dict = NULL;
+    PyObject *params = NULL;
+    Py_ssize_t chunk_size = ITER_CHUNK_SIZE;
+    int reuse = 0;
+    ZstdDict *zd;
+    ZstdDecompressionParameters *dp;
+    ZSTD_DDict *ddict;
+    size_t rv;
 
-static PyObject *ZstdError;
-#define PlainString_FromString(s) PyString_FromString(s)
+    static char *kwlist[] = {"source", "chunk_size", "dict", "params",
+                             "reuse_buffer", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|nOOi:decompress_iter",
+                                     kwlist, &source, &chunk_size, &dict,
+                                     &params, &reuse))
+        return NULL;
 
-#endif
+    if (chunk_size <= 0) {
+        PyErr_SetString(PyExc_ValueError, "chunk_size must be positive");
+        return NULL;
+    }
+    if (check_dparams(params, &dp) || check_dict(dict, &zd))
+        return NULL;
+
+    it = PyObject_GC_New(ZstdDecompressIter, &ZstdDecompressIterType);
+    if (it == NULL) {
+        if (zd != NULL)
+            zstddict_unpin(zd);
+        return NULL;
+    }
+    it->dctx = NULL;
+    it->has_params = (dp != NULL);
+    it->frame_open = 0;
+    it->output_pending = 0;
+    it->reuse = (reuse != 0);
+    it->source = NULL;
+    it->read = NULL;
+    it->iter = NULL;
+    it->input = NULL;
+    it->in.src = NULL;
+    it->in.size = 0;
+    it->in.pos = 0;
+    it->output = NULL;
+    it->chunk_size = chunk_size;
+    /* The iterator keeps its dictionary pinned until it finishes.  */
+    it->dict = (PyObject *)zd;
+    it->lock = NULL;
+    PyObject_GC_Track(it);
 
+    if (PyObject_CheckBuffer(source)) {
+        Py_INCREF(source);
+        it->source = source;
+    } else if (PyObject_HasAttrString(source, "read")) {
+        it->read = PyObject_GetAttrString(source, "read");
+        if (it->read == NULL)
+            goto fail;
+    } else {
+        it->iter = PyObject_GetIter(source);
+        if (it->iter == NULL) {
+            PyErr_Format(PyExc_TypeError, "source must be a bytes-like "
+                         "object, a file object or an iterable, not "
+                         "%.200s", Py_TYPE(source)->tp_name);
+            goto fail;
+        }
+    }
+
+    if (it->reuse) {
+        it->output = PyByteArray_FromStringAndSize(NULL, chunk_size);
+        if (it->output == NULL)
+            goto fail;
+    }
+    it->lock = PyThread_allocate_lock();
+    if (it->lock == NULL) {
+        PyErr_SetString(PyExc_MemoryError, "unable to allocate lock");
+        goto fail;
+    }
+
+    it->dctx = dctx_pool_get();
+    if (it->dctx == NULL)
+        goto fail;
+    if (dp != NULL && dctx_set_params(it->dctx, dp))
+        goto fail;
+    if (zd != NULL) {
+        ddict = zstddict_ddict(zd);
+        if (ddict == NULL)
+            goto fail;
+        rv = ZSTD_DCtx_refDDict(it->dctx, ddict);
+        if (ZSTD_isError(rv)) {
+            PyErr_Format(ZstdError, "Decompression error: %s",
+                         ZSTD_getErrorName(rv));
+            goto fail;
+        }
+    }
+    return (PyObject *)it;
+
+ fail:
+    Py_DECREF(it);
+    return NULL;
+}
+
+
+/*
+ * Batch operations.
+ */
+
+/* Acquire buffers for every element of SEQ (a PySequence_Fast) and
+   create an output bytes object for each, sized by SIZE_OUTPUT.
+   On success, returns a new array of items, and *OUTPUTS is set to a
+   new list of the output objects.  On failure, returns NULL with an
+   exception set.  */
+static batch_item *
+batch_prepare(PyObject *seq, PyObject **outputs,
+              int (*size_output)(Py_buffer *src, Py_ssize_t index,
+                                 size_t *size))
+{
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+    Py_ssize_t i, j;
+    batch_item *items;
+    PyObject *out;
+    size_t size;
+
+    items = PyMem_New(batch_item, n > 0 ? n : 1);
+    if (items == NULL) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    *outputs = PyList_New(n);
+    if (*outputs == NULL) {
+        PyMem_Free(items);
+        return NULL;
+    }
+
+    for (i = 0; i < n; i++) {
+        if (obj_AsByteBuffer(PySequence_Fast_GET_ITEM(seq, i),
+                             &items[i].src))
+            goto fail;
+        if (size_output(&items[i].src, i, &size)) {
+            PyBuffer_Release(&items[i].src);
+            goto fail;
+        }
+        out = PyBytes_FromStringAndSize(NULL, size);
+        if (out == NULL) {
+            PyBuffer_Release(&items[i].src);
+            goto fail;
+        }
+        PyList_SET_ITEM(*outputs, i, out);
+        items[i].dst = PyBytes_AS_STRING(out);
+        items[i].dst_size = size;
+        items[i].result = 0;
+    }
+    return items;
+
+ fail:
+    for (j = 0; j < i; j++)
+        PyBuffer_Release(&items[j].src);
+    PyMem_Free(items);
+    Py_CLEAR(*outputs);
+    return NULL;
+}
+
+/* Release the input buffers of ITEMS, and free the array.  */
+static void
+batch_release(batch_item *items, Py_ssize_t n)
+{
+    Py_ssize_t i;
+    for (i = 0; i < n; i++)
+        PyBuffer_Release(&items[i].src);
+    PyMem_Free(items);
+}
 
-/* This does what 3.x's "y*" argument tuple code would do, in a 2.x/3.x-
-   agnostic way.  Returns 0 on success, -1 on failure (in which case an
-   exception has been set).  As with "y*", caller is responsible for
-   calling PyBuffer_Release.  */
 static int
-obj_AsByteBuffer(PyObject *obj, Py_buffer *view)
+size_compressed(Py_buffer *src, Py_ssize_t index, size_t *size)
 {
-    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) != 0) {
-        PyErr_SetString(PyExc_TypeError, "a bytes-like object is required");
+    *size = ZSTD_compressBound(src->len);
+    return 0;
+}
+
+static int
+size_decompressed(Py_buffer *src, Py_ssize_t index, size_t *size)
+{
+    unsigned long long raw_frame_size;
+
+    raw_frame_size = ZSTD_getFrameContentSize(src->buf, src->len);
+    if (raw_frame_size == ZSTD_CONTENTSIZE_ERROR) {
+        PyErr_Format(ZstdError, "item %zd: compressed data is invalid",
+                     index);
         return -1;
     }
-    if (!PyBuffer_IsContiguous(view, 'C')) {
-        PyBuffer_Release(view);
-        PyErr_SetString(PyExc_TypeError, "a contiguous buffer is required");
+    if (raw_frame_size == ZSTD_CONTENTSIZE_UNKNOWN) {
+        PyErr_Format(ZstdError,
+                     "item %zd: decompress_many() cannot handle "
+                     "compressed data with unknown decompressed size",
+                     index);
+        return -1;
+    }
+    if (raw_frame_size > (unsigned long long)PY_SSIZE_T_MAX) {
+        PyErr_Format(ZstdError, "item %zd: decompressed data is too "
+                     "large for a bytes object", index);
         return -1;
     }
+    if (ZSTD_findFrameCompressedSize(src->buf, src->len) < (size_t)src->len) {
+        PyErr_Format(ZstdError, "item %zd: decompress_many() cannot handle "
+                     "more than one frame per item", index);
+        return -1;
+    }
+    *size = (size_t)raw_frame_size;
     return 0;
 }
 
-
-/* For use in docstrings.  */
-#define S_(x) #x
-#define S(x) S_(x)
-#define SZL S(ZSTD_CLEVEL_MIN)
-#define SZD S(ZSTD_CLEVEL_DEFAULT)
-#define SZH S(ZSTD_CLEVEL_MAX)
-
-
-PyDoc_STRVAR(compress_doc,
-    "compress(data, level="SZD")\n"
+PyDoc_STRVAR(compress_many_doc,
+    "compress_many(buffers, level="SZD", threads=0)\n"
     "--\n\n"
-    "Compress data and return the compressed form.\n"
-    "The compression level may be from "SZL" (fastest) to "SZH" (slowest).\n"
-    "The default is "SZD".  level=0 is the same as level="SZD".\n"
+    "Compress each of a sequence of bytes-like objects, and return a\n"
+    "list of the compressed forms, in the same order.  The result is\n"
+    "the same as [compress(b, level) for b in buffers], but the GIL is\n"
+    "released only once for the whole batch, and a single compression\n"
+    "context is reused for all of it.\n"
+    "\n"
+    "If threads is nonzero, the items are shared out among the calling\n"
+    "thread and up to that many additional threads, at most 32.  Each\n"
+    "item is still compressed by a single thread.  The additional\n"
+    "threads and their compression contexts are kept between calls, so\n"
+    "repeated batches do not pay for starting them again.\n"
     "\n"
     "Raises a zstd.Error exception if any error occurs.");
 
-static PyObject *compress(PyObject* self, PyObject *args, PyObject *kwds)
+static PyObject *compress_many(PyObject* self, PyObject *args, PyObject *kwds)
 {
     PyObject *src;
-    Py_buffer srcbuf;
-    PyObject *dst;
-    char *dst_ptr;
-    size_t dst_size;
-    size_t c_size;
+    PyObject *seq;
+    PyObject *dst = NULL;
+    batch_item *items;
+    batch_t batch;
+    ZSTD_CCtx *cctx;
+    Py_ssize_t i, n;
     int level = ZSTD_CLEVEL_DEFAULT;
+    int threads = 0;
 
-    static char *kwlist[] = {"data", "level", NULL};
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|i:compress", kwlist,
-                                     &src, &level))
+    static char *kwlist[] = {"buffers", "level", "threads", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|ii:compress_many",
+                                     kwlist, &src, &level, &threads))
         return NULL;
 
-    if (0 == level) level=ZSTD_CLEVEL_DEFAULT;
-    /* Fast levels (zstd >= 1.3.4) - [-1..-5] */
-    /* Usual levels                - [ 1..22] */
-    /* If level less than -5 or 1 - raise Error, level 0 handled before. */
-    if (level < ZSTD_CLEVEL_MIN) {
-        PyErr_Format(ZstdError, "Bad compression level - less than %d: %d",
-                     ZSTD_CLEVEL_MIN, level);
+    if (check_level(&level))
         return NULL;
-    }
-    /* If level more than 22 - raise Error. */
-    if (level > ZSTD_CLEVEL_MAX) {
-        PyErr_Format(ZstdError, "Bad compression level - more than %d: %d",
-                     ZSTD_CLEVEL_MAX, level);
+    if (threads < 0) {
+        PyErr_Format(PyExc_ValueError, "invalid number of threads: %d",
+                     threads);
         return NULL;
     }
 
-    if (obj_AsByteBuffer(src, &srcbuf))
+    cctx = get_thread_cctx();
+    if (cctx == NULL)
         return NULL;
 
-    dst_size = ZSTD_compressBound(srcbuf.len);
-    dst = PyBytes_FromStringAndSize(NULL, dst_size);
-    if (dst == NULL) {
-        PyBuffer_Release(&srcbuf);
+    seq = PySequence_Fast(src, "buffers must be a sequence");
+    if (seq == NULL)
         return NULL;
-    }
-
-    dst_ptr = PyBytes_AS_STRING(dst);
+    n = PySequence_Fast_GET_SIZE(seq);
 
-    Py_BEGIN_ALLOW_THREADS;
-    c_size = ZSTD_compress(dst_ptr, dst_size, srcbuf.buf, srcbuf.len,
-                           level);
-    Py_END_ALLOW_THREADS;
+    items = batch_prepare(seq, &dst, size_compressed);
+    if (items == NULL)
+        goto done;
 
-    if (ZSTD_isError(c_size)) {
-        PyErr_Format(ZstdError, "Compression error: %s",
-                     ZSTD_getErrorName(c_size));
+    batch.items = items;
+    batch.nitems = n;
+    batch.level = level;
+    batch.ddict = NULL;
+    batch.worker_ctx = batch_worker_cctx;
+    batch.run = batch_compress_item;
+    if (batch_run(&batch, cctx, threads)) {
         Py_CLEAR(dst);
-    } else {
-        _PyBytes_Resize(&dst, c_size);
+        goto release;
     }
+    batch_record(&batch, STATS_COMPRESS);
 
-    PyBuffer_Release(&srcbuf);
+    for (i = 0; i < n; i++) {
+        PyObject *item = PyList_GET_ITEM(dst, i);
+        if (ZSTD_isError(items[i].result)) {
+            PyErr_Format(ZstdError, "item %zd: Compression error: %s",
+                         i, ZSTD_getErrorName(items[i].result));
+            Py_CLEAR(dst);
+            break;
+        }
+        /* Resizing may move the object.  */
+        if (_PyBytes_Resize(&item, items[i].result)) {
+            PyList_SET_ITEM(dst, i, NULL);
+            Py_CLEAR(dst);
+            break;
+        }
+        PyList_SET_ITEM(dst, i, item);
+    }
+
+ release:
+    batch_release(items, n);
+ done:
+    Py_DECREF(seq);
     return dst;
 }
 
-
-PyDoc_STRVAR(decompress_doc,
-    "decompress(data)\n"
+PyDoc_STRVAR(decompress_many_doc,
+    "decompress_many(buffers, threads=0)\n"
     "--\n\n"
-    "Decompress data and return the uncompressed form.\n"
+    "Decompress each of a sequence of bytes-like objects, and return a\n"
+    "list of the decompressed forms, in the same order.  Each item must\n"
+    "be a single frame that records its decompressed size, compressed\n"
+    "without a dictionary, such as compress() and compress_many()\n"
+    "produce; for such items the result is the same as\n"
+    "[decompress(b) for b in buffers].  Concatenated frames, frames of\n"
+    "unknown size and frames that need a dictionary are rejected, and\n"
+    "there is no max_output_size: use decompress() for those.\n"
+    "\n"
+    "The GIL is released only once for the whole batch, and a single\n"
+    "decompression context is reused for all of it.  The threads\n"
+    "argument has the same meaning as for compress_many().\n"
+    "\n"
     "Raises a zstd.Error exception if any error occurs.");
 
-static PyObject *decompress(PyObject* self, PyObject *args, PyObject *kwds)
+static PyObject *decompress_many(PyObject* self, PyObject *args,
+                                 PyObject *kwds)
 {
     PyObject *src;
-    Py_buffer srcbuf;
-    PyObject *dst;
-    char *dst_ptr;
-    size_t dst_size;
-    size_t c_size;
-    unsigned long long raw_frame_size;
-
-    static char *kwlist[] = {"data", NULL};
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O:decompress", kwlist,
-                                     &src))
-        return NULL;
+    PyObject *seq;
+    PyObject *dst = NULL;
+    batch_item *items;
+    batch_t batch;
+    ZSTD_DCtx *dctx;
+    Py_ssize_t i, n;
+    int threads = 0;
 
-    if (obj_AsByteBuffer(src, &srcbuf))
+    static char *kwlist[] = {"buffers", "threads", NULL};
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|i:decompress_many",
+                                     kwlist, &src, &threads))
         return NULL;
 
-    raw_frame_size = ZSTD_getFrameContentSize(srcbuf.buf, srcbuf.len);
-    if (raw_frame_size == ZSTD_CONTENTSIZE_ERROR) {
-        PyErr_SetString(ZstdError, "compressed data is invalid");
-        PyBuffer_Release(&srcbuf);
-        return NULL;
-    }
-    if (raw_frame_size == ZSTD_CONTENTSIZE_UNKNOWN) {
-        PyErr_SetString(ZstdError,
-                        "decompress() cannot handle compressed data "
-                        "with unknown decompressed size");
-        PyBuffer_Release(&srcbuf);
+    if (threads < 0) {
+        PyErr_Format(PyExc_ValueError, "invalid number of threads: %d",
+                     threads);
         return NULL;
     }
-    if (raw_frame_size > (unsigned long long)PY_SSIZE_T_MAX) {
-        PyErr_SetString(ZstdError,
-                        "decompressed data is too large for a bytes object");
-        PyBuffer_Release(&srcbuf);
+
+    seq = PySequence_Fast(src, "buffers must be a sequence");
+    if (seq == NULL)
         return NULL;
-    }
+    n = PySequence_Fast_GET_SIZE(seq);
 
-    dst_size = (size_t) raw_frame_size;
-    dst = PyBytes_FromStringAndSize(NULL, dst_size);
+    items = batch_prepare(seq, &dst, size_decompressed);
+    if (items == NULL)
+        goto done;
 
-    if (dst != NULL) {
-        dst_ptr = PyBytes_AS_STRING(dst);
+    dctx = dctx_pool_get();
+    if (dctx == NULL) {
+        Py_CLEAR(dst);
+        goto release;
+    }
 
-        Py_BEGIN_ALLOW_THREADS;
-        c_size = ZSTD_decompress(dst_ptr, dst_size, srcbuf.buf, srcbuf.len);
-        Py_END_ALLOW_THREADS;
+    batch.items = items;
+    batch.nitems = n;
+    batch.level = 0;
+    batch.ddict = NULL;
+    batch.worker_ctx = batch_worker_dctx;
+    batch.run = batch_decompress_item;
+    if (batch_run(&batch, dctx, threads))
+        Py_CLEAR(dst);
+    else
+        batch_record(&batch, STATS_DECOMPRESS);
+    dctx_pool_put(dctx);
 
-        if (ZSTD_isError(c_size)) {
-            PyErr_Format(ZstdError, "Decompression error: %s",
-                         ZSTD_getErrorName(c_size));
+    for (i = 0; dst != NULL && i < n; i++) {
+        if (ZSTD_isError(items[i].result)) {
+            PyErr_Format(ZstdError, "item %zd: Decompression error: %s",
+                         i, ZSTD_getErrorName(items[i].result));
             Py_CLEAR(dst);
-
-        } else if (c_size != dst_size) {
-            PyErr_Format(ZstdError, "Decompression error: length mismatch "
-                         "(expected %zu, got %zu bytes)", dst_size, c_size);
+        } else if (items[i].result != items[i].dst_size) {
+            PyErr_Format(ZstdError, "item %zd: Decompression error: "
+                         "length mismatch (expected %zu, got %zu bytes)",
+                         i, items[i].dst_size, items[i].result);
             Py_CLEAR(dst);
         }
     }
 
-    PyBuffer_Release(&srcbuf);
+ release:
+    batch_release(items, n);
+ done:
+    Py_DECREF(seq);
     return dst;
 }
 
@@ -465,13 +5478,136 @@ static void zstd_add_constants(PyObject *module)
     PyModule_AddIntConstant(module, "CLEVEL_MIN", ZSTD_CLEVEL_MIN);
     PyModule_AddIntConstant(module, "CLEVEL_MAX", ZSTD_CLEVEL_MAX);
     PyModule_AddIntConstant(module, "CLEVEL_DEFAULT", ZSTD_CLEVEL_DEFAULT);
+
+    PyModule_AddIntConstant(
+        module, "THREADS_MAX",
+        ZSTD_cParam_getBounds(ZSTD_c_nbWorkers).upperBound);
+
+    PyModule_AddIntConstant(module, "FLUSH_BLOCK", ZSTD_e_flush);
+    PyModule_AddIntConstant(module, "FLUSH_FRAME", ZSTD_e_end);
+
+    PyModule_AddIntConstant(module, "STRATEGY_FAST", ZSTD_fast);
+    PyModule_AddIntConstant(module, "STRATEGY_DFAST", ZSTD_dfast);
+    PyModule_AddIntConstant(module, "STRATEGY_GREEDY", ZSTD_greedy);
+    PyModule_AddIntConstant(module, "STRATEGY_LAZY", ZSTD_lazy);
+    PyModule_AddIntConstant(module, "STRATEGY_LAZY2", ZSTD_lazy2);
+    PyModule_AddIntConstant(module, "STRATEGY_BTLAZY2", ZSTD_btlazy2);
+    PyModule_AddIntConstant(module, "STRATEGY_BTOPT", ZSTD_btopt);
+    PyModule_AddIntConstant(module, "STRATEGY_BTULTRA", ZSTD_btultra);
+    PyModule_AddIntConstant(module, "STRATEGY_BTULTRA2", ZSTD_btultra2);
+}
+
+/* Set up the object types and other non-constant module globals.
+   Returns 0 on success, -1 on failure (with an exception set).  */
+static int zstd_add_types(PyObject *module)
+{
+    if (FrameInfoType.tp_name == NULL) {
+        PyStructSequence_InitType(&FrameInfoType, &frame_info_desc);
+        if (PyErr_Occurred())
+            return -1;
+    }
+    Py_INCREF(&FrameInfoType);
+    PyModule_AddObject(module, "FrameInfo", (PyObject *)&FrameInfoType);
+
+    if (PyType_Ready(&ZstdCompressorType) < 0)
+        return -1;
+    Py_INCREF(&ZstdCompressorType);
+    PyModule_AddObject(module, "Compressor", (PyObject *)&ZstdCompressorType);
+
+    if (PyType_Ready(&ZstdDecompressorType) < 0)
+        return -1;
+    Py_INCREF(&ZstdDecompressorType);
+    PyModule_AddObject(module, "Decompressor",
+                       (PyObject *)&ZstdDecompressorType);
+
+    if (PyType_Ready(&ZstdCompressionParametersType) < 0)
+        return -1;
+    Py_INCREF(&ZstdCompressionParametersType);
+    PyModule_AddObject(module, "CompressionParameters",
+                       (PyObject *)&ZstdCompressionParametersType);
+
+    if (PyType_Ready(&ZstdDecompressionParametersType) < 0)
+        return -1;
+    Py_INCREF(&ZstdDecompressionParametersType);
+    PyModule_AddObject(module, "DecompressionParameters",
+                       (PyObject *)&ZstdDecompressionParametersType);
+
+    if (PyType_Ready(&ZstdDictType) < 0)
+        return -1;
+    Py_INCREF(&ZstdDictType);
+    PyModule_AddObject(module, "ZstdDict", (PyObject *)&ZstdDictType);
+
+    if (PyType_Ready(&ZstdCompressObjType) < 0)
+        return -1;
+    if (PyType_Ready(&ZstdDecompressObjType) < 0)
+        return -1;
+    if (PyType_Ready(&ZstdDecompressIterType) < 0)
+        return -1;
+
+    if (dict_registry == NULL) {
+        dict_registry = PyDict_New();
+        if (dict_registry == NULL)
+            return -1;
+    }
+
+    if (thread_cctx_key == NULL) {
+        thread_cctx_key = PlainString_InternFromString("_zstd.thread_cctx");
+        if (thread_cctx_key == NULL)
+            return -1;
+    }
+    return 0;
 }
 
 static PyMethodDef ZstdMethods[] = {
+#ifdef HAVE_FASTCALL
+    {"compress", (PyCFunction)(void(*)(void))compress_fast,
+     METH_FASTCALL|METH_KEYWORDS, compress_doc},
+    {"decompress", (PyCFunction)(void(*)(void))decompress_fast,
+     METH_FASTCALL|METH_KEYWORDS, decompress_doc},
+#else
     {"compress", (PyCFunction)compress, METH_VARARGS|METH_KEYWORDS,
      compress_doc},
     {"decompress", (PyCFunction)decompress, METH_VARARGS|METH_KEYWORDS,
      decompress_doc},
+#endif
+    {"compressobj", (PyCFunction)compressobj, METH_VARARGS|METH_KEYWORDS,
+     compressobj_doc},
+    {"decompressobj", (PyCFunction)decompressobj, METH_VARARGS|METH_KEYWORDS,
+     decompressobj_doc},
+    {"compress_into", (PyCFunction)compress_into, METH_VARARGS|METH_KEYWORDS,
+     compress_into_doc},
+    {"decompress_into", (PyCFunction)decompress_into,
+     METH_VARARGS|METH_KEYWORDS, decompress_into_doc},
+    {"compress_bound", (PyCFunction)compress_bound, METH_VARARGS,
+     compress_bound_doc},
+    {"get_frame_info", (PyCFunction)get_frame_info, METH_VARARGS,
+     get_frame_info_doc},
+    {"find_frame_compressed_size", (PyCFunction)find_frame_compressed_size,
+     METH_VARARGS, find_frame_compressed_size_doc},
+    {"compress_to_writer", (PyCFunction)compress_to_writer,
+     METH_VARARGS|METH_KEYWORDS, compress_to_writer_doc},
+    {"decompress_to_writer", (PyCFunction)decompress_to_writer,
+     METH_VARARGS|METH_KEYWORDS, decompress_to_writer_doc},
+    {"decompress_iter", (PyCFunction)decompress_iter,
+     METH_VARARGS|METH_KEYWORDS, decompress_iter_doc},
+    {"compress_many", (PyCFunction)compress_many, METH_VARARGS|METH_KEYWORDS,
+     compress_many_doc},
+    {"decompress_many", (PyCFunction)decompress_many,
+     METH_VARARGS|METH_KEYWORDS, decompress_many_doc},
+    {"train_dictionary", (PyCFunction)train_dictionary,
+     METH_VARARGS|METH_KEYWORDS, train_dictionary_doc},
+    {"register_dictionary", (PyCFunction)register_dictionary, METH_O,
+     register_dictionary_doc},
+    {"unregister_dictionary", (PyCFunction)unregister_dictionary,
+     METH_VARARGS, unregister_dictionary_doc},
+    {"set_dictionary_cache_size", (PyCFunction)set_dictionary_cache_size,
+     METH_VARARGS, set_dictionary_cache_size_doc},
+    {"dictionary_cache_usage", (PyCFunction)dictionary_cache_usage,
+     METH_NOARGS, dictionary_cache_usage_doc},
+    {"enable_stats", (PyCFunction)enable_stats,
+     METH_VARARGS|METH_KEYWORDS, enable_stats_doc},
+    {"stats", (PyCFunction)stats, METH_NOARGS, stats_doc},
+    {"reset_stats", (PyCFunction)reset_stats, METH_NOARGS, reset_stats_doc},
     {"library_version", (PyCFunction)library_version, METH_NOARGS,
      library_version_doc},
     {"library_version_number", (PyCFunction)library_version_number,
@@ -535,6 +5671,10 @@ PyMODINIT_FUNC PyInit__zstd(void)
     PyModule_AddObject(module, "Error", zstd_error);
 
     zstd_add_constants(module);
+    if (zstd_add_types(module)) {
+        Py_DECREF(module);
+        return NULL;
+    }
     return module;
 }
 
@@ -556,6 +5696,7 @@ PyMODINIT_FUNC init_zstd(void)
     PyModule_AddObject(module, "Error", ZstdError);
 
     zstd_add_constants(module);
+    zstd_add_types(module);
 }
 
 #endif
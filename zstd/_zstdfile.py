@@ -0,0 +1,605 @@
+# ZSTD Library Python bindings
+# Copyright (c) 2018, Sergey Dryabzhinsky and Zack Weinberg
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+File objects for reading and writing .zst files, modelled on
+gzip.GzipFile and lzma.LZMAFile.
+"""
+
+from __future__ import absolute_import
+
+import io
+import mmap
+import os
+import stat
+
+from . import _zstd
+
+_MODE_CLOSED = 0
+_MODE_READ = 1
+_MODE_WRITE = 2
+
+# Amount of compressed data read from the underlying file at a time,
+# and size of the buffer of decompressed data used for readline() and
+# iteration.  Both are large, since the per-call overhead of reading
+# and decompressing is much larger than the cost of the memory.
+READ_BUFFER_SIZE = 1 << 17
+DECOMPRESSED_BUFFER_SIZE = 1 << 20
+
+_builtin_open = io.open
+
+try:
+    _str_types = (str, bytes, unicode)
+except NameError:
+    _str_types = (str, bytes)
+
+
+class _DecompressReader(io.RawIOBase):
+    """Raw stream of decompressed data, read from a file object
+    containing one or more concatenated zstd frames."""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._eof = False
+        self._pos = 0
+        self._size = -1
+        self._decompressor = _zstd.decompressobj()
+        self._frame_started = False
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self._decompressor = None
+        return io.RawIOBase.close(self)
+
+    def seekable(self):
+        return self._fp.seekable()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def read(self, size=-1):
+        if size < 0:
+            return self.readall()
+        if not size or self._eof:
+            return b""
+
+        data = None
+        while True:
+            d = self._decompressor
+            if d.eof:
+                rawblock = d.unused_data or self._fp.read(READ_BUFFER_SIZE)
+                if not rawblock:
+                    break
+                # Continue with the next frame.
+                d = self._decompressor = _zstd.decompressobj()
+                self._frame_started = True
+                data = d.decompress(rawblock, size)
+            else:
+                if d.needs_input:
+                    rawblock = self._fp.read(READ_BUFFER_SIZE)
+                    if not rawblock:
+                        if not self._frame_started:
+                            # An empty file holds no frames at all.
+                            break
+                        raise EOFError("Compressed file ended before the "
+                                       "end-of-frame marker was reached")
+                    self._frame_started = True
+                else:
+                    rawblock = b""
+                data = d.decompress(rawblock, size)
+            if data:
+                break
+
+        if not data:
+            self._eof = True
+            self._size = self._pos
+            return b""
+        self._pos += len(data)
+        return data
+
+    def readall(self):
+        chunks = []
+        while True:
+            data = self.read(DECOMPRESSED_BUFFER_SIZE)
+            if not data:
+                break
+            chunks.append(data)
+        return b"".join(chunks)
+
+    def _rewind(self):
+        self._fp.seek(0)
+        self._eof = False
+        self._pos = 0
+        self._decompressor = _zstd.decompressobj()
+        self._frame_started = False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pass
+        elif whence == io.SEEK_CUR:
+            offset = self._pos + offset
+        elif whence == io.SEEK_END:
+            if self._size < 0:
+                while self.read(DECOMPRESSED_BUFFER_SIZE):
+                    pass
+            offset = self._size + offset
+        else:
+            raise ValueError("Invalid value for whence: %r" % (whence,))
+
+        # Seeking backward means starting again from the beginning.
+        if offset < self._pos:
+            self._rewind()
+        else:
+            offset -= self._pos
+
+        # Seeking forward means decompressing and discarding data.
+        while offset > 0:
+            data = self.read(min(DECOMPRESSED_BUFFER_SIZE, offset))
+            if not data:
+                break
+            offset -= len(data)
+
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class ZstdFile(io.BufferedIOBase):
+    """A file object providing transparent zstd (de)compression.
+
+    ZstdFile can act as a wrapper for an existing file object, or refer
+    directly to a named file on disk.
+
+    Note that ZstdFile provides a *binary* file interface; data read is
+    returned as bytes, and data to be written must be given as bytes.
+    Use zstd.open() to get a text file interface.
+    """
+
+    def __init__(self, filename, mode="r", level=_zstd.CLEVEL_DEFAULT,
+                 threads=0):
+        """Open a zstd-compressed file in binary mode.
+
+        filename can be either an actual file name (given as a str,
+        bytes, or PathLike object), in which case the named file is
+        opened, or it can be an existing file object to read from or
+        write to.
+
+        mode can be "r" for reading (default), "w" for (over)writing,
+        "x" for creating exclusively, or "a" for appending.  These can
+        equivalently be given as "rb", "wb", "xb" and "ab" respectively.
+        Appending adds a new frame to the end of an existing file;
+        readers decompress all of the frames as one stream.
+
+        level is the compression level to use when writing, and
+        threads is the number of worker threads to compress with, as
+        for zstd.compress().  They must not be given when reading.
+        """
+        self._fp = None
+        self._closefp = False
+        self._mode = _MODE_CLOSED
+
+        if mode in ("r", "rb"):
+            if level != _zstd.CLEVEL_DEFAULT:
+                raise ValueError("Cannot specify a compression level "
+                                 "when opening a file for reading")
+            if threads != 0:
+                raise ValueError("Cannot specify a number of threads "
+                                 "when opening a file for reading")
+            mode_code = _MODE_READ
+        elif mode in ("w", "wb", "a", "ab", "x", "xb"):
+            mode_code = _MODE_WRITE
+            self._compressor = _zstd.compressobj(level, threads)
+            self._pos = 0
+        else:
+            raise ValueError("Invalid mode: %r" % (mode,))
+
+        if hasattr(os, "fspath") and not hasattr(filename, "read") \
+           and not hasattr(filename, "write"):
+            filename = os.fspath(filename)
+
+        if isinstance(filename, _str_types):
+            if "b" not in mode:
+                mode += "b"
+            self._fp = _builtin_open(filename, mode)
+            self._closefp = True
+            self._mode = mode_code
+        elif hasattr(filename, "read") or hasattr(filename, "write"):
+            self._fp = filename
+            self._mode = mode_code
+        else:
+            raise TypeError("filename must be a str, bytes, file "
+                            "or PathLike object")
+
+        if self._mode == _MODE_READ:
+            raw = _DecompressReader(self._fp)
+            self._buffer = io.BufferedReader(
+                raw, buffer_size=DECOMPRESSED_BUFFER_SIZE)
+
+    def close(self):
+        """Flush and close the file.
+
+        May be called more than once without error.  Once the file is
+        closed, any other operation on it will raise a ValueError.
+        """
+        if self._mode == _MODE_CLOSED:
+            return
+        try:
+            if self._mode == _MODE_READ:
+                self._buffer.close()
+                self._buffer = None
+            elif self._mode == _MODE_WRITE:
+                self._fp.write(self._compressor.flush(_zstd.FLUSH_FRAME))
+                self._compressor = None
+        finally:
+            try:
+                if self._closefp:
+                    self._fp.close()
+            finally:
+                self._fp = None
+                self._closefp = False
+                self._mode = _MODE_CLOSED
+
+    @property
+    def closed(self):
+        """True if this file is closed."""
+        return self._mode == _MODE_CLOSED
+
+    def fileno(self):
+        """Return the file descriptor for the underlying file."""
+        self._check_not_closed()
+        return self._fp.fileno()
+
+    def seekable(self):
+        """Return whether the file supports seeking."""
+        return self.readable() and self._buffer.seekable()
+
+    def readable(self):
+        """Return whether the file was opened for reading."""
+        self._check_not_closed()
+        return self._mode == _MODE_READ
+
+    def writable(self):
+        """Return whether the file was opened for writing."""
+        self._check_not_closed()
+        return self._mode == _MODE_WRITE
+
+    def peek(self, size=-1):
+        """Return buffered data without advancing the file position.
+
+        Always returns at least one byte of data, unless at EOF.
+        The exact number of bytes returned is unspecified.
+        """
+        self._check_can_read()
+        return self._buffer.peek(size)
+
+    def read(self, size=-1):
+        """Read up to size uncompressed bytes from the file.
+
+        If size is negative or omitted, read until EOF is reached.
+        Returns b"" if the file is already at EOF.
+        """
+        self._check_can_read()
+        return self._buffer.read(size)
+
+    def read1(self, size=-1):
+        """Read up to size uncompressed bytes, while trying to avoid
+        making multiple reads from the underlying stream.  Reads up to
+        a buffer's worth of data if size is negative.
+
+        Returns b"" if the file is at EOF.
+        """
+        self._check_can_read()
+        if size < 0:
+            size = DECOMPRESSED_BUFFER_SIZE
+        return self._buffer.read1(size)
+
+    def readinto(self, b):
+        """Read bytes into b.
+
+        Returns the number of bytes read (0 for EOF).
+        """
+        self._check_can_read()
+        return self._buffer.readinto(b)
+
+    def readline(self, size=-1):
+        """Read a line of uncompressed bytes from the file.
+
+        The terminating newline (if present) is retained.  If size is
+        non-negative, no more than size bytes will be read (in which
+        case the line may be incomplete).  Returns b'' if already at EOF.
+        """
+        self._check_can_read()
+        return self._buffer.readline(size)
+
+    def write(self, data):
+        """Write a bytes-like object to the file.
+
+        Returns the number of uncompressed bytes written, which is
+        always the length of data in bytes.  Note that due to
+        buffering, the file on disk may not reflect the data written
+        until close() is called.
+        """
+        self._check_can_write()
+        if isinstance(data, (bytes, bytearray)):
+            length = len(data)
+        else:
+            data = memoryview(data)
+            length = data.nbytes
+        self._fp.write(self._compressor.compress(data))
+        self._pos += length
+        return length
+
+    def flush(self):
+        """Write all data compressed so far to the underlying file,
+        without ending the current frame.
+
+        Calling this often reduces the compression ratio.
+        """
+        if self._mode == _MODE_WRITE:
+            self._fp.write(self._compressor.flush(_zstd.FLUSH_BLOCK))
+            self._fp.flush()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Change the file position.
+
+        The new position is specified by offset, relative to the
+        position indicated by whence.  Possible values for whence are:
+
+            0: start of stream (default): offset must not be negative
+            1: current stream position
+            2: end of stream; offset must not be positive
+
+        Returns the new file position.
+
+        Note that seeking is emulated, so depending on the parameters,
+        this operation may be extremely slow.  Seeking forward only
+        decompresses and discards data; seeking backward starts again
+        from the beginning of the file.
+        """
+        self._check_can_seek()
+        return self._buffer.seek(offset, whence)
+
+    def tell(self):
+        """Return the current file position."""
+        self._check_not_closed()
+        if self._mode == _MODE_READ:
+            return self._buffer.tell()
+        return self._pos
+
+    def _check_not_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def _check_can_read(self):
+        if self._mode != _MODE_READ:
+            self._check_not_closed()
+            raise io.UnsupportedOperation("File not open for reading")
+
+    def _check_can_write(self):
+        if self._mode != _MODE_WRITE:
+            self._check_not_closed()
+            raise io.UnsupportedOperation("File not open for writing")
+
+    def _check_can_seek(self):
+        if self._mode != _MODE_READ:
+            self._check_not_closed()
+            raise io.UnsupportedOperation("Seeking is only supported "
+                                          "on files open for reading")
+        if not self._buffer.seekable():
+            raise io.UnsupportedOperation("The underlying file object "
+                                          "does not support seeking")
+
+
+def open(filename, mode="rb", level=_zstd.CLEVEL_DEFAULT, threads=0,
+         encoding=None, errors=None, newline=None):
+    """Open a zstd-compressed file in binary or text mode.
+
+    filename can be either an actual file name (given as a str, bytes,
+    or PathLike object), in which case the named file is opened, or it
+    can be an existing file object to read from or write to.
+
+    The mode argument can be "r", "rb" (default), "w", "wb", "x", "xb",
+    "a", or "ab" for binary mode, or "rt", "wt", "xt", or "at" for text
+    mode.
+
+    The level and threads arguments control compression when writing.
+
+    For binary mode, this function is equivalent to the ZstdFile
+    constructor: ZstdFile(filename, mode, level, threads).  In this case, the
+    encoding, errors and newline arguments must not be provided.
+
+    For text mode, a ZstdFile object is created, and wrapped in an
+    io.TextIOWrapper instance with the specified encoding, error
+    handling behavior, and line ending(s).
+    """
+    if "t" in mode:
+        if "b" in mode:
+            raise ValueError("Invalid mode: %r" % (mode,))
+    else:
+        if encoding is not None:
+            raise ValueError("Argument 'encoding' not supported "
+                             "in binary mode")
+        if errors is not None:
+            raise ValueError("Argument 'errors' not supported "
+                             "in binary mode")
+        if newline is not None:
+            raise ValueError("Argument 'newline' not supported "
+                             "in binary mode")
+
+    zf_mode = mode.replace("t", "")
+    binary_file = ZstdFile(filename, zf_mode, level=level, threads=threads)
+
+    if "t" in mode:
+        return io.TextIOWrapper(binary_file, encoding, errors, newline)
+    return binary_file
+
+
+def _open_file(filename, mode):
+    """Return (file object, whether we opened it) for filename, which
+    may be a name or an existing file object."""
+    if hasattr(os, "fspath") and not hasattr(filename, "read") \
+       and not hasattr(filename, "write"):
+        filename = os.fspath(filename)
+    if isinstance(filename, _str_types):
+        return _builtin_open(filename, mode), True
+    if hasattr(filename, "read") or hasattr(filename, "write"):
+        return filename, False
+    raise TypeError("filename must be a str, bytes, file "
+                    "or PathLike object")
+
+
+def _map_input(filename):
+    """Return (fp, data, closefp): the open file, and its contents from
+    the current position to the end, as a read-only mmap or a view of
+    one, or as bytes if it is not a real file.  data is None for a pipe,
+    socket or other file that is not a regular file, which must be read
+    as a stream instead."""
+    fp, closefp = _open_file(filename, "rb")
+    try:
+        try:
+            fileno = fp.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            # Not a real file; e.g. io.BytesIO.
+            return fp, fp.read(), closefp
+        st = os.fstat(fileno)
+        if not stat.S_ISREG(st.st_mode):
+            return fp, None, closefp
+        pos = fp.tell()
+        # Leave fp at the end, as if it had been read.
+        fp.seek(0, io.SEEK_END)
+        if st.st_size <= pos:
+            # mmap refuses to map empty files.
+            return fp, b"", closefp
+        data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        if pos > 0:
+            data = memoryview(data)[pos:]
+        return fp, data, closefp
+    except:
+        if closefp:
+            fp.close()
+        raise
+
+
+def _unmap_input(data):
+    if isinstance(data, memoryview):
+        m = data.obj
+        data.release()
+        data = m
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+
+def _compress_stream(fp, write, level, threads, params):
+    c = _zstd.compressobj(level, threads, params=params)
+    size = 0
+    while True:
+        data = fp.read(DECOMPRESSED_BUFFER_SIZE)
+        if not data:
+            break
+        out = c.compress(data)
+        if out:
+            write(out)
+            size += len(out)
+    out = c.flush()
+    write(out)
+    return size + len(out)
+
+
+def _decompress_stream(fp, write, params):
+    size = 0
+    for out in _zstd.decompress_iter(fp, DECOMPRESSED_BUFFER_SIZE,
+                                     params=params):
+        write(out)
+        size += len(out)
+    return size
+
+
+def _file_operation(src, dst, func, stream_func, *args):
+    infp, data, close_in = _map_input(src)
+    try:
+        outfp, close_out = _open_file(dst, "wb")
+        try:
+            if data is None:
+                return stream_func(infp, outfp.write, *args)
+            return func(data, outfp.write, *args)
+        finally:
+            if close_out:
+                outfp.close()
+    finally:
+        try:
+            _unmap_input(data)
+        finally:
+            if close_in:
+                infp.close()
+
+
+def compress_file(src, dst, level=_zstd.CLEVEL_DEFAULT, threads=0,
+                  params=None):
+    """Compress the whole of the file src into the file dst.
+
+    src and dst can be either actual file names (given as a str,
+    bytes, or PathLike object), or existing file objects.  dst is
+    created or overwritten if it is a name; if it is a file object,
+    the compressed data is written at its current position.
+
+    If src is a file object, it is read from its current position to
+    the end.  A regular file is memory-mapped, rather than read into
+    memory, and libzstd compresses it in one pass, with the GIL
+    released; the output is written to dst in chunks of several
+    megabytes.  A pipe, socket or other stream is compressed
+    incrementally as it is read.  The other arguments have the same
+    meaning as for zstd.compress(), and the output is a single frame
+    that zstd.decompress() can also read.
+
+    Returns the size of the compressed data.
+    """
+    return _file_operation(src, dst, _zstd.compress_to_writer,
+                           _compress_stream, level, threads, params)
+
+
+def decompress_file(src, dst, params=None):
+    """Decompress the whole of the file src into the file dst.
+
+    src and dst are as for compress_file().  src may hold any number
+    of frames, with or without a recorded uncompressed size, as
+    written by compress_file(), ZstdFile or the zstd command line tool.
+    params may be a zstd.DecompressionParameters object.
+
+    Returns the size of the decompressed data.
+    """
+    return _file_operation(src, dst, _zstd.decompress_to_writer,
+                           _decompress_stream, params)
@@ -0,0 +1,230 @@
+# ZSTD Library Python bindings
+# Copyright (c) 2018, Sergey Dryabzhinsky and Zack Weinberg
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+asyncio stream wrappers, for compressing data written to an
+asyncio.StreamWriter and decompressing data read from an
+asyncio.StreamReader without blocking the event loop.
+
+Small chunks are compressed or decompressed directly in the event
+loop, where handing them to another thread would cost more than the
+work itself.  Chunks larger than the threshold argument are handed to
+an executor (the event loop's default executor, unless another is
+given); libzstd releases the GIL while it works, so the event loop
+keeps running meanwhile.
+
+This module requires Python 3.5 or later.
+"""
+
+import asyncio
+
+from . import _zstd
+
+# Chunks of up to this many bytes are processed in the event loop.
+DEFAULT_THRESHOLD = 1 << 16
+
+# Amount of compressed data read from the underlying stream at a time.
+READ_SIZE = 1 << 17
+
+
+def _get_loop():
+    try:
+        return asyncio.get_running_loop()
+    except AttributeError:
+        return asyncio.get_event_loop()
+
+
+class _Base:
+
+    def __init__(self, executor, threshold):
+        self._executor = executor
+        self._threshold = threshold
+        # Keeps the chunks of concurrent callers in order.
+        self._lock = asyncio.Lock()
+
+    async def _run(self, size, func, *args):
+        if size <= self._threshold:
+            return func(*args)
+        return await _get_loop().run_in_executor(self._executor,
+                                                 func, *args)
+
+
+class ZstdStreamWriter(_Base):
+    """Compressing wrapper for an asyncio.StreamWriter, or any object
+    with write() and drain() methods that behave the same way.
+
+    Data passed to write() is compressed into a single frame, which
+    ends when close() or flush(zstd.FLUSH_FRAME) is called.  The level,
+    threads and params arguments have the same meaning as for
+    zstd.compressobj().
+
+    Every write waits for the underlying writer's drain(), so a slow
+    peer holds back the producer rather than letting compressed data
+    pile up in memory.
+    """
+
+    def __init__(self, writer, level=_zstd.CLEVEL_DEFAULT, threads=0,
+                 params=None, executor=None, threshold=DEFAULT_THRESHOLD):
+        _Base.__init__(self, executor, threshold)
+        self._writer = writer
+        self._compressor = _zstd.compressobj(level, threads, params=params)
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def closed(self):
+        """True if this writer is closed."""
+        return self._closed
+
+    async def write(self, data):
+        """Compress data and write the result to the underlying
+        writer, waiting until it has drained."""
+        if self._closed:
+            raise ValueError("I/O operation on closed stream")
+        size = memoryview(data).nbytes
+        async with self._lock:
+            out = await self._run(size, self._compressor.compress, data)
+            await self._send(out)
+
+    async def flush(self, mode=_zstd.FLUSH_BLOCK):
+        """Write all data compressed so far to the underlying writer.
+
+        With mode=zstd.FLUSH_BLOCK (the default), the frame stays open;
+        with mode=zstd.FLUSH_FRAME, it is ended, and further writes
+        begin a new frame.
+        """
+        if self._closed:
+            raise ValueError("I/O operation on closed stream")
+        async with self._lock:
+            await self._send(self._compressor.flush(mode))
+
+    async def close(self):
+        """End the frame and close the underlying writer.
+
+        May be called more than once without error.
+        """
+        if self._closed:
+            return
+        await self.flush(_zstd.FLUSH_FRAME)
+        self._closed = True
+        self._writer.close()
+        wait_closed = getattr(self._writer, "wait_closed", None)
+        if wait_closed is not None:
+            await wait_closed()
+
+    async def _send(self, out):
+        if out:
+            self._writer.write(out)
+        await self._writer.drain()
+
+
+class ZstdStreamReader(_Base):
+    """Decompressing wrapper for an asyncio.StreamReader, or any object
+    with a coroutine read(n) method that behaves the same way.
+
+    The underlying stream may hold any number of frames, which are
+    read as one stream.  Compressed data is only read from it when the
+    caller asks for more output, so a slow consumer holds back the
+    peer.  params may be a zstd.DecompressionParameters object.
+    """
+
+    def __init__(self, reader, params=None, executor=None,
+                 threshold=DEFAULT_THRESHOLD):
+        _Base.__init__(self, executor, threshold)
+        self._reader = reader
+        self._params = params
+        self._decompressor = _zstd.decompressobj(params=params)
+        self._frame_started = False
+        self._eof = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.read(READ_SIZE)
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+    def at_eof(self):
+        """Return True if all the data has been read."""
+        return self._eof
+
+    async def read(self, n=-1):
+        """Read up to n bytes of decompressed data.
+
+        If n is negative or omitted, read until the end of the stream.
+        Returns b"" at the end of the stream.
+        """
+        if n < 0:
+            chunks = []
+            while True:
+                data = await self.read(READ_SIZE)
+                if not data:
+                    return b"".join(chunks)
+                chunks.append(data)
+        if n == 0:
+            return b""
+        async with self._lock:
+            return await self._read(n)
+
+    async def _read(self, n):
+        while not self._eof:
+            d = self._decompressor
+            if d.eof:
+                raw = d.unused_data or await self._reader.read(READ_SIZE)
+                if not raw:
+                    self._eof = True
+                    break
+                # Continue with the next frame.
+                d = self._decompressor = _zstd.decompressobj(
+                    params=self._params)
+            elif d.needs_input:
+                raw = await self._reader.read(READ_SIZE)
+                if not raw:
+                    if not self._frame_started:
+                        # An empty stream holds no frames at all.
+                        self._eof = True
+                        break
+                    raise EOFError("Compressed stream ended before the "
+                                   "end-of-frame marker was reached")
+            else:
+                raw = b""
+            self._frame_started = True
+            data = await self._run(len(raw) or n, d.decompress, raw, n)
+            if data:
+                return data
+        return b""